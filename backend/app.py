@@ -1,63 +1,189 @@
-from flask import Flask, jsonify
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_cors import CORS
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager
+from collections.abc import Mapping
 from datetime import timedelta
-from flask_migrate import Migrate
 import os
 
-from models import db, User
-from routes.auth import auth_bp
-from routes.books import books_bp
-from routes.admin import admin_bp
-from routes.loans import loans_bp
-from routes.reading_list import reading_list_bp
+import click
+from flask import Flask, current_app, jsonify
 
-app = Flask(__name__)
+from config import database_url, engine_options, get_config, replica_binds, tune_engine
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL or 'sqlite:///booknest.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
-
-
-db.init_app(app)
-migrate = Migrate(app, db)
-bcrypt = Bcrypt(app)
-jwt = JWTManager(app)
-
-CORS(app, resources={r"/*": {"origins": [
+CORS_ORIGINS = [
     "https://book-nest-library.vercel.app",
     "https://book-nest-library-4epynwzuc-jonmacs-projects.vercel.app"
-]}}, supports_credentials=True)
-
-
-
-@jwt.additional_claims_loader
-def add_claims_to_access_token(identity):
-    user = User.query.get(identity)
-    return {
-        "is_admin": user.is_admin if user else False
-    }
-
-
-@app.route('/')
-def home():
-    return jsonify({"message": "Welcome to BookNest API"})
-
-
-app.register_blueprint(auth_bp)
-app.register_blueprint(books_bp)
-app.register_blueprint(admin_bp)
-app.register_blueprint(loans_bp)
-app.register_blueprint(reading_list_bp)
+]
+CORS_EXPOSE_HEADERS = ["X-Next-Cursor", "ETag", "Server-Timing", "Retry-After"]
+
+
+def env_flag(name, default):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+def env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def load_settings(app):
+    DATABASE_URL = database_url(os.getenv("DATABASE_URL"))
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL or 'sqlite:///booknest.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
+    app.config['ADMIN_CACHE_TTL'] = int(os.getenv('ADMIN_CACHE_TTL', 5))
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    # Hashing processes for the whole host, split between the server workers
+    # (WEB_CONCURRENCY, which gunicorn and uvicorn also read). HASH_WORKERS
+    # overrides one worker's share; the queue defaults to 4x that share.
+    app.config['HASH_POOL_SIZE'] = int(os.getenv('HASH_POOL_SIZE', os.cpu_count() or 1))
+    app.config['WEB_CONCURRENCY'] = int(os.getenv('WEB_CONCURRENCY', 1))
+    app.config['HASH_WORKERS'] = env_int('HASH_WORKERS')
+    app.config['HASH_QUEUE_SIZE'] = env_int('HASH_QUEUE_SIZE')
+    # Shared by every worker on the host, so a write in one is seen by all
+    app.config['CACHE_URL'] = os.getenv('CACHE_URL', 'sqlite:///' + os.path.join(app.instance_path, 'cache.db'))
+    app.config['CACHE_MAX_ENTRIES'] = int(os.getenv('CACHE_MAX_ENTRIES', 256))
+    app.config['FINE_PER_DAY_CENTS'] = int(os.getenv('FINE_PER_DAY_CENTS', 25))
+    app.config['FINE_MAX_CENTS'] = int(os.getenv('FINE_MAX_CENTS', 1000))
+    app.config['INSTRUMENTATION'] = env_flag('INSTRUMENTATION', '')
+    app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 100))
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_THRESHOLD_MS'] = float(os.getenv('PROFILE_THRESHOLD_MS', 500))
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR')
+    app.config['RECOMMEND_REFRESH_SECONDS'] = int(os.getenv('RECOMMEND_REFRESH_SECONDS', 300))
+    app.config['RECOMMEND_MAX_BASKET'] = int(os.getenv('RECOMMEND_MAX_BASKET', 100))
+    app.config['RECOMMEND_INDEX_PATH'] = os.getenv('RECOMMEND_INDEX_PATH')
+    app.config['RECOMMEND_BUILD_ON_START'] = env_flag('RECOMMEND_BUILD_ON_START', '1')
+    app.config['SUGGEST_INDEX_PATH'] = os.getenv('SUGGEST_INDEX_PATH')
+    app.config['SUGGEST_BUILD_ON_START'] = env_flag('SUGGEST_BUILD_ON_START', '1')
+    app.config['RATELIMIT_ENABLED'] = env_flag('RATELIMIT_ENABLED', '1')
+    app.config['RATELIMITS'] = os.getenv(
+        'RATELIMITS', 'default=600/minute,auth=30/minute,books=300/minute,loans=120/minute')
+    app.config['RATELIMIT_PRIORITY_BLUEPRINTS'] = os.getenv('RATELIMIT_PRIORITY_BLUEPRINTS', 'loans,auth').split(',')
+    app.config['RATELIMIT_STORAGE_URL'] = os.getenv('RATELIMIT_STORAGE_URL')
+    app.config['RATELIMIT_PROXY_HOPS'] = int(os.getenv('RATELIMIT_PROXY_HOPS', 0))
+    app.config['SHED_MAX_IN_FLIGHT'] = int(os.getenv('SHED_MAX_IN_FLIGHT', 16))
+    app.config['SHED_LATENCY_MS'] = float(os.getenv('SHED_LATENCY_MS', 1000))
+    app.config['COMPRESS_ENCODINGS'] = [name for name in os.getenv('COMPRESS_ENCODINGS', 'zstd,br,gzip').split(',') if name]
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+
+
+class MigrateCommands(click.Group):
+    """`flask db`, importing Flask-Migrate (and alembic, about a fifth of
+    startup) only when a db command actually runs."""
+
+    def _commands(self):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as db_commands
+        from models import db
+
+        app = current_app._get_current_object()
+        if 'migrate' not in app.extensions:
+            Migrate(app, db)
+        return db_commands
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        # Hand parsing, and so the invocation, over to Flask-Migrate's group
+        return self._commands().make_context(info_name, args, parent=parent, **extra)
+
+
+def create_app(config=None):
+    """Build the Flask app.
+
+    Settings come from the environment; `config`, a mapping or config
+    object, overrides them. Extensions and blueprints are imported here
+    rather than at module level, so importing this module is cheap and
+    nothing touches the database until an app is built.
+    """
+    from flask_cors import CORS
+    from flask_jwt_extended import JWTManager
+
+    from models import db
+    from hashing import HashingBusy, hasher
+    from catalog_cache import catalog_cache
+    from recommend import recommender
+    from replicas import replica_router
+    from suggest import suggest_index
+    from instrumentation import instrumentation
+    from ratelimit import limiter
+    from compression import compression
+    from serialization import init_json
+    from catalog_import import catalog_cli
+    from overdue import loans_cli
+    from stats import stats_cli
+    from changes import changes_cli
+    from recommend import recommend_cli
+    from routes.auth import auth_bp
+    from routes.books import books_bp
+    from routes.admin import admin_bp
+    from routes.loans import loans_bp
+    from routes.reading_list import reading_list_bp
+    from routes.changes import changes_bp
+    from routes.users import users_bp
+
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    load_settings(app)
+    if isinstance(config, Mapping):
+        app.config.from_mapping(config)
+    elif config is not None:
+        app.config.from_object(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    app.config.setdefault('SQLALCHEMY_BINDS', replica_binds(app.config))
+    init_json(app)
+
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            tune_engine(engine, app.config)
+    JWTManager(app)
+    hasher.init_app(app)
+    catalog_cache.init_app(app)
+    replica_router.init_app(app)
+    recommender.init_app(app)
+    suggest_index.init_app(app)
+    instrumentation.init_app(app)
+    limiter.init_app(app)
+    compression.init_app(app)
+
+    CORS(app, resources={r"/*": {"origins": CORS_ORIGINS}},
+         supports_credentials=True, expose_headers=CORS_EXPOSE_HEADERS)
+
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(e):
+        response = jsonify({"error": "Server is busy, please retry shortly"})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+
+    @app.route('/')
+    def home():
+        return jsonify({"message": "Welcome to BookNest API"})
+
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(books_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(loans_bp)
+    app.register_blueprint(reading_list_bp)
+    app.register_blueprint(changes_bp)
+    app.register_blueprint(users_bp)
+
+    app.cli.add_command(MigrateCommands('db', help='Perform database migrations.'))
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(loans_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(changes_cli)
+    app.cli.add_command(recommend_cli)
+    return app
+
+
+def __getattr__(name):
+    # `app:app` (gunicorn, flask run, asgi.py) builds the default app on
+    # first use; importing create_app alone builds nothing
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,307 @@
+"""ASGI entry point, alongside the WSGI `app:app`.
+
+    uvicorn asgi:app --workers 4
+
+The read-heavy routes below are served by coroutines on an async SQLAlchemy
+engine (asyncpg or aiosqlite), so a worker keeps accepting requests while
+their queries are in flight. Every other route is handed to the Flask app
+unchanged through asgiref's WsgiToAsgi, which runs it in a thread pool.
+
+The async handlers reuse the Flask views' query builders, serializers and
+the catalog cache, so responses, ETags and errors match the WSGI app.
+Request instrumentation (Server-Timing, /metrics) covers only the routes
+that go through Flask. Per-user reads go to a replica as in replicas.py;
+catalog pages are rendered from the primary, as in @cached_catalog. Rate
+limits and load shedding apply as in ratelimit.py, keyed by the token's
+identity. Catalog pages are sent in the cached compressed variants of
+compression.py; the per-user lists are sent uncompressed.
+
+The cache, rate-limit and sticky-write stores are synchronous clients
+(sqlite3 or redis-py), and compressing a catalog page at level 9+ is
+CPU-bound, so the handlers run those calls in the default thread pool
+with asyncio.to_thread. A contended cache.db lock then holds up one
+request, not every coroutine in the worker.
+"""
+import asyncio
+import os
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+from jwt import ExpiredSignatureError, InvalidTokenError
+from sqlalchemy.exc import OperationalError
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_accept_header, parse_etags
+
+from app import app as flask_app, CORS_ORIGINS, CORS_EXPOSE_HEADERS
+from async_db import create_async_db
+from catalog_cache import CacheEntry, CatalogCache, catalog_cache
+from compression import compression
+from models import db, Book
+from pagination import PaginationError, keyset_items, keyset_select, parse_limit
+from ratelimit import TOO_BUSY, TOO_MANY_REQUESTS, limiter
+from replicas import replica_router
+from routes.books import BOOK_FIELDS
+from routes.loans import my_loan_item, my_loans_select
+from routes.reading_list import reading_list_item, reading_list_select
+from search import SELECTS, fts_table_missing, ilike_select, parse_offset, parse_terms, search_backend, search_items
+from suggest import parse_suggest_limit, suggest_index
+
+wsgi_app = WsgiToAsgi(flask_app)
+_engines = {}
+
+
+def get_engine(key=None):
+    """The async engine for the primary, or for the replica bind `key`."""
+    # Created on first use so each server worker builds its own pools
+    if key not in _engines:
+        with flask_app.app_context():
+            url = db.engines[key].url
+        _engines[key] = create_async_db(url, flask_app.config)
+    return _engines[key]
+
+
+async def read_rows(query, user_id):
+    """Rows for one user's read, from a replica unless they just wrote,
+    falling back to the primary like the WSGI app does."""
+    key = await asyncio.to_thread(replica_router.pick, user_id)
+    if key is not None:
+        try:
+            async with get_engine(key).connect() as conn:
+                return (await conn.execute(query)).all()
+        except OperationalError:
+            replica_router.mark_down(key)
+    async with get_engine().connect() as conn:
+        return (await conn.execute(query)).all()
+
+
+class AsyncRequest:
+    def __init__(self, scope):
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope['headers']}
+
+
+class AuthError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def json_body(payload):
+    # Flask's JSON provider, so output matches jsonify() byte for byte
+    with flask_app.app_context():
+        return flask_app.json.response(payload).get_data()
+
+
+def authenticate(request):
+    """The JWT identity, with the same errors as @jwt_required()."""
+    header = request.headers.get('authorization')
+    if not header:
+        raise AuthError('Missing Authorization Header', 401)
+    scheme, _, token = header.partition(' ')
+    if scheme != 'Bearer' or not token:
+        raise AuthError("Bad Authorization header. Expected 'Authorization: Bearer <JWT>'", 422)
+    with flask_app.app_context():
+        try:
+            claims = decode_token(token)
+        except ExpiredSignatureError:
+            raise AuthError('Token has expired', 401)
+        except InvalidTokenError as e:
+            raise AuthError(str(e), 422)
+    if claims.get('type') != 'access':
+        raise AuthError('Only non-refresh tokens are allowed', 422)
+    return claims['sub']
+
+
+async def books_page(request):
+    try:
+        query, limit = keyset_select(Book, BOOK_FIELDS, args=request.args)
+    except PaginationError as e:
+        return 400, {'error': str(e)}, None
+    async with get_engine().connect() as conn:
+        rows = (await conn.execute(query)).all()
+    items, next_cursor = keyset_items(rows, limit)
+    return 200, items, next_cursor
+
+
+def current_search_backend():
+    # The first call per database probes for the FTS table
+    with flask_app.app_context():
+        return search_backend()
+
+
+async def search_page(request):
+    terms = parse_terms(request.args)
+    if not terms:
+        return await books_page(request)
+    try:
+        limit = parse_limit(request.args)
+        offset = parse_offset(request.args)
+    except PaginationError as e:
+        return 400, {'error': str(e)}, None
+
+    backend = await asyncio.to_thread(current_search_backend)
+    async with get_engine().connect() as conn:
+        try:
+            rows = (await conn.execute(SELECTS[backend](terms).limit(limit + 1).offset(offset))).all()
+        except OperationalError as e:
+            # Only a missing FTS table degrades to a plain scan, as in the WSGI view
+            if not fts_table_missing(e):
+                raise
+            await conn.rollback()
+            rows = (await conn.execute(ilike_select(terms).limit(limit + 1).offset(offset))).all()
+    items, next_cursor = search_items(rows, limit, offset)
+    return 200, items, next_cursor
+
+
+def cache_lookup(path, args):
+    key = catalog_cache.key_for(path, args)
+    return key, catalog_cache.get(key)
+
+
+async def cached_catalog_response(request, render):
+    """The async counterpart of @cached_catalog."""
+    key, entry = await asyncio.to_thread(cache_lookup, request.path, request.args)
+    if entry is None:
+        status, payload, next_cursor = await render(request)
+        if status != 200:
+            return status, json_body(payload), {}
+        headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+        entry = CacheEntry.build(json_body(payload), headers)
+        await asyncio.to_thread(catalog_cache.set, key, entry)
+
+    headers = {name: value for name, value in entry.headers.items() if name in CatalogCache.KEPT_HEADERS}
+    coding = compression.negotiate(len(entry.body), parse_accept_header(request.headers.get('accept-encoding')))
+    headers['ETag'] = f'"{entry.etag}"' if coding is None else f'W/"{entry.etag}"'
+    headers['Cache-Control'] = 'private, no-cache'
+    if compression.codecs:
+        headers['Vary'] = 'Accept-Encoding'
+    if parse_etags(request.headers.get('if-none-match')).contains_weak(entry.etag):
+        return 304, b'', headers
+    if coding is None:
+        return 200, entry.body, headers
+    headers['Content-Encoding'] = coding
+    return 200, await asyncio.to_thread(catalog_cache.encoded, key, entry, coding), headers
+
+
+async def get_books(request, user_id):
+    return await cached_catalog_response(request, books_page)
+
+
+async def search_books(request, user_id):
+    return await cached_catalog_response(request, search_page)
+
+
+def build_suggest_index():
+    with flask_app.app_context():
+        suggest_index.ensure_built()
+
+
+async def suggest_books(request, user_id):
+    # No database round trip once built: the prefix index is a memory-mapped file
+    try:
+        limit = parse_suggest_limit(request.args)
+    except PaginationError as e:
+        return 400, json_body({'error': str(e)}), {}
+    if not os.path.exists(suggest_index.path):
+        # The first build scans the catalog: off the event loop, in an app context
+        await asyncio.to_thread(build_suggest_index)
+    return 200, json_body(suggest_index.suggest(request.args.get('q', ''), limit)), {}
+
+
+async def get_my_loans(request, user_id):
+    rows = await read_rows(my_loans_select(user_id), user_id)
+    return 200, json_body(my_loan_item.many(rows)), {}
+
+
+async def get_reading_list(request, user_id):
+    rows = await read_rows(reading_list_select(user_id), user_id)
+    return 200, json_body(reading_list_item.many(rows)), {}
+
+
+# (method, path) -> (blueprint, handler); the blueprint picks the rate limit
+ASYNC_ROUTES = {
+    ('GET', '/books/'): ('books', get_books),
+    ('GET', '/books/search'): ('books', search_books),
+    ('GET', '/books/suggest'): ('books', suggest_books),
+    ('GET', '/loans/my'): ('loans', get_my_loans),
+    ('GET', '/reading-list/'): ('reading_list', get_reading_list),
+}
+
+
+def cors_headers(request):
+    origin = request.headers.get('origin')
+    if origin not in CORS_ORIGINS:
+        return {}
+    return {
+        'Access-Control-Allow-Origin': origin,
+        'Access-Control-Allow-Credentials': 'true',
+        'Access-Control-Expose-Headers': ', '.join(CORS_EXPOSE_HEADERS),
+        'Vary': 'Origin',
+    }
+
+
+async def limited(blueprint, handler, request, user_id):
+    """Run `handler` under the rate limits and shedding of ratelimit.py."""
+    if not limiter.enabled:
+        return await handler(request, user_id)
+    if limiter.should_shed(blueprint, 'GET'):
+        return 503, json_body({'error': TOO_BUSY}), {'Retry-After': '1'}
+    retry_after = await asyncio.to_thread(limiter.take, blueprint, f'user:{user_id}')
+    if retry_after is not None:
+        return 429, json_body({'error': TOO_MANY_REQUESTS}), {'Retry-After': str(retry_after)}
+    started = limiter.started()
+    try:
+        return await handler(request, user_id)
+    finally:
+        limiter.finished(started)
+
+
+async def handle(blueprint, handler, scope, send):
+    request = AsyncRequest(scope)
+    try:
+        user_id = authenticate(request)
+    except AuthError as e:
+        status, body, headers = e.status, json_body({'msg': e.message}), {}
+    else:
+        status, body, headers = await limited(blueprint, handler, request, user_id)
+
+    cors = cors_headers(request)
+    if 'Vary' in headers and 'Vary' in cors:
+        cors['Vary'] = f"{headers['Vary']}, {cors['Vary']}"
+    headers = {**headers, **cors}
+    if status != 304:
+        headers['Content-Type'] = 'application/json'
+        headers['Content-Length'] = str(len(body))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for engine in _engines.values():
+                await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http':
+        route = ASYNC_ROUTES.get((scope['method'], scope['path']))
+        if route is not None:
+            return await handle(*route, scope, send)
+    return await wsgi_app(scope, receive, send)
@@ -0,0 +1,36 @@
+from sqlalchemy.engine import make_url
+
+from config import engine_options, tune_engine
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(url):
+    """The async-driver twin of a sync database URL."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend}')
+    if backend == 'postgresql' and 'sslmode' in url.query:
+        # asyncpg spells it `ssl`
+        query = dict(url.query)
+        query['ssl'] = query.pop('sslmode')
+        url = url.set(query=query)
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def create_async_db(url, config):
+    """Create an AsyncEngine for the same database as the Flask app, with
+    the same pool options and SQLite pragmas.
+
+    Needs asyncpg (Postgres) or aiosqlite (SQLite) installed.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = async_url(url)
+    engine = create_async_engine(url, **engine_options({**config, 'SQLALCHEMY_DATABASE_URI': url}))
+    tune_engine(engine.sync_engine, config)
+    return engine
@@ -0,0 +1,66 @@
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, jsonify
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from models import db, User
+
+DEFAULT_ADMIN_CACHE_TTL = 5
+
+
+class AdminCache:
+    """Process-local set of current admin ids.
+
+    Tokens carry a signed `is_admin` claim, so admin checks don't need the
+    user row. The claim can outlive a demotion, though, so it is cross-checked
+    against this set, which is reloaded with a single query at most once per
+    TTL. A role change takes effect immediately in the worker that made it
+    and within one TTL everywhere else.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._admin_ids = frozenset()
+        self._expires_at = 0.0
+
+    def admin_ids(self):
+        now = time.monotonic()
+        if now >= self._expires_at:
+            with self._lock:
+                if now >= self._expires_at:
+                    # Own short-lived connection, so a reload never leaves the
+                    # request's session holding a read transaction it may
+                    # later need to upgrade to a write
+                    with db.engine.connect() as conn:
+                        ids = conn.execute(
+                            db.select(User.id).where(User.is_admin.is_(True))
+                        ).scalars()
+                        self._admin_ids = frozenset(ids)
+                    ttl = current_app.config.get('ADMIN_CACHE_TTL', DEFAULT_ADMIN_CACHE_TTL)
+                    self._expires_at = time.monotonic() + ttl
+        return self._admin_ids
+
+    def invalidate(self):
+        with self._lock:
+            self._expires_at = 0.0
+
+
+admin_cache = AdminCache()
+
+
+def has_admin_access():
+    if not get_jwt().get("is_admin"):
+        return False
+    return get_jwt_identity() in admin_cache.admin_ids()
+
+
+# Restrict to admin users only
+def admin_required(fn):
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        if not has_admin_access():
+            return jsonify({"error": "Admin access required"}), 403
+        return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,151 @@
+"""Compare the WSGI and ASGI serving modes under the same concurrency limit.
+
+    cd backend
+    python -m bench.bench_asgi --workers 2 --connections 64 --seconds 10
+
+Seeds a dataset (see bench.suite), then starts each server in turn on a
+local port with the same number of worker processes: gunicorn sync workers
+for app:app and uvicorn for asgi:app. --connections concurrent clients loop
+over the async routes (catalog, search, my loans, reading list) for
+--seconds, and the run reports requests/s and latency percentiles.
+
+Each mode runs once per --stores setting: `memory` keeps the catalog cache
+in process and rate limiting off; `sqlite` puts the cache (the default
+CACHE_URL) and the rate-limit buckets (RATELIMIT_STORAGE_URL) in a shared
+cache.db, with quotas high enough and shedding off, so the run measures
+the stores, not 429s and 503s.
+
+Use DATABASE_URL to point both at Postgres; the async routes pay off most
+when each query waits on the network. Needs gunicorn, uvicorn, httpx and
+aiosqlite/asyncpg installed.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVERS = {
+    'wsgi': lambda port, workers: [sys.executable, '-m', 'gunicorn', '--workers', str(workers),
+                                   '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+    'asgi': lambda port, workers: [sys.executable, '-m', 'uvicorn', '--workers', str(workers),
+                                   '--port', str(port), '--log-level', 'warning', 'asgi:app'],
+}
+
+STORES = {
+    'memory': lambda tmp: {'CACHE_URL': 'memory://', 'RATELIMIT_ENABLED': '0'},
+    'sqlite': lambda tmp: {'CACHE_URL': 'sqlite:///' + os.path.join(tmp, 'cache.db'),
+                           'RATELIMIT_STORAGE_URL': 'sqlite:///' + os.path.join(tmp, 'cache.db'),
+                           'RATELIMIT_ENABLED': '1', 'RATELIMITS': 'default=100000/second',
+                           'SHED_MAX_IN_FLIGHT': '0', 'SHED_LATENCY_MS': '0'},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--modes', nargs='+', choices=SERVERS, default=list(SERVERS))
+    parser.add_argument('--stores', nargs='+', choices=STORES, default=list(STORES))
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+async def drive(port, data, args):
+    import httpx
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + args.seconds
+    limits = httpx.Limits(max_connections=args.connections)
+
+    async def client_loop(seed, client):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            _, headers = data.user(rng)
+            path = rng.choice([
+                '/books/?limit=50',
+                f'/books/search?q={rng.choice(("river", "night", "garden", "stone"))}',
+                '/loans/my',
+                '/reading-list/',
+            ])
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=30) as client:
+        await asyncio.gather(*(client_loop(i, client) for i in range(args.connections)))
+
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / args.seconds,
+        'p50': cuts[49],
+        'p95': cuts[94],
+        'p99': cuts[98],
+        'errors': errors,
+    }
+
+
+def main():
+    args = parse_args()
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+    os.environ.setdefault('HASH_WORKERS', '0')
+    os.environ.setdefault('RATELIMIT_ENABLED', '0')
+    os.environ.setdefault('CACHE_URL', 'memory://')
+
+    from app import app
+    from bench.suite import seed
+
+    data = seed(app, random.Random(1), args.scale)
+
+    results = {}
+    for store in args.stores:
+        for mode in args.modes:
+            env = dict(os.environ, **STORES[store](tempfile.mkdtemp()))
+            port = free_port()
+            server = subprocess.Popen(SERVERS[mode](port, args.workers), env=env)
+            try:
+                wait_for(port)
+                results[mode, store] = asyncio.run(drive(port, data, args))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    print(f'{args.workers} workers, {args.connections} connections, {args.seconds:g}s per mode')
+    print(f'{"mode":<6} {"stores":<7} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for (mode, store), r in results.items():
+        print(f'{mode:<6} {store:<7} {r["rps"]:>8.0f} {r["p50"]:>8.1f} {r["p95"]:>8.1f} '
+              f'{r["p99"]:>8.1f} {r["errors"]:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Fire many parallel borrow requests and check no copy is lent twice.
+
+    cd backend
+    python -m bench.bench_checkout_stress --requests 2000 --threads 32
+
+Exits non-zero if any book ends up with more open loans than copies, or if
+available_copies drifts from copies minus open loans.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--books', type=int, default=20)
+    parser.add_argument('--copies', type=int, default=3)
+    parser.add_argument('--return-ratio', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # One synthetic client would exhaust the rate limits
+    os.environ.setdefault('RATELIMIT_ENABLED', '0')
+
+    from flask_jwt_extended import create_access_token
+    from app import app
+    from models import db, Book, Loan, User
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(db.insert(User), [
+            {'username': f'user{i}', 'email': f'user{i}@bench', 'password_hash': 'x', 'is_admin': False}
+            for i in range(args.users)
+        ])
+        db.session.execute(db.insert(Book), [
+            {'title': f'Book {i}', 'author': 'Bench', 'genre': 'Test',
+             'copies': args.copies, 'available_copies': args.copies}
+            for i in range(args.books)
+        ])
+        db.session.commit()
+        user_ids = db.session.execute(db.select(User.id)).scalars().all()
+        book_ids = db.session.execute(db.select(Book.id)).scalars().all()
+        tokens = {uid: create_access_token(identity=uid) for uid in user_ids}
+
+    statuses = Counter()
+
+    def borrow(_):
+        client = app.test_client()
+        user_id = rng.choice(user_ids)
+        headers = {'Authorization': f'Bearer {tokens[user_id]}'}
+        response = client.post('/loans/', json={'book_id': rng.choice(book_ids)}, headers=headers)
+        statuses[('borrow', response.status_code)] += 1
+        if response.status_code == 201 and rng.random() < args.return_ratio:
+            loans = client.get('/loans/my', headers=headers).get_json()
+            open_loans = [loan for loan in loans if not loan['returned_at']]
+            if open_loans:
+                response = client.patch(f"/loans/{rng.choice(open_loans)['id']}", headers=headers)
+                statuses[('return', response.status_code)] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(borrow, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    failures = [f'{count} {kind} requests returned {status}'
+                for (kind, status), count in statuses.items() if status >= 500]
+    with app.app_context():
+        open_counts = dict(db.session.execute(
+            db.select(Loan.book_id, db.func.count())
+            .where(Loan.returned_at.is_(None))
+            .group_by(Loan.book_id)
+        ).all())
+        for book in Book.query.all():
+            on_loan = open_counts.get(book.id, 0)
+            if on_loan > book.copies:
+                failures.append(f'book {book.id}: {on_loan} open loans for {book.copies} copies')
+            if book.available_copies != book.copies - on_loan:
+                failures.append(f'book {book.id}: available_copies={book.available_copies}, '
+                                f'expected {book.copies - on_loan}')
+
+    print(f'{args.requests} borrow requests on {args.threads} threads in {elapsed:.2f}s '
+          f'({args.requests / elapsed:.0f} req/s)')
+    print('statuses:', dict(sorted(statuses.items())))
+    if failures:
+        print('FAILED')
+        for failure in failures:
+            print('  ' + failure)
+        sys.exit(1)
+    print('OK: no over-allocation')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Time a cold start, from a fresh interpreter to the app's first response.
+
+    cd backend
+    python -m bench.bench_coldstart --runs 5 --budget-ms 1500
+
+Each run starts a new `python -X importtime` process that imports the app
+module, calls create_app() and serves GET / through the test client, the
+path a scale-to-zero instance takes before it can answer its first
+request. Reports the median wall time of each phase and the slowest
+imports by cumulative time, and exits non-zero when the median
+cold-start-to-first-response time is over --budget-ms, so it can gate CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CHILD = '''
+import time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+status = app.test_client().get('/').status_code
+served = time.perf_counter()
+print(status, imported - started, created - imported, served - created)
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1500)
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    return parser.parse_args()
+
+
+def parse_importtime(stderr):
+    """{module: cumulative microseconds} from -X importtime output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = max(times.get(name.strip(), 0), int(cumulative))
+    return times
+
+
+def cold_start(env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD],
+                            capture_output=True, text=True, env=env, check=True)
+    total = time.perf_counter() - start
+    status, *phases = result.stdout.split()
+    if status != '200':
+        raise RuntimeError(f'first response was {status}')
+    return total, [float(phase) for phase in phases], parse_importtime(result.stderr)
+
+
+def main():
+    args = parse_args()
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    env['PYTHONPATH'] = os.getcwd()
+
+    totals, phases, imports = [], [], {}
+    for _ in range(args.runs):
+        total, run_phases, run_imports = cold_start(env)
+        totals.append(total)
+        phases.append(run_phases)
+        for name, us in run_imports.items():
+            imports.setdefault(name, []).append(us)
+
+    median = statistics.median(totals) * 1000
+    print(f'{args.runs} cold starts, medians:')
+    for name, samples in zip(('import app', 'create_app()', 'first response'), zip(*phases)):
+        print(f'  {name:<16} {statistics.median(samples) * 1000:8.1f} ms')
+    print(f'  {"total (process)":<16} {median:8.1f} ms  (budget {args.budget_ms:.0f} ms)')
+
+    print(f'slowest imports, cumulative:')
+    slowest = sorted(imports.items(), key=lambda item: -statistics.median(item[1]))
+    for name, samples in slowest[:args.top]:
+        print(f'  {statistics.median(samples) / 1000:8.1f} ms  {name}')
+
+    if median > args.budget_ms:
+        sys.exit(f'cold start {median:.0f} ms is over the {args.budget_ms:.0f} ms budget')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Measure response compression: sizes, and the cost of cached vs per-request compression.
+
+    cd backend
+    python -m bench.bench_compression --books 20000
+
+Loads --books synthetic books into a throwaway SQLite database, then for
+each coding installed (gzip always; br and zstd with Brotli/zstandard)
+fetches a 1000-book catalog page and the admin NDJSON user export. The
+catalog page is timed on the request that renders and compresses it and
+on later requests, which reuse the variant cached for this catalog
+version; the export is compressed chunk by chunk on every request.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    return parser.parse_args()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ.setdefault('RATELIMIT_ENABLED', '0')
+    os.environ.setdefault('SUGGEST_BUILD_ON_START', '0')
+
+    from flask_jwt_extended import create_access_token
+    from app import app
+    from catalog_cache import catalog_cache
+    from compression import compression
+    from models import db, Book, User
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Book), [
+            {'title': f'The Collected Works, Volume {i}', 'author': f'Author {i % 500}', 'genre': f'Genre {i % 20}'}
+            for i in range(args.books)
+        ])
+        db.session.execute(db.insert(User), [
+            {'username': f'u{i}', 'email': f'u{i}@bench', 'password_hash': 'x', 'is_admin': i == 0}
+            for i in range(args.users)
+        ])
+        db.session.commit()
+        token = create_access_token(identity=1, additional_claims={'is_admin': True})
+
+    client = app.test_client()
+    auth = {'Authorization': f'Bearer {token}'}
+    catalog = '/books/?limit=1000'
+    export = '/admin/users?format=ndjson'
+    catalog_size = len(client.get(catalog, headers=auth).data)
+    export_size = len(client.get(export, headers=auth).data)
+
+    print(f'{"coding":<9} {"catalog":>9} {"first ms":>9} {"cached ms":>10} {"export":>9} {"export ms":>10}')
+    print(f'{"identity":<9} {catalog_size:>9} {"":>9} {"":>10} {export_size:>9}')
+    for coding in compression.codecs:
+        headers = {**auth, 'Accept-Encoding': coding}
+        with app.app_context():
+            catalog_cache.bump_version()
+        first, first_ms = timed(lambda: client.get(catalog, headers=headers))
+        cached_ms = statistics.median(timed(lambda: client.get(catalog, headers=headers))[1]
+                                      for _ in range(args.repeat))
+        streamed, export_ms = timed(lambda: client.get(export, headers=headers))
+        assert first.headers['Content-Encoding'] == streamed.headers['Content-Encoding'] == coding
+        print(f'{coding:<9} {len(first.data):>9} {first_ms:>9.1f} {cached_ms:>10.2f} '
+              f'{len(streamed.data):>9} {export_ms:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Measure bulk catalog import throughput and peak memory.
+
+    cd backend
+    python -m bench.bench_import --records 2000000 --format csv
+
+Writes a synthetic export (with about 5% duplicate rows) to a temp file,
+then runs it through the same pipeline as `flask catalog import`.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def write_export(path, fmt, count, rng):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(['title', 'author', 'genre', 'copies'])
+        for i in range(count):
+            n = rng.randrange(i) if i and rng.random() < 0.05 else i
+            row = [f'Title {n}', f'Author {n % 9973}', f'Genre {n % 40}', 1 + n % 3]
+            if writer:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(dict(zip(('title', 'author', 'genre', 'copies'), row))) + '\n')
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp()
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    from app import app
+    from models import db
+    from catalog_import import import_books, iter_records, text_lines
+
+    export = os.path.join(workdir, f'export.{args.format}')
+    write_export(export, args.format, args.records, random.Random(args.seed))
+    print(f'export: {os.path.getsize(export) / 1e6:.1f} MB, {args.records} records')
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        with open(export, 'rb') as f:
+            for stats in import_books(iter_records(text_lines(f), args.format), args.batch_size):
+                pass
+        elapsed = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f'imported in {elapsed:.1f}s ({stats.read / elapsed:,.0f} records/s): {stats.as_dict()}')
+    print(f'peak RSS {rss_after / 1024:.0f} MB (grew {(rss_after - rss_before) / 1024:.0f} MB during import)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Measure catalog throughput while a login flood is in progress.
+
+    cd backend
+    python -m bench.bench_login_flood --workers 4 --logins 200
+
+A thread pool of --workers threads stands in for gunicorn sync workers. The
+run is repeated with inline hashing (HASH_WORKERS=0) and with the process
+pool, reporting how many GET /books/ requests completed during the flood.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--hash-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--rounds', type=int, default=12)
+    return parser.parse_args()
+
+
+def run(app, hasher, args, hash_workers):
+    from flask_jwt_extended import create_access_token
+    from models import User
+
+    app.config['HASH_WORKERS'] = hash_workers
+    app.config['HASH_QUEUE_SIZE'] = max(hash_workers, 1) * 2
+    hasher.shutdown()
+    hasher.init_app(app)
+
+    with app.app_context():
+        user = User.query.filter_by(email='bench@booknest.com').first()
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity=user.id)}
+
+    client = app.test_client()
+    login = {'email': 'bench@booknest.com', 'password': 'benchpass'}
+    done = threading.Event()
+    latencies = []
+    statuses = {}
+
+    def do_login():
+        status = client.post('/auth/login', json=login).status_code
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def do_catalog():
+        start = time.perf_counter()
+        client.get('/books/?limit=20', headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        start = time.perf_counter()
+        logins = [pool.submit(do_login) for _ in range(args.logins)]
+
+        def catalog_driver():
+            while not done.is_set():
+                pool.submit(do_catalog).result()
+
+        driver = threading.Thread(target=catalog_driver)
+        driver.start()
+        for future in logins:
+            future.result()
+        elapsed = time.perf_counter() - start
+        done.set()
+        driver.join()
+
+    label = 'inline' if not hash_workers else f'pool({hash_workers})'
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else float('nan')
+    print(f'{label:<10} flood {elapsed:6.2f}s  catalog {len(latencies) / elapsed:8.1f} req/s  '
+          f'p95 {p95:8.1f} ms  login statuses {dict(sorted(statuses.items()))}')
+
+
+def main():
+    args = parse_args()
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # One synthetic client would exhaust the rate limits
+    os.environ.setdefault('RATELIMIT_ENABLED', '0')
+
+    from app import app
+    from hashing import hasher
+    from models import db, Book, User
+
+    app.config['BCRYPT_LOG_ROUNDS'] = args.rounds
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        app.config['HASH_WORKERS'] = 0
+        hasher.init_app(app)
+        db.session.add(User(username='bench', email='bench@booknest.com',
+                            password_hash=hasher.hash('benchpass')))
+        db.session.add_all([Book(title=f'Book {i}', author='Bench', genre='Test') for i in range(100)])
+        db.session.commit()
+
+    run(app, hasher, args, 0)
+    run(app, hasher, args, args.hash_workers)
+    hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
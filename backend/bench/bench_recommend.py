@@ -0,0 +1,109 @@
+"""Time recommendation lookups against the equivalent SQL aggregation.
+
+    cd backend
+    python -m bench.bench_recommend --users 5000 --books 5000 --loans 100000
+
+Loads synthetic loans into a throwaway SQLite database (readers favour a
+few genres, so there is structure to find), builds the co-occurrence
+matrix snapshot as `flask recommend build` does, and reports its build
+time, peak memory and file size. Then, for --lookups random
+users, it times recommender.recommend() against a self-join that counts
+co-borrowers per candidate book in SQL, and checks both rank the same
+top book.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--loans', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=10)
+    return parser.parse_args()
+
+
+def percentiles(samples):
+    cuts = statistics.quantiles(samples, n=100)
+    return cuts[49], cuts[94]
+
+
+def main():
+    args = parse_args()
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+    os.environ['RECOMMEND_INDEX_PATH'] = os.path.join(tmp, 'recommend.idx')
+    os.environ['RECOMMEND_BUILD_ON_START'] = '0'
+
+    from app import app
+    from models import db, Book, Loan, User
+    from recommend import recommender
+
+    rng = random.Random(1)
+    genres = 20
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(User), [
+            {'username': f'u{i}', 'email': f'u{i}@bench', 'password_hash': 'x'} for i in range(args.users)
+        ])
+        db.session.execute(db.insert(Book), [
+            {'title': f'b{i}', 'author': 'a', 'genre': f'g{i % genres}'} for i in range(args.books)
+        ])
+        taste = [rng.sample(range(genres), 2) for _ in range(args.users)]
+        per_genre = args.books // genres
+        db.session.execute(db.insert(Loan), [
+            {'user_id': user + 1,
+             'book_id': rng.choice(taste[user]) + genres * int(rng.paretovariate(1.2) % per_genre) + 1}
+            for user in (rng.randrange(args.users) for _ in range(args.loans))
+        ])
+        db.session.commit()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        recommender.rebuild()
+        build_ms = (time.perf_counter() - start) * 1000
+        memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        size = os.path.getsize(recommender.path)
+
+        co_loans = (
+            db.select(Loan.book_id, db.func.count(db.distinct(Loan.user_id)).label('n'))
+            .where(Loan.user_id.in_(
+                db.select(Loan.user_id).where(Loan.book_id.in_(db.bindparam('books', expanding=True)))
+            ))
+            .where(Loan.book_id.notin_(db.bindparam('books', expanding=True)))
+            .group_by(Loan.book_id)
+            .order_by(db.desc('n'))
+            .limit(args.limit)
+        )
+
+        matrix_ms, sql_ms, agree = [], [], 0
+        for user_id in rng.sample(range(1, args.users + 1), args.lookups):
+            start = time.perf_counter()
+            ranked = recommender.recommend(user_id, args.limit)
+            matrix_ms.append((time.perf_counter() - start) * 1000)
+
+            books = recommender.basket(user_id) or [0]
+            start = time.perf_counter()
+            rows = db.session.execute(co_loans, {'books': books}).all()
+            sql_ms.append((time.perf_counter() - start) * 1000)
+            agree += bool(ranked and rows) and ranked[0][0] in {row.book_id for row in rows}
+
+    print(f'{args.users} users, {args.books} books, {args.loans} loans')
+    print(f'matrix build {build_ms:.0f} ms, peak {memory / 2**20:.1f} MiB, file {size / 2**20:.1f} MiB')
+    print(f'{"":<8} {"p50 ms":>8} {"p95 ms":>8}')
+    for name, samples in (('matrix', matrix_ms), ('sql', sql_ms)):
+        p50, p95 = percentiles(samples)
+        print(f'{name:<8} {p50:>8.2f} {p95:>8.2f}')
+    print(f'top matrix pick among sql top {args.limit}: {agree}/{args.lookups}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Compare indexed full-text search with the old ILIKE scan.
+
+    cd backend
+    python -m bench.bench_search --books 500000
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+WORDS = (
+    'shadow river night garden winter empire stone silent glass iron golden '
+    'lost hidden secret last city storm fire ocean crown dream machine house'
+).split()
+NAMES = 'orwell austen tolkien morrison atwood asimov herbert le guin baldwin woolf'.split()
+GENRES = ['Fiction', 'Classic', 'Dystopian', 'Non-Fiction', 'Fantasy', 'Science Fiction']
+
+QUERIES = [
+    {'q': 'shad'},
+    {'title': 'silent garden'},
+    {'author': 'orw'},
+    {'q': 'iron crown', 'genre': 'fant'},
+]
+
+
+def seed_books(db, Book, count, rng):
+    batch = []
+    for _ in range(count):
+        batch.append({
+            'title': ' '.join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 4))),
+            'author': f'{rng.choice(NAMES).title()} {rng.choice(NAMES).title()}',
+            'genre': rng.choice(GENRES),
+        })
+        if len(batch) == 10000:
+            db.session.execute(db.insert(Book), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Book), batch)
+    db.session.commit()
+
+
+def time_query(app, search, terms, backend, repeat):
+    samples = []
+    for _ in range(repeat):
+        with app.test_request_context('/books/search?limit=50'):
+            start = time.perf_counter()
+            search.search_page(terms, backend)
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    args = parse_args()
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    from app import app
+    from models import db, Book
+    import search
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        start = time.perf_counter()
+        seed_books(db, Book, args.books, random.Random(args.seed))
+        print(f'seeded {args.books} books in {time.perf_counter() - start:.1f}s')
+
+        backend = search.search_backend()
+        print(f'{"query":<36} {"ilike ms":>10} {backend + " ms":>14}')
+        for params in QUERIES:
+            terms = [(column if column != 'q' else None, token)
+                     for column, text in params.items() for token in search.tokenize(text)]
+            ilike = time_query(app, search, terms, 'ilike', args.repeat)
+            indexed = time_query(app, search, terms, backend, args.repeat)
+            print(f'{str(params):<36} {ilike:>10.2f} {indexed:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
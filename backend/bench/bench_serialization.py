@@ -0,0 +1,94 @@
+"""Time serializing a large loan listing, old path against new.
+
+    cd backend
+    python -m bench.bench_serialization --loans 100000
+
+Loads --loans rows into a throwaway SQLite database, then builds the
+GET /loans/ response body both ways, timing fetch, dict building and
+encoding separately:
+
+  orm + stdlib    Loan.query.all(), a hand-written dict per loan, and
+                  Flask's default json provider (the previous get_loans)
+  core + orjson   a Core column select, RowSerializer, and OrjsonProvider
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--loans', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    return parser.parse_args()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    from flask.json.provider import DefaultJSONProvider
+    from app import app
+    from models import db, Book, Loan, User
+    from routes.loans import loan_item
+    from serialization import OrjsonProvider
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(User), [{'username': 'u', 'email': 'u@bench', 'password_hash': 'x'}])
+        db.session.execute(db.insert(Book), [{'title': 'b', 'author': 'a', 'copies': 1, 'available_copies': 1}])
+        now = datetime.utcnow()
+        db.session.execute(db.insert(Loan), [
+            {'user_id': 1, 'book_id': 1, 'borrowed_at': now - timedelta(minutes=i),
+             'due_date': now + timedelta(days=14), 'returned_at': now if i % 2 else None}
+            for i in range(args.loans)
+        ])
+        db.session.commit()
+
+    def old_path():
+        app.json = DefaultJSONProvider(app)
+        db.session.expunge_all()
+        loans, fetch = timed(lambda: Loan.query.all())
+        items, build = timed(lambda: [
+            {
+                'id': loan.id,
+                'user_id': loan.user_id,
+                'book_id': loan.book_id,
+                'borrowed_at': loan.borrowed_at,
+                'returned_at': loan.returned_at,
+                'due_date': loan.due_date
+            } for loan in loans
+        ])
+        body, encode = timed(lambda: app.json.response(items).get_data())
+        return fetch, build, encode, body
+
+    def new_path():
+        app.json = OrjsonProvider(app)
+        rows, fetch = timed(lambda: db.session.execute(db.select(
+            Loan.id, Loan.user_id, Loan.book_id, Loan.borrowed_at, Loan.returned_at, Loan.due_date
+        ).order_by(Loan.id)).all())
+        items, build = timed(lambda: loan_item.many(rows))
+        body, encode = timed(lambda: app.json.response(items).get_data())
+        return fetch, build, encode, body
+
+    print(f'{args.loans} loans, best of {args.repeat}')
+    print(f'{"":<16} {"fetch ms":>9} {"build ms":>9} {"encode ms":>10} {"total ms":>9}')
+    bodies = {}
+    with app.app_context():
+        for name, run in (('orm + stdlib', old_path), ('core + orjson', new_path)):
+            best = min((run() for _ in range(args.repeat)), key=lambda r: sum(r[:3]))
+            fetch, build, encode, bodies[name] = best
+            print(f'{name:<16} {fetch:>9.1f} {build:>9.1f} {encode:>10.1f} {fetch + build + encode:>9.1f}')
+    print('identical output:', len(set(bodies.values())) == 1)
+
+
+if __name__ == '__main__':
+    main()
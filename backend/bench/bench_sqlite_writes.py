@@ -0,0 +1,140 @@
+"""Compare SQLite write throughput before and after the engine tuning.
+
+    cd backend
+    python -m bench.bench_sqlite_writes --threads 16 --seconds 10
+
+Runs the same mixed workload twice, each in a fresh process and database:
+once with the old behaviour (rollback journal, synchronous=FULL, no mmap)
+and once with the defaults from config.py (WAL, synchronous=NORMAL, mmap).
+Each thread loops over borrow, return, reading-list add and GET /loans/my
+for --seconds, and the run reports writes/s, reads/s, p95 latency and how
+many requests failed.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODES = {
+    'before': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_MMAP_SIZE': '0'},
+    'after': {},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--books', type=int, default=500)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_mode(args):
+    from flask_jwt_extended import create_access_token
+    from app import app
+    from models import db, Book, User
+
+    with app.app_context():
+        db.create_all()
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+        db.session.execute(db.insert(User), [
+            {'username': f'user{i}', 'email': f'user{i}@bench', 'password_hash': 'x', 'is_admin': False}
+            for i in range(args.users)
+        ])
+        db.session.execute(db.insert(Book), [
+            {'title': f'Book {i}', 'author': 'Bench', 'genre': 'Test', 'copies': 3, 'available_copies': 3}
+            for i in range(args.books)
+        ])
+        db.session.commit()
+        user_ids = db.session.execute(db.select(User.id)).scalars().all()
+        book_ids = db.session.execute(db.select(Book.id)).scalars().all()
+        tokens = {uid: create_access_token(identity=uid) for uid in user_ids}
+
+    lock = threading.Lock()
+    counts = {'writes': 0, 'reads': 0, 'errors': 0}
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            user_id = rng.choice(user_ids)
+            headers = {'Authorization': f'Bearer {tokens[user_id]}'}
+            roll = rng.random()
+            start = time.perf_counter()
+            if roll < 0.4:
+                kind = 'writes'
+                response = client.post('/loans/', json={'book_id': rng.choice(book_ids)}, headers=headers)
+            elif roll < 0.6:
+                kind = 'writes'
+                loans = client.get('/loans/my', headers=headers).get_json() or []
+                open_loans = [loan['id'] for loan in loans if not loan['returned_at']]
+                if not open_loans:
+                    continue
+                start = time.perf_counter()
+                response = client.patch(f'/loans/{rng.choice(open_loans)}', headers=headers)
+            elif roll < 0.7:
+                kind = 'writes'
+                response = client.post('/reading-list/', json={'book_id': rng.choice(book_ids)}, headers=headers)
+            else:
+                kind = 'reads'
+                response = client.get('/loans/my', headers=headers)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                counts[kind] += 1
+                latencies.append(elapsed)
+                if response.status_code >= 500:
+                    counts['errors'] += 1
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(worker, range(args.threads)))
+
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    print(json.dumps({
+        'journal_mode': journal_mode,
+        'writes_per_s': round(counts['writes'] / args.seconds, 1),
+        'reads_per_s': round(counts['reads'] / args.seconds, 1),
+        'p95_ms': round(cuts[94], 2),
+        'errors': counts['errors'],
+    }))
+
+
+def main():
+    args = parse_args()
+    if args.mode:
+        run_mode(args)
+        return
+
+    results = {}
+    for mode, overrides in MODES.items():
+        env = dict(os.environ, **overrides)
+        # A handful of synthetic clients would exhaust the rate limits
+        env.setdefault('RATELIMIT_ENABLED', '0')
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+        output = subprocess.run(
+            [sys.executable, '-m', 'bench.bench_sqlite_writes', '--mode', mode,
+             '--threads', str(args.threads), '--seconds', str(args.seconds),
+             '--users', str(args.users), '--books', str(args.books)],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, text=True,
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f'{args.threads} threads, {args.seconds:g}s per run')
+    print(f'{"":<8} {"journal":>8} {"writes/s":>10} {"reads/s":>10} {"p95 ms":>10} {"5xx":>6}')
+    for mode, r in results.items():
+        print(f'{mode:<8} {r["journal_mode"]:>8} {r["writes_per_s"]:>10} {r["reads_per_s"]:>10} '
+              f'{r["p95_ms"]:>10} {r["errors"]:>6}')
+
+
+if __name__ == '__main__':
+    main()
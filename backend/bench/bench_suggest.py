@@ -0,0 +1,99 @@
+"""Time /books/suggest prefix lookups against the ILIKE search they replace.
+
+    cd backend
+    python -m bench.bench_suggest --books 100000
+
+Loads --books synthetic titles into a throwaway SQLite database, builds the
+suggestion snapshot and reports its build time and size. Then, for each of
+--lookups typed prefixes (1 to 6 characters of a random title word), it
+times suggest_index.suggest() against the ILIKE scan behind a plain
+/books/search?q= request. A second process maps the same snapshot to
+check that a rebuild in one worker is picked up by the others.
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+WORDS = ('river', 'night', 'garden', 'stone', 'shadow', 'winter', 'glass', 'harbor', 'silver',
+         'orchard', 'lantern', 'meadow', 'ember', 'hollow', 'crown', 'tide', 'feather', 'atlas')
+
+CHILD = '''
+import sys
+from suggest import SuggestIndex
+index = SuggestIndex()
+index.path = sys.argv[1]
+print(len(index.suggest(sys.argv[2], 25)))
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=500)
+    return parser.parse_args()
+
+
+def percentiles(samples):
+    cuts = statistics.quantiles(samples, n=100)
+    return cuts[49], cuts[94]
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['SUGGEST_INDEX_PATH'] = os.path.join(workdir, 'suggest.idx')
+    os.environ['SUGGEST_BUILD_ON_START'] = '0'
+
+    from app import app
+    from models import db, Book
+    from search import ilike_select
+    from suggest import suggest_index
+
+    rng = random.Random(1)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Book), [
+            {'title': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))) + f' {i}',
+             'author': f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}son', 'genre': 'g'}
+            for i in range(args.books)
+        ])
+        db.session.commit()
+
+        start = time.perf_counter()
+        suggest_index.refresh()
+        build_ms = (time.perf_counter() - start) * 1000
+        size = os.path.getsize(suggest_index.path)
+
+        prefixes = [rng.choice(WORDS)[:rng.randint(1, 6)] for _ in range(args.lookups)]
+        suggest_ms, ilike_ms = [], []
+        for prefix in prefixes:
+            start = time.perf_counter()
+            suggest_index.suggest(prefix, 10)
+            suggest_ms.append((time.perf_counter() - start) * 1000)
+        for prefix in prefixes[:50]:
+            start = time.perf_counter()
+            db.session.execute(ilike_select([(None, prefix)]).limit(11)).all()
+            ilike_ms.append((time.perf_counter() - start) * 1000)
+
+        db.session.execute(db.insert(Book), [{'title': 'Zephyr Quill', 'author': 'Nobody', 'genre': 'g'}])
+        db.session.commit()
+        suggest_index.refresh()
+        child = subprocess.run([sys.executable, '-c', CHILD, suggest_index.path, 'zephyr'],
+                               capture_output=True, text=True, check=True)
+
+    print(f'{args.books} books: snapshot built in {build_ms:.0f} ms, {size / 2**20:.1f} MiB')
+    print(f'{"":<8} {"p50 ms":>8} {"p95 ms":>8}')
+    for name, samples in (('suggest', suggest_ms), ('ilike', ilike_ms)):
+        p50, p95 = percentiles(samples)
+        print(f'{name:<8} {p50:>8.3f} {p95:>8.3f}')
+    print('rebuild visible to another process:', child.stdout.strip() == '1')
+
+
+if __name__ == '__main__':
+    main()
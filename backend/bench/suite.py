@@ -0,0 +1,494 @@
+"""Load-test every blueprint on a synthetic dataset and compare to a baseline.
+
+    cd backend
+    python -m bench.suite --scale 2 --save bench/baseline.json
+    python -m bench.suite --scale 2 --baseline bench/baseline.json
+
+Seeds users, books, loans and reading lists (--scale multiplies the default
+sizes), then drives each scenario below with --concurrency threads issuing
+--requests requests through the Flask test client. Each scenario runs
+--repeat times and the median of each figure is kept. Latency percentiles,
+throughput and SQL statements per request are printed and can be written to
+a JSON baseline with --save.
+
+The run exits non-zero if any scenario errors or completes no requests.
+With --baseline it also does if a scenario issues more queries per request
+than before, or its p50 latency or throughput moves more than --threshold
+(default 25%) the wrong way; p95 gets twice that.
+Compare runs made with the same options on the same quiet machine; with
+few cores, --concurrency 1 gives the steadiest latencies. --only restricts
+the run to scenarios starting with a prefix.
+
+Every table in DATABASE_URL is dropped and recreated; without it the run
+uses a throwaway SQLite file.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+PASSWORD = 'benchpass'
+GENRES = ('Fiction', 'Mystery', 'Science', 'History', 'Fantasy', 'Poetry', None)
+WORDS = ('river', 'night', 'garden', 'empire', 'shadow', 'letters', 'winter',
+         'machine', 'ocean', 'silver', 'house', 'memory', 'stone', 'light')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--requests', type=int, default=200, help='per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured requests per scenario')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario; the median is kept')
+    parser.add_argument('--only', action='append', default=[], help='scenario name prefix')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                        help='ignore p95 changes smaller than this')
+    return parser.parse_args()
+
+
+class Dataset:
+    """Ids and tokens the scenarios pick from."""
+
+    def __init__(self):
+        self.user_ids = []
+        self.book_ids = []
+        self.user_tokens = {}
+        self.admin_token = None
+        self.open_loans = []
+        self.lock = threading.Lock()
+        self.serial = itertools.count()
+
+    def user(self, rng):
+        user_id = rng.choice(self.user_ids)
+        return user_id, {'Authorization': f'Bearer {self.user_tokens[user_id]}'}
+
+    def admin(self):
+        return {'Authorization': f'Bearer {self.admin_token}'}
+
+    def pop_open_loan(self):
+        with self.lock:
+            return self.open_loans.pop() if self.open_loans else None
+
+
+def seed(app, rng, scale):
+    from flask_jwt_extended import create_access_token
+    from hashing import hasher
+    from models import db, Book, Loan, ReadingList, User
+    from stats import rebuild_rollups
+
+    n_users = max(int(200 * scale), 10)
+    n_books = max(int(2000 * scale), 50)
+    n_loans = int(5000 * scale)
+    n_reading = int(2000 * scale)
+    now = time.time()
+
+    data = Dataset()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        password_hash = hasher.hash(PASSWORD)
+        db.session.execute(db.insert(User), [
+            {'username': f'user{i}', 'email': f'user{i}@bench', 'password_hash': password_hash,
+             'is_admin': i == 0}
+            for i in range(n_users)
+        ])
+        copies = [rng.randint(1, 5) for _ in range(n_books)]
+        db.session.execute(db.insert(Book), [
+            {'title': f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}',
+             'author': f'Author {i % 300}', 'genre': rng.choice(GENRES),
+             'copies': copies[i], 'available_copies': copies[i]}
+            for i in range(n_books)
+        ])
+        db.session.commit()
+        user_ids = db.session.execute(db.select(User.id).order_by(User.id)).scalars().all()
+        book_ids = db.session.execute(db.select(Book.id).order_by(Book.id)).scalars().all()
+
+        loans = []
+        open_pairs = set()
+        on_loan = dict.fromkeys(book_ids, 0)
+        available = dict(zip(book_ids, copies))
+        for _ in range(n_loans):
+            user_id, book_id = rng.choice(user_ids[1:]), rng.choice(book_ids)
+            borrowed = datetime.utcfromtimestamp(now - rng.uniform(0, 60 * 86400))
+            returned = None
+            if rng.random() < 0.3 and (user_id, book_id) not in open_pairs \
+                    and on_loan[book_id] < available[book_id]:
+                open_pairs.add((user_id, book_id))
+                on_loan[book_id] += 1
+            else:
+                returned = borrowed + timedelta(days=rng.uniform(1, 20))
+            loans.append({'user_id': user_id, 'book_id': book_id, 'borrowed_at': borrowed,
+                          'due_date': borrowed + timedelta(days=14), 'returned_at': returned})
+        if loans:
+            db.session.execute(db.insert(Loan), loans)
+        db.session.execute(
+            db.update(Book),
+            [{'id': book_id, 'available_copies': available[book_id] - count}
+             for book_id, count in on_loan.items() if count]
+        )
+        reading = {(rng.choice(user_ids), rng.choice(book_ids)) for _ in range(n_reading)}
+        if reading:
+            db.session.execute(db.insert(ReadingList), [
+                {'user_id': user_id, 'book_id': book_id, 'note': 'bench'} for user_id, book_id in reading
+            ])
+        db.session.commit()
+        rebuild_rollups()
+
+        data.user_ids = user_ids[1:]
+        data.book_ids = book_ids
+        data.admin_token = create_access_token(identity=user_ids[0], additional_claims={'is_admin': True})
+        data.user_tokens = {uid: create_access_token(identity=uid) for uid in data.user_ids}
+        data.open_loans = [
+            (row.user_id, row.id) for row in db.session.execute(
+                db.select(Loan.user_id, Loan.id).where(Loan.returned_at.is_(None))
+            )
+        ]
+        rng.shuffle(data.open_loans)
+
+    print(f'seeded {n_users} users, {n_books} books, {n_loans} loans, '
+          f'{len(reading)} reading list entries')
+    return data
+
+
+# Each scenario issues one request and returns its response. `ok` lists the
+# statuses that count as success; anything else is an error. A scenario's
+# optional `prepare` function runs first, outside the timing.
+
+def login(client, data, rng):
+    n = rng.randrange(1, len(data.user_ids) + 1)
+    return client.post('/auth/login', json={'email': f'user{n}@bench', 'password': PASSWORD})
+
+
+def register(client, data, rng):
+    n = next(data.serial)
+    return client.post('/auth/register', json={
+        'username': f'bench-new{n}', 'email': f'bench-new{n}@bench', 'password': PASSWORD
+    })
+
+
+def list_books(client, data, rng):
+    _, headers = data.user(rng)
+    return client.get('/books/?limit=50', headers=headers)
+
+
+def list_books_fields(client, data, rng):
+    _, headers = data.user(rng)
+    return client.get('/books/?limit=100&fields=title,author', headers=headers)
+
+
+def search_books(client, data, rng):
+    _, headers = data.user(rng)
+    return client.get(f'/books/search?q={rng.choice(WORDS)}&limit=20', headers=headers)
+
+
+def create_book(client, data, rng):
+    n = next(data.serial)
+    return client.post('/books/', json={'title': f'New book {n}', 'author': 'Bench', 'genre': 'Fiction'},
+                       headers=data.admin())
+
+
+def my_loans(client, data, rng):
+    _, headers = data.user(rng)
+    return client.get('/loans/my', headers=headers)
+
+
+def my_overdue(client, data, rng):
+    _, headers = data.user(rng)
+    return client.get('/loans/overdue', headers=headers)
+
+
+def all_loans(client, data, rng):
+    return client.get('/loans/', headers=data.admin())
+
+
+def borrow(client, data, rng):
+    _, headers = data.user(rng)
+    return client.post('/loans/', json={'book_id': rng.choice(data.book_ids)}, headers=headers)
+
+
+def open_a_loan(client, data, rng):
+    """Lend a book directly once the seeded open loans run out, so
+    return_loan always has one to return. Runs before the request, untimed."""
+    from inventory import InventoryError, checkout
+    from models import db
+
+    with data.lock:
+        if data.open_loans:
+            return
+    with client.application.app_context():
+        for _ in range(100):
+            user_id = rng.choice(data.user_ids)
+            try:
+                loan = checkout(user_id, rng.choice(data.book_ids))
+            except InventoryError:
+                db.session.rollback()
+                continue
+            db.session.commit()
+            with data.lock:
+                data.open_loans.append((user_id, loan.id))
+            return
+
+
+def return_loan(client, data, rng):
+    loan = data.pop_open_loan()
+    if loan is None:
+        return None
+    user_id, loan_id = loan
+    headers = {'Authorization': f'Bearer {data.user_tokens[user_id]}'}
+    return client.patch(f'/loans/{loan_id}', headers=headers)
+
+
+return_loan.prepare = open_a_loan
+
+
+def borrow_batch(client, data, rng):
+    _, headers = data.user(rng)
+    return client.post('/loans/batch', json={'book_ids': rng.sample(data.book_ids, 5)}, headers=headers)
+
+
+def reading_list(client, data, rng):
+    _, headers = data.user(rng)
+    return client.get('/reading-list/', headers=headers)
+
+
+def add_to_reading_list(client, data, rng):
+    _, headers = data.user(rng)
+    return client.post('/reading-list/', json={'book_id': rng.choice(data.book_ids), 'note': 'bench'},
+                       headers=headers)
+
+
+def changes_feed(client, data, rng):
+    # The write scenarios before this one fill the log
+    _, headers = data.user(rng)
+    return client.get('/changes?since=0&limit=100', headers=headers)
+
+
+def admin_users(client, data, rng):
+    return client.get('/admin/users?limit=100', headers=data.admin())
+
+
+def admin_books(client, data, rng):
+    return client.get('/admin/books?limit=100', headers=data.admin())
+
+
+def admin_loans(client, data, rng):
+    return client.get('/admin/loans?limit=100&status=active', headers=data.admin())
+
+
+def admin_stats(client, data, rng):
+    return client.get('/admin/stats', headers=data.admin())
+
+
+def admin_update_book(client, data, rng):
+    return client.patch(f'/admin/books/{rng.choice(data.book_ids)}',
+                        json={'genre': rng.choice(GENRES[:-1])}, headers=data.admin())
+
+
+SCENARIOS = [
+    ('auth.login', login, (200,)),
+    ('auth.register', register, (201,)),
+    ('books.list', list_books, (200,)),
+    ('books.list_fields', list_books_fields, (200,)),
+    ('books.search', search_books, (200,)),
+    ('books.create', create_book, (201,)),
+    ('loans.my', my_loans, (200,)),
+    ('loans.overdue', my_overdue, (200,)),
+    ('loans.all', all_loans, (200,)),
+    ('loans.borrow', borrow, (201, 400, 409)),
+    ('loans.return', return_loan, (200,)),
+    ('loans.batch', borrow_batch, (200,)),
+    ('reading_list.get', reading_list, (200,)),
+    ('reading_list.add', add_to_reading_list, (201, 409)),
+    ('changes.since', changes_feed, (200,)),
+    ('admin.users', admin_users, (200,)),
+    ('admin.books', admin_books, (200,)),
+    ('admin.loans', admin_loans, (200,)),
+    ('admin.stats', admin_stats, (200,)),
+    ('admin.update_book', admin_update_book, (200,)),
+]
+
+
+class QueryCounter:
+    """Counts SQL statements per thread via a cursor event."""
+
+    def __init__(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        self._local = threading.local()
+        event.listen(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def take(self):
+        count = getattr(self._local, 'count', 0)
+        self._local.count = 0
+        return count
+
+
+def percentile(cuts, p):
+    return round(cuts[p - 1], 3) if cuts else 0.0
+
+
+def run_scenario(app, data, counter, fn, ok, args, rng_seed):
+    rng = random.Random(rng_seed)
+    rng_lock = threading.Lock()
+    latencies = []
+    queries = []
+    errors = {}
+
+    def one(measure):
+        client = app.test_client()
+        with rng_lock:
+            local = random.Random(rng.random())
+        if hasattr(fn, 'prepare'):
+            fn.prepare(client, data, local)
+        counter.take()
+        start = time.perf_counter()
+        response = fn(client, data, local)
+        elapsed = (time.perf_counter() - start) * 1000
+        count = counter.take()
+        if response is None or not measure:
+            return
+        if response.status_code not in ok:
+            errors[response.status_code] = errors.get(response.status_code, 0) + 1
+        latencies.append(elapsed)
+        queries.append(count)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda _: one(False), range(args.warmup)))
+        start = time.perf_counter()
+        list(pool.map(lambda _: one(True), range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': percentile(cuts, 50),
+        'p95_ms': percentile(cuts, 95),
+        'p99_ms': percentile(cuts, 99),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else 0.0,
+    }
+
+
+def median_run(runs):
+    result = {key: statistics.median(run[key] for run in runs)
+              for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_per_request')}
+    result['requests'] = sum(run['requests'] for run in runs)
+    result['errors'] = {}
+    for run in runs:
+        for status, count in run['errors'].items():
+            result['errors'][status] = result['errors'].get(status, 0) + count
+    return result
+
+
+def check(results):
+    """Failures that need no baseline: error statuses, and scenarios that
+    completed no requests, whose figures would otherwise read as zero."""
+    failures = []
+    for name, result in results.items():
+        if not result['requests']:
+            failures.append(f'{name}: no requests completed')
+        if result['errors']:
+            failures.append(f'{name}: unexpected statuses {result["errors"]}')
+    return failures
+
+
+def compare(results, baseline, args):
+    failures = check(results)
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        # Tails are noisier than medians, so they get twice the slack
+        for key, slack in (('p50_ms', args.threshold), ('p95_ms', 2 * args.threshold)):
+            if current[key] > before[key] * (1 + slack) and current[key] - before[key] > args.min_delta_ms:
+                failures.append(f'{name}: {key[:3]} {current[key]:.1f} ms vs {before[key]:.1f} ms baseline')
+        if current['throughput_rps'] < before['throughput_rps'] * (1 - args.threshold):
+            failures.append(f'{name}: {current["throughput_rps"]:.0f} req/s vs '
+                            f'{before["throughput_rps"]:.0f} req/s baseline')
+        if current['queries_per_request'] > before['queries_per_request'] + 0.5:
+            failures.append(f'{name}: {current["queries_per_request"]} queries/request vs '
+                            f'{before["queries_per_request"]} baseline')
+    return failures
+
+
+def main():
+    args = parse_args()
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # Measure the app, not bcrypt: cheap hashes, hashed inline
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+    os.environ.setdefault('HASH_WORKERS', '0')
+    # ...and not the rate limits, which one synthetic client would exhaust
+    os.environ.setdefault('RATELIMIT_ENABLED', '0')
+
+    from app import app
+    from models import db
+
+    rng = random.Random(args.seed)
+    data = seed(app, rng, args.scale)
+    counter = QueryCounter()
+
+    scenarios = [s for s in SCENARIOS
+                 if not args.only or any(s[0].startswith(prefix) for prefix in args.only)]
+    results = {}
+    print(f'{"scenario":<20} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"req/s":>8} {"queries":>8} errors')
+    for i, (name, fn, ok) in enumerate(scenarios):
+        result = median_run([
+            run_scenario(app, data, counter, fn, ok, args, (args.seed * 1000 + i) * 100 + r)
+            for r in range(args.repeat)
+        ])
+        results[name] = result
+        print(f'{name:<20} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} {result["p99_ms"]:>8.2f} '
+              f'{result["throughput_rps"]:>8.0f} {result["queries_per_request"]:>8} '
+              f'{sum(result["errors"].values()) or ""}')
+
+    if args.save:
+        with app.app_context():
+            dialect = db.engine.dialect.name
+        report = {
+            'meta': {
+                'scale': args.scale,
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'repeat': args.repeat,
+                'database': dialect,
+                'python': platform.python_version(),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+            'scenarios': results,
+        }
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f'wrote {args.save}')
+
+    failures = check(results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f)['scenarios'], args)
+    if failures:
+        print('FAILED')
+        for failure in failures:
+            print('  ' + failure)
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlparse
+
+from flask import current_app, request, make_response
+
+from compression import compression
+
+VERSION_KEY = 'booknest:catalog:version'
+ENTRY_PREFIX = 'booknest:catalog:entry:'
+
+
+class MemoryBackend:
+    """Per-process store. The version counter is local, so only use this
+    with a single worker: with several, the others miss writes until they
+    restart."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    # Entries live only in the LRU in front of the backend
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def get_counter(self, key):
+        return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class RedisBackend:
+    """Shared store for any Redis-protocol server (Redis, Valkey, KeyDB)."""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL points at Redis but the 'redis' package is not installed")
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=ttl)
+
+    def get_counter(self, key):
+        return int(self._client.get(key) or 0)
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+
+class SQLiteBackend:
+    """Local stand-in for Redis: a small key/value table in a SQLite file
+    that every worker on the host opens. Needs no extra service.
+
+    Stores sharing a file use separate tables, so one's size bound never
+    evicts another's keys; max_entries=None bounds the table by expiry
+    alone.
+    """
+
+    def __init__(self, path, max_entries=1024, table='cache'):
+        self._path = path
+        self._max_entries = max_entries
+        self._table = table
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {table} '
+                         '(key TEXT PRIMARY KEY, value BLOB, expires_at REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counter (key TEXT PRIMARY KEY, value INTEGER)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            f'SELECT value FROM {self._table} WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        conn.execute(f'INSERT OR REPLACE INTO {self._table} (key, value, expires_at) VALUES (?, ?, ?)',
+                     (key, value, time.time() + ttl))
+        # Keep the file bounded: drop expired rows, then the soonest to expire
+        conn.execute(f'DELETE FROM {self._table} WHERE expires_at <= ?', (time.time(),))
+        if self._max_entries is not None:
+            conn.execute(f'DELETE FROM {self._table} WHERE key NOT IN '
+                         f'(SELECT key FROM {self._table} ORDER BY expires_at DESC LIMIT ?)',
+                         (self._max_entries,))
+
+    def get_counter(self, key):
+        row = self._connect().execute('SELECT value FROM counter WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR IGNORE INTO counter (key, value) VALUES (?, 0)', (key,))
+            conn.execute('UPDATE counter SET value = value + 1 WHERE key = ?', (key,))
+            value = conn.execute('SELECT value FROM counter WHERE key = ?', (key,)).fetchone()[0]
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+
+def make_backend(url, max_entries, table='cache'):
+    """The store for `url`; `table` names its table in a SQLite file."""
+    parsed = urlparse(url)
+    if parsed.scheme == 'memory':
+        return MemoryBackend()
+    if parsed.scheme in ('redis', 'rediss', 'unix'):
+        return RedisBackend(url)
+    if parsed.scheme == 'sqlite':
+        return SQLiteBackend(parsed.path[1:], max_entries, table)
+    raise ValueError(f'Unsupported CACHE_URL: {url}')
+
+
+class CacheEntry:
+    """A rendered body, plus the compressed variants made of it so far."""
+
+    __slots__ = ('body', 'etag', 'headers', 'encodings')
+
+    def __init__(self, body, etag, headers, encodings=None):
+        self.body = body
+        self.etag = etag
+        self.headers = headers
+        self.encodings = encodings or {}
+
+    @classmethod
+    def build(cls, body, headers):
+        return cls(body, hashlib.sha256(body).hexdigest()[:32], headers)
+
+    def dumps(self):
+        parts = [('identity', self.body), *self.encodings.items()]
+        meta = json.dumps({'etag': self.etag, 'headers': self.headers,
+                           'parts': [[name, len(data)] for name, data in parts]}).encode('utf-8')
+        return meta + b'\n' + b''.join(data for _, data in parts)
+
+    @classmethod
+    def loads(cls, raw):
+        meta, data = raw.split(b'\n', 1)
+        meta = json.loads(meta)
+        encodings = {}
+        start = 0
+        for name, length in meta.get('parts', [['identity', len(data)]]):
+            encodings[name] = data[start:start + length]
+            start += length
+        return cls(encodings.pop('identity'), meta['etag'], meta['headers'], encodings)
+
+
+class CatalogCache:
+    """Caches rendered catalog responses keyed on the catalog version and the
+    request's query string.
+
+    Writes to books call bump_version(); entries for older versions are never
+    read again and age out of the LRU. A small in-process LRU sits in front
+    of the configured backend (CACHE_URL: sqlite:///path for a file shared by
+    the workers on a host, the default being cache.db in the instance
+    folder; redis://... for several hosts; memory:// for a single process).
+    Keys are scoped to the database URL, so databases sharing a store, e.g.
+    throwaway ones in tests, never see each other's entries.
+    """
+
+    # headers from the view that must be replayed on cached responses
+    KEPT_HEADERS = ('X-Next-Cursor',)
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self.max_entries = 256
+        self.ttl = 3600
+        self.backend = MemoryBackend()
+        self.version_key = VERSION_KEY
+        self.namespace = ''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('CACHE_MAX_ENTRIES', 256)
+        self.ttl = app.config.get('CACHE_TTL', 3600)
+        self.backend = make_backend(app.config.get('CACHE_URL', 'memory://'), self.max_entries)
+        database = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        self.namespace = hashlib.sha256(database.encode('utf-8')).hexdigest()[:16]
+        self.version_key = f'{VERSION_KEY}:{self.namespace}'
+        self.clear()
+        app.extensions['catalog_cache'] = self
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def version(self):
+        return self.backend.get_counter(self.version_key)
+
+    def bump_version(self):
+        return self.backend.incr(self.version_key)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+                return entry
+
+        raw = self.backend.get(ENTRY_PREFIX + key)
+        if raw is None:
+            return None
+        entry = CacheEntry.loads(raw)
+        self._remember(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        self._remember(key, entry)
+        self.backend.set(ENTRY_PREFIX + key, entry.dumps(), self.ttl)
+
+    def encoded(self, key, entry, coding):
+        """`entry`'s body in `coding`, compressed on first use and stored
+        with the entry, so each catalog version is compressed once."""
+        body = entry.encodings.get(coding)
+        if body is None:
+            body = entry.encodings[coding] = compression.compress(entry.body, coding, cached=True)
+            # Share the variant with the other workers
+            self.set(key, entry)
+        return body
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def key_for(self, path, args):
+        args = sorted(args.items(multi=True))
+        raw = json.dumps([self.namespace, self.version(), path, args], separators=(',', ':'))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def request_key(self):
+        return self.key_for(request.path, request.args)
+
+
+catalog_cache = CatalogCache()
+
+
+def _entry_response(key, entry):
+    coding = compression.negotiate(len(entry.body))
+    body = entry.body if coding is None else catalog_cache.encoded(key, entry, coding)
+    response = make_response(body, 200)
+    response.mimetype = 'application/json'
+    for name, value in entry.headers.items():
+        response.headers[name] = value
+    if coding is not None:
+        response.headers['Content-Encoding'] = coding
+    # Weak when compressed, as the compression middleware does
+    response.set_etag(entry.etag, weak=coding is not None)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def _use_primary():
+    # A replica that lags the version bump would render the old catalog and
+    # cache it under the new version, so cache misses read the primary
+    router = current_app.extensions.get('replica_router')
+    if router is not None:
+        router.use_primary()
+
+
+def cached_catalog(fn):
+    """Serve a catalog view from the cache, answering If-None-Match with 304.
+
+    Apply below @jwt_required so authentication still runs first.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = catalog_cache.request_key()
+        entry = catalog_cache.get(key)
+        if entry is None:
+            _use_primary()
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            headers = {name: response.headers[name]
+                       for name in CatalogCache.KEPT_HEADERS if name in response.headers}
+            entry = CacheEntry.build(body, headers)
+            catalog_cache.set(key, entry)
+        return _entry_response(key, entry)
+    return wrapper
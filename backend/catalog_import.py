@@ -0,0 +1,191 @@
+import csv
+import json
+
+import click
+from flask.cli import AppGroup
+from models import db, Book
+from catalog_cache import catalog_cache
+from suggest import suggest_index
+from stats import adjust_counter
+from changes import BOOK, UPSERT, record_changes
+
+DEFAULT_BATCH_SIZE = 1000
+# The duplicate check binds two parameters per row; this keeps a batch well
+# under SQLite's 32766-variable limit
+MAX_BATCH_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+
+
+class CatalogImportError(ValueError):
+    pass
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.batches = 0
+
+    def as_dict(self):
+        return {
+            'read': self.read,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'batches': self.batches,
+        }
+
+
+def text_lines(stream):
+    """Decode a binary stream line by line without reading it all."""
+    first = True
+    for raw in iter(stream.readline, b''):
+        line = raw.decode('utf-8')
+        if first:
+            line = line.lstrip('\ufeff')
+            first = False
+        yield line
+
+
+def iter_records(lines, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(lines)
+    elif fmt == 'jsonl':
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield record if isinstance(record, dict) else {}
+    else:
+        raise CatalogImportError(f'Unsupported format: {fmt}')
+
+
+def text_field(value):
+    # JSONL values may be any JSON type: numbers read as text, while
+    # objects and arrays make the record invalid (None)
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return None
+    return str(value).strip()
+
+
+def clean_record(record):
+    title = text_field(record.get('title'))
+    author = text_field(record.get('author'))
+    genre = text_field(record.get('genre'))
+    if not title or not author or genre is None:
+        return None
+
+    genre = genre or None
+    copies = record.get('copies')
+    try:
+        copies = int(copies) if copies not in (None, '') else 1
+    except (TypeError, ValueError):
+        return None
+    if copies < 0:
+        return None
+
+    return {'title': title, 'author': author, 'genre': genre,
+            'copies': copies, 'available_copies': copies}
+
+
+def insert_batch(batch, stats):
+    """Insert one batch of cleaned rows keyed on (title, author), skipping
+    those already in the catalog, and commit."""
+    keys = list(batch)
+    existing = set(db.session.execute(
+        db.select(Book.title, Book.author)
+        .where(db.tuple_(Book.title, Book.author).in_(keys))
+    ).tuples())
+
+    rows = [row for key, row in batch.items() if key not in existing]
+    stats.duplicates += len(batch) - len(rows)
+    if rows:
+        db.session.execute(db.insert(Book), rows)
+        adjust_counter('books', len(rows))
+        new_ids = db.session.execute(
+            db.select(Book.id)
+            .where(db.tuple_(Book.title, Book.author).in_([(row['title'], row['author']) for row in rows]))
+            .order_by(Book.id)
+        ).scalars()
+        record_changes([(BOOK, book_id, UPSERT, None) for book_id in new_ids])
+    db.session.commit()
+    if rows:
+        catalog_cache.bump_version()
+    stats.inserted += len(rows)
+    stats.batches += 1
+
+
+def import_books(records, batch_size=DEFAULT_BATCH_SIZE):
+    """Stream records into the book table in batches.
+
+    Yields the running ImportStats after every committed batch so callers
+    can report progress. Only one batch is held in memory at a time.
+    Duplicates on (title, author), within the file or against the existing
+    catalog, are skipped.
+    """
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise CatalogImportError(f'batch_size must be between 1 and {MAX_BATCH_SIZE}')
+
+    stats = ImportStats()
+    batch = {}
+    for record in records:
+        stats.read += 1
+        row = clean_record(record)
+        if row is None:
+            stats.invalid += 1
+            continue
+
+        key = (row['title'], row['author'])
+        if key in batch:
+            stats.duplicates += 1
+            continue
+        batch[key] = row
+
+        if len(batch) >= batch_size:
+            insert_batch(batch, stats)
+            batch = {}
+            yield stats
+
+    if batch:
+        insert_batch(batch, stats)
+    if stats.inserted:
+        # One rebuild for the whole import rather than one per batch
+        suggest_index.refresh()
+    if batch or not stats.batches:
+        yield stats
+
+
+def detect_format(filename, fmt=None):
+    if fmt:
+        return fmt
+    if filename.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+
+catalog_cli = AppGroup('catalog', help='Catalog maintenance commands.')
+
+
+@catalog_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True,
+              type=click.IntRange(1, MAX_BATCH_SIZE))
+def import_command(path, fmt, batch_size):
+    """Bulk import books from a CSV or JSONL file."""
+    fmt = detect_format(path, fmt)
+    with open(path, 'rb') as f:
+        stats = None
+        for stats in import_books(iter_records(text_lines(f), fmt), batch_size):
+            click.echo(f"\rread {stats.read}  inserted {stats.inserted}  "
+                       f"duplicates {stats.duplicates}  invalid {stats.invalid}", nl=False)
+    click.echo()
+    click.echo(f'Done: {json.dumps(stats.as_dict())}')
@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from models import db, Book, ChangeLog, ChangeLogHead, Loan, ReadingList
+from serialization import RowSerializer
+from stats import DIALECT_INSERTS
+
+BOOK = 'book'
+LOAN = 'loan'
+READING_LIST = 'reading_list'
+UPSERT = 'upsert'
+DELETE = 'delete'
+HEAD_ID = 1
+DEFAULT_KEEP_DAYS = 30
+
+
+class ChangesGone(Exception):
+    """`since` is older than the compacted log, or newer than its head; the
+    client has to refetch its lists and start again from `version`."""
+
+    def __init__(self, version):
+        super().__init__('since is outside the change log; refetch and resume from version')
+        self.version = version
+
+
+def _allocate(count):
+    # Upsert on the single head row. The row lock it takes is held until
+    # commit, so versions are committed in the order they are handed out
+    # and a reader never sees version n+1 before n.
+    insert = DIALECT_INSERTS[db.engine.dialect.name](ChangeLogHead)
+    stmt = insert.values(id=HEAD_ID, version=count, horizon=0).on_conflict_do_update(
+        index_elements=['id'],
+        set_={'version': ChangeLogHead.version + insert.excluded.version},
+    ).returning(ChangeLogHead.version)
+    return db.session.execute(stmt).scalar_one()
+
+
+def record_changes(entries):
+    """Append (entity, entity_id, op, user_id) entries to the change log in
+    the caller's transaction, so they commit or roll back with the write
+    they describe."""
+    if not entries:
+        return
+    last = _allocate(len(entries))
+    now = datetime.utcnow()
+    db.session.execute(db.insert(ChangeLog), [
+        {'version': version, 'entity': entity, 'entity_id': entity_id, 'op': op,
+         'user_id': user_id, 'changed_at': now}
+        for version, (entity, entity_id, op, user_id)
+        in zip(range(last - len(entries) + 1, last + 1), entries)
+    ])
+
+
+def record_change(entity, entity_id, op=UPSERT, user_id=None):
+    record_changes([(entity, entity_id, op, user_id)])
+
+
+def head():
+    row = db.session.execute(db.select(ChangeLogHead.version, ChangeLogHead.horizon)).first()
+    return (row.version, row.horizon) if row else (0, 0)
+
+
+ENTITY_SELECTS = {
+    BOOK: lambda ids: db.select(
+        Book.id, Book.title, Book.author, Book.genre, Book.copies, Book.available_copies
+    ).where(Book.id.in_(ids)),
+    LOAN: lambda ids: db.select(
+        Loan.id, Loan.user_id, Loan.book_id, Loan.borrowed_at, Loan.returned_at, Loan.due_date,
+        Book.title, Book.author, Book.genre
+    ).join(Book, Loan.book_id == Book.id).where(Loan.id.in_(ids)),
+    READING_LIST: lambda ids: db.select(
+        ReadingList.id, ReadingList.book_id, ReadingList.note,
+        Book.title, Book.author, Book.genre
+    ).join(Book, ReadingList.book_id == Book.id).where(ReadingList.id.in_(ids)),
+}
+
+ENTITY_ITEMS = {
+    BOOK: RowSerializer('id', 'title', 'author', 'genre', 'copies', 'available_copies'),
+    LOAN: RowSerializer('id', 'user_id', 'book_id', 'borrowed_at', 'returned_at', 'due_date',
+                        book=('title', 'author', 'genre')),
+    READING_LIST: RowSerializer('id', 'book_id', 'note', book=('title', 'author', 'genre')),
+}
+
+
+def changes_since(since, user_id, is_admin, limit):
+    """The changes after `since` visible to a user, oldest first.
+
+    Everyone sees catalog changes; loans and reading-list entries are seen
+    by their owner, and loans by admins too. Several changes to one row
+    collapse to its latest, carrying the row's current state. Returns
+    (changes, version, has_more): resume from `version` next time.
+    """
+    version, horizon = head()
+    if since < horizon or since > version:
+        raise ChangesGone(version)
+
+    visible = [ChangeLog.entity == BOOK, ChangeLog.user_id == user_id]
+    if is_admin:
+        visible.append(ChangeLog.entity == LOAN)
+    rows = db.session.execute(
+        db.select(ChangeLog.version, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op)
+        .where(ChangeLog.version > since, ChangeLog.version <= version, db.or_(*visible))
+        .order_by(ChangeLog.version)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    if has_more:
+        rows = rows[:limit]
+        version = rows[-1].version
+
+    latest = {}
+    for row in rows:
+        latest.pop((row.entity, row.entity_id), None)
+        latest[(row.entity, row.entity_id)] = row
+
+    wanted = {}
+    for (entity, entity_id), row in latest.items():
+        if row.op == UPSERT:
+            wanted.setdefault(entity, []).append(entity_id)
+    current = {}
+    for entity, ids in wanted.items():
+        for item in ENTITY_ITEMS[entity].many(db.session.execute(ENTITY_SELECTS[entity](ids)).all()):
+            current[(entity, item['id'])] = item
+
+    changes = []
+    for key, row in latest.items():
+        # A row deleted after its upsert was logged reads as a delete
+        data = current.get(key) if row.op == UPSERT else None
+        change = {'version': row.version, 'entity': row.entity, 'id': row.entity_id,
+                  'op': UPSERT if data else DELETE}
+        if data:
+            change['data'] = data
+        changes.append(change)
+    return changes, version, has_more
+
+
+def compact_changes(keep_days=DEFAULT_KEEP_DAYS):
+    """Drop entries superseded by a later one for the same row, which no
+    client needs, then everything older than `keep_days`. Clients further
+    behind than that get 410 and refetch. Returns (superseded, expired)."""
+    newer = db.aliased(ChangeLog)
+    superseded = db.session.execute(
+        db.delete(ChangeLog).where(
+            db.select(newer.version).where(
+                newer.entity == ChangeLog.entity,
+                newer.entity_id == ChangeLog.entity_id,
+                newer.version > ChangeLog.version,
+            ).exists()
+        )
+    ).rowcount
+
+    cutoff = datetime.utcnow() - timedelta(days=keep_days)
+    horizon = db.session.execute(
+        db.select(db.func.max(ChangeLog.version)).where(ChangeLog.changed_at < cutoff)
+    ).scalar()
+    expired = 0
+    if horizon is not None:
+        expired = db.session.execute(
+            db.delete(ChangeLog).where(ChangeLog.version <= horizon)
+        ).rowcount
+        db.session.execute(
+            db.update(ChangeLogHead).where(ChangeLogHead.id == HEAD_ID).values(horizon=horizon)
+        )
+    db.session.commit()
+    return superseded, expired
+
+
+changes_cli = AppGroup('changes', help='Change feed maintenance commands.')
+
+
+@changes_cli.command('compact')
+@click.option('--keep-days', default=DEFAULT_KEEP_DAYS, show_default=True)
+def compact_command(keep_days):
+    """Compact the change log. Run from cron."""
+    superseded, expired = compact_changes(keep_days)
+    click.echo(f'Removed {superseded} superseded and {expired} expired changes.')
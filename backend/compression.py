@@ -0,0 +1,154 @@
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = (
+    'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html',
+)
+# Server preference when the client accepts several equally
+PREFERENCE = ('zstd', 'br', 'gzip')
+DEFAULT_MIN_SIZE = 500
+
+
+class GzipCodec:
+    level = 6
+    cached_level = 9
+
+    def compress(self, data, level):
+        # mtime=0 keeps the output, and so cached variants, deterministic
+        return gzip.compress(data, level, mtime=0)
+
+    def stream(self, chunks, level):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+class BrotliCodec:
+    level = 4
+    cached_level = 9
+
+    def compress(self, data, level):
+        return brotli.compress(data, quality=level)
+
+    def stream(self, chunks, level):
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+
+
+class ZstdCodec:
+    level = 3
+    cached_level = 12
+
+    def compress(self, data, level):
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    def stream(self, chunks, level):
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        yield compressor.flush()
+
+
+def available_codecs():
+    codecs = {'gzip': GzipCodec()}
+    if brotli is not None:
+        codecs['br'] = BrotliCodec()
+    if zstandard is not None:
+        codecs['zstd'] = ZstdCodec()
+    return codecs
+
+
+class Compression:
+    """Content-negotiated response compression.
+
+    Responses with a JSON, NDJSON, CSV or text body are compressed with the
+    best coding the client accepts: zstd, br or gzip, the first two only
+    when the zstandard and Brotli packages are installed. COMPRESS_ENCODINGS
+    narrows the set (empty turns compression off). Buffered bodies under
+    COMPRESS_MIN_SIZE bytes are sent as is. Streamed responses (exports,
+    import progress) are compressed chunk by chunk, each chunk flushed so
+    the client still sees it as soon as it is produced.
+
+    A compressed response carries a weak ETag, so If-None-Match still
+    matches across codings. Cached catalog pages don't go through here:
+    catalog_cache stores each coding next to the raw body and reuses it.
+    """
+
+    def __init__(self, app=None):
+        self.codecs = {}
+        self.min_size = DEFAULT_MIN_SIZE
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        codecs = available_codecs()
+        names = app.config.get('COMPRESS_ENCODINGS', PREFERENCE)
+        self.codecs = {name: codecs[name] for name in PREFERENCE if name in names and name in codecs}
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+        app.extensions['compression'] = self
+        if self.codecs:
+            app.after_request(self._after_request)
+
+    def negotiate(self, size=None, accept=None):
+        """The coding to send a `size`-byte body in, or None for identity.
+        `accept` is the parsed Accept-Encoding, by default the request's."""
+        if not self.codecs or (size is not None and size < self.min_size):
+            return None
+        accept = request.accept_encodings if accept is None else accept
+        return accept.best_match(list(self.codecs))
+
+    def compress(self, data, coding, cached=False):
+        codec = self.codecs[coding]
+        return codec.compress(data, codec.cached_level if cached else codec.level)
+
+    def _after_request(self, response):
+        if (not 200 <= response.status_code < 300 or response.status_code in (204, 206)
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough
+                or response.cache_control.no_transform):
+            return response
+        response.vary.add('Accept-Encoding')
+        if 'Content-Encoding' in response.headers or request.method == 'HEAD':
+            return response
+
+        if response.is_streamed:
+            coding = self.negotiate()
+            if coding is None:
+                return response
+            response.response = self._stream(response.response, response.iter_encoded(), self.codecs[coding])
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            coding = self.negotiate(len(data))
+            if coding is None:
+                return response
+            response.set_data(self.compress(data, coding))
+        response.headers['Content-Encoding'] = coding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _stream(self, original, chunks, codec):
+        try:
+            yield from codec.stream((chunk for chunk in chunks if chunk), codec.level)
+        finally:
+            if hasattr(original, 'close'):
+                original.close()
+
+
+compression = Compression()
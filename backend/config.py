@@ -1,6 +1,120 @@
 import os
 
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///booknest.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.getenv("SECRET_KEY", "secret-key")
+
+    # Connection pool (server databases). Size it so that
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays under max_connections.
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    # Recycle before the server or a proxy drops idle connections
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+    # SQLite fallback, applied to every new connection
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+    # Read replicas for GET requests, comma-separated. A user's reads stay
+    # on the primary for REPLICA_STICKY_SECONDS after they write, and a
+    # replica that fails is skipped for REPLICA_RETRY_SECONDS.
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+                             if url.strip()]
+    REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 10))
+    REPLICA_RETRY_SECONDS = int(os.getenv("REPLICA_RETRY_SECONDS", 30))
+
+
+class DevelopmentConfig(Config):
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 2))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 2))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+
+
+class ProductionConfig(Config):
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+
+
+CONFIGS = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+}
+
+
+def get_config(env=None):
+    env = env or os.getenv("APP_ENV", "production")
+    try:
+        return CONFIGS[env]
+    except KeyError:
+        raise ValueError(f"Unknown APP_ENV: {env}")
+
+
+def database_url(url):
+    # Heroku-style postgres:// URLs are not accepted by SQLAlchemy 1.4+
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database URL."""
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() == "sqlite":
+        # SQLite keeps its default pool; the pragmas below do the tuning
+        return {"connect_args": {"timeout": config["SQLITE_BUSY_TIMEOUT_MS"] / 1000}}
+    return {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+
+
+def replica_binds(config):
+    """SQLALCHEMY_BINDS for the read replicas, named replica1..N, each with
+    the same engine options as the primary."""
+    binds = {}
+    for i, url in enumerate(config["DATABASE_REPLICA_URLS"], 1):
+        url = database_url(url)
+        binds[f"replica{i}"] = {"url": url, **engine_options({**config, "SQLALCHEMY_DATABASE_URI": url})}
+    return binds
+
+
+def sqlite_pragmas(config):
+    return [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={config['SQLITE_BUSY_TIMEOUT_MS']}",
+        f"PRAGMA mmap_size={config['SQLITE_MMAP_SIZE']}",
+    ]
+
+
+def tune_engine(engine, config):
+    """Run the SQLite pragmas on every new connection of `engine`.
+
+    WAL lets readers carry on while one writer commits, and with
+    synchronous=NORMAL a commit no longer waits for an fsync (the database
+    stays consistent; a power cut may lose the last transactions).
+    busy_timeout makes a writer wait for the lock instead of failing with
+    "database is locked".
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
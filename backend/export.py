@@ -0,0 +1,86 @@
+import csv
+import io
+
+from flask import Response, request, stream_with_context
+from models import db
+from serialization import dumps_line
+
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+YIELD_PER = 1000
+
+
+def export_format():
+    """Return 'ndjson' or 'csv' when the client asked for a streamed export,
+    via ?format= or the Accept header, otherwise None."""
+    fmt = request.args.get('format')
+    if fmt in EXPORT_MIMETYPES:
+        return fmt
+    best = request.accept_mimetypes.best_match(
+        ['application/json', *EXPORT_MIMETYPES.values()], default='application/json'
+    )
+    for name, mimetype in EXPORT_MIMETYPES.items():
+        if best == mimetype:
+            return name
+    return None
+
+
+def _ndjson_chunks(rows):
+    lines = []
+    for row in rows:
+        lines.append(dumps_line(row))
+        if len(lines) >= YIELD_PER:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def _csv_chunks(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count >= YIELD_PER:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    yield buffer.getvalue()
+
+
+def row_dict(row):
+    return dict(row._mapping)
+
+
+def stream_export(select, fmt, name, transform=row_dict, columns=None):
+    """Stream every row of `select` as NDJSON or CSV.
+
+    Rows are fetched YIELD_PER at a time (a server-side cursor on Postgres)
+    and flushed in chunks of the same size, so memory does not grow with
+    the table. `transform` turns a result row into the output dict; pass
+    `columns` when it renames or adds keys.
+    """
+    columns = columns or list(select.selected_columns.keys())
+
+    @stream_with_context
+    def generate():
+        result = db.session.execute(select.execution_options(yield_per=YIELD_PER))
+        rows = (transform(row) for row in result)
+        try:
+            if fmt == 'csv':
+                yield from _csv_chunks(rows, columns)
+            else:
+                yield from _ndjson_chunks(rows)
+        finally:
+            result.close()
+
+    response = Response(generate(), mimetype=EXPORT_MIMETYPES[fmt])
+    if fmt == 'csv':
+        response.headers['Content-Disposition'] = f'attachment; filename={name}.csv'
+    return response
@@ -0,0 +1,128 @@
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from flask_bcrypt import Bcrypt
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated; the request should be
+    retried after `retry_after` seconds."""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Password hashing pool is saturated')
+        self.retry_after = retry_after
+
+
+# These run in the pool's child processes, so they must be module-level
+def _hash(password, rounds):
+    return Bcrypt().generate_password_hash(password, rounds).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    return Bcrypt().check_password_hash(pw_hash, password)
+
+
+def pool_share(pool_size, web_workers):
+    """This process's share of a host-wide pool of `pool_size` hashing
+    processes, split between `web_workers` server processes. At least one,
+    unless the pool is off."""
+    if not pool_size:
+        return 0
+    return max(1, pool_size // max(web_workers, 1))
+
+
+def hash_cost(pw_hash):
+    # bcrypt hashes look like $2b$12$<salt+digest>
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Runs bcrypt in a process pool so request workers are not pinned by
+    ~250ms of CPU per login.
+
+    The host runs HASH_POOL_SIZE hashing processes in all, split between
+    the WEB_CONCURRENCY server workers; HASH_WORKERS sets one worker's share
+    directly. At most HASH_QUEUE_SIZE hashes may be queued or running per
+    worker process, counting ones whose caller timed out; beyond that callers
+    get HashingBusy instead of waiting, which the app turns into a 503 with
+    Retry-After. A pool size of 0 hashes inline.
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._lock = threading.Lock()
+        self.workers = 0
+        self.rounds = 12
+        self.timeout = 10
+        self.retry_after = 1
+        self._slots = threading.BoundedSemaphore(1)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config.get('HASH_WORKERS')
+        if self.workers is None:
+            self.workers = pool_share(app.config.get('HASH_POOL_SIZE', os.cpu_count() or 1),
+                                      app.config.get('WEB_CONCURRENCY', 1))
+        queue_size = app.config.get('HASH_QUEUE_SIZE') or max(self.workers, 1) * 4
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        self.timeout = app.config.get('HASH_TIMEOUT', 10)
+        self.retry_after = app.config.get('HASH_RETRY_AFTER', 1)
+        self._slots = threading.BoundedSemaphore(queue_size)
+        app.extensions['password_hasher'] = self
+
+    def _get_executor(self):
+        # Created on first use so each gunicorn worker builds its own pool
+        # after forking
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HashingBusy(self.retry_after)
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # Free the slot when the job ends, not when this caller stops
+        # waiting, so timed-out hashes still count against the queue
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy(self.retry_after)
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, pw_hash, password):
+        return self._run(_check, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        return hash_cost(pw_hash) != self.rounds
+
+    def shutdown(self):
+        if self._executor is not None:
+            if sys.version_info >= (3, 9):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                # No cancel_futures on 3.8: queued hashes run to completion
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+hasher = PasswordHasher()
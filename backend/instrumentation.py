@@ -0,0 +1,220 @@
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('booknest.instrumentation')
+
+# Request latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'db_time', 'profiler')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.profiler = None
+
+
+class EndpointMetrics:
+    __slots__ = ('count', 'duration', 'buckets', 'queries', 'db_time')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.queries = 0
+        self.db_time = 0.0
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Instrumentation:
+    """Opt-in request timing, SQL counting and sampling profiler.
+
+    Enabled with INSTRUMENTATION=1. Every request then gets a Server-Timing
+    header with its total and database time, statements slower than
+    SLOW_QUERY_MS are logged with the endpoint that issued them, and
+    per-endpoint totals are served in Prometheus text format at /metrics.
+    Metrics are kept per worker process; scrape each worker, or run a
+    single worker when profiling.
+
+    With PROFILE_SAMPLE_RATE > 0 that fraction of requests runs under
+    cProfile, and those taking longer than PROFILE_THRESHOLD_MS are dumped
+    to PROFILE_DIR as <endpoint>-<timestamp>.prof for snakeviz/pstats.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._responses = {}
+        self._listening = False
+        self.enabled = False
+        self.slow_query = 0.1
+        self.profile_rate = 0.0
+        self.profile_threshold = 0.5
+        self.profile_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('INSTRUMENTATION', False)
+        app.extensions['instrumentation'] = self
+        if not self.enabled:
+            return
+
+        self.slow_query = app.config.get('SLOW_QUERY_MS', 100) / 1000
+        self.profile_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.profile_threshold = app.config.get('PROFILE_THRESHOLD_MS', 500) / 1000
+        self.profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+
+    # --- request hooks ---
+
+    def _before_request(self):
+        stats = g._request_stats = RequestStats()
+        if self.profile_rate and random.random() < self.profile_rate:
+            stats.profiler = cProfile.Profile()
+            stats.profiler.enable()
+
+    def _after_request(self, response):
+        stats = g.pop('_request_stats', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unmatched'
+
+        if stats.profiler is not None:
+            stats.profiler.disable()
+            if elapsed >= self.profile_threshold:
+                self._dump_profile(stats.profiler, endpoint)
+
+        if endpoint != 'metrics':
+            self._observe(endpoint, request.method, response.status_code, elapsed, stats)
+        response.headers['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, '
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"'
+        )
+        return response
+
+    def _dump_profile(self, profiler, endpoint):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{endpoint.replace('.', '-')}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.prof"
+        path = os.path.join(self.profile_dir, name)
+        profiler.dump_stats(path)
+        logger.info('Profiled slow request to %s: %s', endpoint, path)
+
+    def _observe(self, endpoint, method, status, elapsed, stats):
+        with self._lock:
+            metrics = self._endpoints.get((endpoint, method))
+            if metrics is None:
+                metrics = self._endpoints[(endpoint, method)] = EndpointMetrics()
+            metrics.count += 1
+            metrics.duration += elapsed
+            metrics.queries += stats.queries
+            metrics.db_time += stats.db_time
+            for i, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    metrics.buckets[i] += 1
+            key = (endpoint, method, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    # --- SQLAlchemy cursor events ---
+
+    # The start time lives on the statement's execution context, not the
+    # connection: a statement that raises gets no after event, and its
+    # entry would stay on the pooled connection for good
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+
+        stats = g.get('_request_stats') if has_request_context() else None
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+        if elapsed >= self.slow_query:
+            endpoint = (request.endpoint or 'unmatched') if has_request_context() else 'cli'
+            logger.warning('Slow query (%.1f ms) in %s: %s',
+                           elapsed * 1000, endpoint, ' '.join(statement.split())[:500])
+
+    # --- exposition ---
+
+    def render_metrics(self):
+        with self._lock:
+            endpoints = list(self._endpoints.items())
+            responses = list(self._responses.items())
+
+        lines = [
+            '# HELP booknest_requests_total Requests handled, by endpoint and status.',
+            '# TYPE booknest_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(responses):
+            lines.append(f'booknest_requests_total{{endpoint="{_label(endpoint)}",'
+                         f'method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP booknest_request_duration_seconds Request handling time.',
+            '# TYPE booknest_request_duration_seconds histogram',
+        ]
+        for (endpoint, method), metrics in sorted(endpoints):
+            labels = f'endpoint="{_label(endpoint)}",method="{method}"'
+            for bound, count in zip(BUCKETS, metrics.buckets):
+                lines.append(f'booknest_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'booknest_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.count}')
+            lines.append(f'booknest_request_duration_seconds_sum{{{labels}}} {metrics.duration:.6f}')
+            lines.append(f'booknest_request_duration_seconds_count{{{labels}}} {metrics.count}')
+
+        lines += [
+            '# HELP booknest_db_queries_total SQL statements executed while handling requests.',
+            '# TYPE booknest_db_queries_total counter',
+        ]
+        for (endpoint, method), metrics in sorted(endpoints):
+            lines.append(f'booknest_db_queries_total{{endpoint="{_label(endpoint)}",'
+                         f'method="{method}"}} {metrics.queries}')
+
+        lines += [
+            '# HELP booknest_db_seconds_total Time spent in SQL statements while handling requests.',
+            '# TYPE booknest_db_seconds_total counter',
+        ]
+        for (endpoint, method), metrics in sorted(endpoints):
+            lines.append(f'booknest_db_seconds_total{{endpoint="{_label(endpoint)}",'
+                         f'method="{method}"}} {metrics.db_time:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render_metrics(), mimetype=PROMETHEUS_MIMETYPE)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._responses.clear()
+
+
+instrumentation = Instrumentation()
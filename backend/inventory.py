@@ -0,0 +1,265 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import db, Book, Loan
+from overdue import assess_fine
+from changes import BOOK, DELETE, LOAN, READING_LIST, UPSERT, record_changes
+from stats import adjust_counter, forget_loans, record_checkout, record_checkouts, record_return, record_returns
+
+LOAN_PERIOD = timedelta(days=14)
+MAX_BATCH_SIZE = 100
+
+
+# pysqlite normally opens transactions lazily and always as DEFERRED, which
+# lets two writers read the same state before either takes the write lock.
+# Hand transaction control to SQLAlchemy so a checkout can ask for
+# BEGIN IMMEDIATE via the `sqlite_begin` execution option.
+@event.listens_for(Engine, 'connect')
+def _sqlite_manual_begin(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.isolation_level = None
+
+
+@event.listens_for(Engine, 'begin')
+def _sqlite_begin(conn):
+    if conn.dialect.name == 'sqlite':
+        mode = conn.get_execution_options().get('sqlite_begin', 'DEFERRED')
+        conn.exec_driver_sql(f'BEGIN {mode}')
+
+
+class InventoryError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def begin_write():
+    # On SQLite take the database write lock up front; on Postgres the
+    # SELECT ... FOR UPDATE below locks just the rows involved
+    if not db.session().in_transaction():
+        db.session.connection(execution_options={'sqlite_begin': 'IMMEDIATE'})
+
+
+def lock_book(book_id):
+    begin_write()
+    return db.session.execute(
+        db.select(Book).where(Book.id == book_id).with_for_update()
+    ).scalar_one_or_none()
+
+
+def open_loan_select(user_id, book_id):
+    # Served by the partial index ix_loan_active_user_book
+    return db.select(Loan.id).where(
+        Loan.user_id == user_id, Loan.book_id == book_id, Loan.returned_at.is_(None)
+    )
+
+
+def checkout(user_id, book_id):
+    """Lend one copy of a book atomically and return the new Loan.
+
+    Raises InventoryError if the book is missing, already on loan to this
+    user, or has no copies left. The caller commits.
+    """
+    book = lock_book(book_id)
+    if not book:
+        raise InventoryError('Book not found', 404)
+
+    existing_loan = db.session.execute(open_loan_select(user_id, book_id)).first()
+    if existing_loan:
+        raise InventoryError('You already borrowed this book', 400)
+
+    if book.available_copies < 1:
+        raise InventoryError('No copies available', 409)
+
+    now = datetime.utcnow()
+    book.available_copies -= 1
+    loan = Loan(user_id=user_id, book_id=book_id, borrowed_at=now,
+                due_date=now + LOAN_PERIOD, returned_at=None)
+    db.session.add(loan)
+    db.session.flush()
+    record_checkout(book, now)
+    record_changes([(LOAN, loan.id, UPSERT, user_id), (BOOK, book.id, UPSERT, None)])
+    return loan
+
+
+def checkout_many(user_id, book_ids):
+    """Lend one copy of each book in `book_ids` to a user, in the caller's
+    transaction.
+
+    Books and the user's open loans are each validated with one IN (...)
+    lookup, with the books locked in id order. Returns one result dict per
+    requested id, in request order; items that cannot be lent are reported
+    there instead of raising. The caller commits.
+    """
+    begin_write()
+    wanted = set(book_ids)
+    books = {book.id: book for book in db.session.execute(
+        db.select(Book).where(Book.id.in_(wanted)).order_by(Book.id).with_for_update()
+    ).scalars()}
+    on_loan = set(db.session.execute(
+        db.select(Loan.book_id).where(
+            Loan.user_id == user_id, Loan.book_id.in_(wanted), Loan.returned_at.is_(None)
+        )
+    ).scalars())
+
+    now = datetime.utcnow()
+    results = []
+    loans = []
+    for book_id in book_ids:
+        book = books.get(book_id)
+        if not book:
+            results.append({'book_id': book_id, 'status': 404, 'error': 'Book not found'})
+        elif book_id in on_loan:
+            results.append({'book_id': book_id, 'status': 400, 'error': 'You already borrowed this book'})
+        elif book.available_copies < 1:
+            results.append({'book_id': book_id, 'status': 409, 'error': 'No copies available'})
+        else:
+            on_loan.add(book_id)
+            book.available_copies -= 1
+            loan = Loan(user_id=user_id, book_id=book_id, borrowed_at=now,
+                        due_date=now + LOAN_PERIOD, returned_at=None)
+            loans.append((book, loan))
+            results.append({'book_id': book_id, 'status': 201})
+
+    if loans:
+        db.session.add_all(loan for _, loan in loans)
+        db.session.flush()
+        record_checkouts([book for book, _ in loans], now)
+        record_changes([(LOAN, loan.id, UPSERT, user_id) for _, loan in loans]
+                       + [(BOOK, book.id, UPSERT, None) for book, _ in loans])
+        created = iter(loans)
+        for result in results:
+            if result['status'] == 201:
+                _, loan = next(created)
+                result['loan_id'] = loan.id
+                result['due_date'] = loan.due_date
+    return results
+
+
+def release_copy(book_id):
+    db.session.execute(
+        db.update(Book)
+        .where(Book.id == book_id, Book.available_copies < Book.copies)
+        .values(available_copies=Book.available_copies + 1)
+    )
+
+
+def lock_loan(loan_id):
+    begin_write()
+    return db.session.execute(
+        db.select(Loan).where(Loan.id == loan_id).with_for_update()
+    ).scalar_one_or_none()
+
+
+def checkin(loan):
+    """Mark a locked, open loan returned and put its copy back. The caller
+    commits."""
+    if loan.returned_at:
+        raise InventoryError('Book already returned', 400)
+    loan.returned_at = datetime.utcnow()
+    loan.fine_cents = assess_fine(loan.due_date, loan.returned_at)
+    loan.is_overdue = False
+    release_copy(loan.book_id)
+    record_return(loan.returned_at)
+    record_changes([(LOAN, loan.id, UPSERT, loan.user_id), (BOOK, loan.book_id, UPSERT, None)])
+
+
+def checkin_many(user_id, loan_ids):
+    """Return every open loan in `loan_ids` that belongs to `user_id`, in
+    the caller's transaction.
+
+    The loans are locked with one IN (...) lookup and the copies put back
+    with a single executemany. Returns one result dict per requested id, in
+    request order. The caller commits.
+    """
+    begin_write()
+    loans = {loan.id: loan for loan in db.session.execute(
+        db.select(Loan).where(Loan.id.in_(set(loan_ids))).order_by(Loan.id).with_for_update()
+    ).scalars()}
+
+    now = datetime.utcnow()
+    results = []
+    returned = []
+    for loan_id in loan_ids:
+        loan = loans.get(loan_id)
+        if not loan:
+            results.append({'loan_id': loan_id, 'status': 404, 'error': 'Loan not found'})
+        elif loan.user_id != user_id:
+            results.append({'loan_id': loan_id, 'status': 403, 'error': 'Not authorized to return this book'})
+        elif loan.returned_at:
+            results.append({'loan_id': loan_id, 'status': 400, 'error': 'Book already returned'})
+        else:
+            loan.returned_at = now
+            loan.fine_cents = assess_fine(loan.due_date, now)
+            loan.is_overdue = False
+            returned.append(loan)
+            results.append({'loan_id': loan_id, 'status': 200, 'fine_cents': loan.fine_cents})
+
+    if returned:
+        book = Book.__table__
+        db.session.connection().execute(
+            book.update()
+            .where(book.c.id == db.bindparam('b_id'), book.c.available_copies < book.c.copies)
+            .values(available_copies=book.c.available_copies + 1),
+            [{'b_id': loan.book_id} for loan in returned],
+        )
+        record_returns(len(returned), now)
+        record_changes([(LOAN, loan.id, UPSERT, user_id) for loan in returned]
+                       + [(BOOK, loan.book_id, UPSERT, None) for loan in returned])
+    return results
+
+
+def discard_loan(loan):
+    # Deleting an open loan must not leak the copy it was holding
+    changes = [(LOAN, loan.id, DELETE, loan.user_id)]
+    if loan.returned_at is None:
+        release_copy(loan.book_id)
+        changes.append((BOOK, loan.book_id, UPSERT, None))
+    forget_loans(Loan.id == loan.id)
+    record_changes(changes)
+    db.session.delete(loan)
+
+
+def discard_book(book):
+    # The book's loans go with it (cascade), so take them out of the totals
+    forget_loans(Loan.book_id == book.id)
+    adjust_counter('books', -1)
+    record_changes([(BOOK, book.id, DELETE, None)]
+                   + [(LOAN, loan.id, DELETE, loan.user_id) for loan in book.loans]
+                   + [(READING_LIST, entry.id, DELETE, entry.user_id) for entry in book.reading_list])
+    db.session.delete(book)
+
+
+def release_open_loans(user):
+    # Called before a user (and, by cascade, their loans and reading list)
+    # is deleted
+    forget_loans(Loan.user_id == user.id)
+    changes = []
+    for loan in user.loans:
+        if loan.returned_at is None:
+            release_copy(loan.book_id)
+            changes.append((BOOK, loan.book_id, UPSERT, None))
+        changes.append((LOAN, loan.id, DELETE, user.id))
+    changes += [(READING_LIST, entry.id, DELETE, user.id) for entry in user.reading_list]
+    record_changes(changes)
+
+
+def set_copies(book, copies):
+    """Change a locked book's copy count, keeping copies already on loan
+    out."""
+    on_loan = book.copies - book.available_copies
+    if copies < on_loan:
+        raise InventoryError(f'{on_loan} copies are on loan', 409)
+    book.copies = copies
+    book.available_copies = copies - on_loan
+
+
+def parse_copies(value, default=1):
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise InventoryError('copies must be a non-negative integer', 400)
+    return value
@@ -14,6 +14,8 @@ config = context.config
 fileConfig(config.config_file_name)
 logger = logging.getLogger('alembic.env')
 
+MANUAL_SCHEMA_OBJECTS = {'search_vector', 'ix_book_search_vector'}
+
 
 def get_engine():
     try:
@@ -90,9 +92,19 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # the full-text search objects are managed by hand-written migrations,
+    # so keep autogenerate from proposing to drop them
+    def include_object(object, name, type_, reflected, compare_to):
+        if reflected and compare_to is None and (
+                name.startswith('book_fts') or name in MANUAL_SCHEMA_OBJECTS):
+            return False
+        return True
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
@@ -0,0 +1,77 @@
+"""book full-text search
+
+Revision ID: 8c4e2d61a5f3
+Revises: 5448a2df613b
+Create Date: 2026-10-18 09:40:07.118946
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4e2d61a5f3'
+down_revision = '5448a2df613b'
+branch_labels = None
+depends_on = None
+
+
+# The search objects as search.py created them at this revision; later
+# migrations change them, so this one does not import the current ones
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(
+        title, author, genre, content='book', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN
+        INSERT INTO book_fts(rowid, title, author, genre)
+        VALUES (new.id, new.title, new.author, new.genre);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.genre);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.genre);
+        INSERT INTO book_fts(rowid, title, author, genre)
+        VALUES (new.id, new.title, new.author, new.genre);
+    END""",
+    "INSERT INTO book_fts(book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS book_fts_au",
+    "DROP TRIGGER IF EXISTS book_fts_ad",
+    "DROP TRIGGER IF EXISTS book_fts_ai",
+    "DROP TABLE IF EXISTS book_fts",
+]
+
+POSTGRES_DDL = [
+    """ALTER TABLE book ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(author, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(genre, '')), 'C')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_book_search_vector ON book USING GIN (search_vector)",
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS ix_book_search_vector",
+    "ALTER TABLE book DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_dialect):
+    dialect = op.get_bind().dialect.name
+    for statement in statements_by_dialect.get(dialect, []):
+        op.execute(statement)
+
+
+def upgrade():
+    _run({'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL})
+
+
+def downgrade():
+    _run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP})
@@ -0,0 +1,46 @@
+"""loan and reading list indexes
+
+Revision ID: b27d90e4c318
+Revises: 8c4e2d61a5f3
+Create Date: 2026-10-18 10:05:52.640317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b27d90e4c318'
+down_revision = '8c4e2d61a5f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_loan_user_id', 'loan', ['user_id'], unique=False)
+    op.create_index('ix_loan_book_id', 'loan', ['book_id'], unique=False)
+    op.create_index(
+        'ix_loan_active_user_book', 'loan', ['user_id', 'book_id'], unique=False,
+        sqlite_where=sa.text('returned_at IS NULL'),
+        postgresql_where=sa.text('returned_at IS NULL'),
+    )
+
+    # Drop duplicate reading list entries, keeping the oldest, so the
+    # unique constraint can be created
+    op.execute(
+        "DELETE FROM reading_list WHERE id NOT IN ("
+        "SELECT MIN(id) FROM reading_list GROUP BY user_id, book_id)"
+    )
+    with op.batch_alter_table('reading_list') as batch_op:
+        batch_op.create_unique_constraint('uq_reading_list_user_book', ['user_id', 'book_id'])
+    op.create_index('ix_reading_list_book_id', 'reading_list', ['book_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_reading_list_book_id', table_name='reading_list')
+    with op.batch_alter_table('reading_list') as batch_op:
+        batch_op.drop_constraint('uq_reading_list_user_book', type_='unique')
+
+    op.drop_index('ix_loan_active_user_book', table_name='loan')
+    op.drop_index('ix_loan_book_id', table_name='loan')
+    op.drop_index('ix_loan_user_id', table_name='loan')
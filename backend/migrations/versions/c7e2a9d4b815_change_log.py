@@ -0,0 +1,42 @@
+"""change log
+
+Revision ID: c7e2a9d4b815
+Revises: 0a6d4e8f2c19
+Create Date: 2026-10-18 15:02:41.337105
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2a9d4b815'
+down_revision = '0a6d4e8f2c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('version', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('entity', sa.String(), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('version')
+    )
+    op.create_index('ix_change_log_entity', 'change_log', ['entity', 'entity_id', 'version'], unique=False)
+    head = op.create_table('change_log_head',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('horizon', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(head, [{'id': 1, 'version': 0, 'horizon': 0}])
+
+
+def downgrade():
+    op.drop_table('change_log_head')
+    op.drop_index('ix_change_log_entity', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,59 @@
+"""book copies
+
+Revision ID: d5a0f7e39b24
+Revises: b27d90e4c318
+Create Date: 2026-10-18 11:21:30.774512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a0f7e39b24'
+down_revision = 'b27d90e4c318'
+branch_labels = None
+depends_on = None
+
+
+# The full-text search update trigger, as of this revision
+FTS_UPDATE_TRIGGER = """CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE{columns} ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.genre);
+        INSERT INTO book_fts(rowid, title, author, genre)
+        VALUES (new.id, new.title, new.author, new.genre);
+    END"""
+FTS_INDEXED_COLUMNS = ' OF title, author, genre'
+
+# Batch mode would rebuild `book` on SQLite and drop its full-text search
+# triggers, so columns are added in place and the check constraint is only
+# created where ALTER TABLE supports it (new SQLite databases get it from
+# create_all).
+def upgrade():
+    op.add_column('book', sa.Column('copies', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('book', sa.Column('available_copies', sa.Integer(), server_default='1', nullable=False))
+
+    # Books could be lent to several users at once before, so size each
+    # book's stock to at least its open loans
+    open_loans = "SELECT COUNT(*) FROM loan WHERE loan.book_id = book.id AND loan.returned_at IS NULL"
+    op.execute(f"UPDATE book SET copies = CASE WHEN ({open_loans}) > 1 THEN ({open_loans}) ELSE 1 END")
+    op.execute(f"UPDATE book SET available_copies = copies - ({open_loans})")
+
+    if op.get_bind().dialect.name != 'sqlite':
+        op.create_check_constraint(
+            'ck_book_available_copies', 'book', 'available_copies >= 0 AND available_copies <= copies'
+        )
+    else:
+        # Copy counts change on every loan; only re-index on catalog edits
+        op.execute("DROP TRIGGER IF EXISTS book_fts_au")
+        op.execute(FTS_UPDATE_TRIGGER.format(columns=FTS_INDEXED_COLUMNS))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        op.drop_constraint('ck_book_available_copies', 'book', type_='check')
+    else:
+        op.execute("DROP TRIGGER IF EXISTS book_fts_au")
+        op.execute(FTS_UPDATE_TRIGGER.format(columns=''))
+    op.drop_column('book', 'available_copies')
+    op.drop_column('book', 'copies')
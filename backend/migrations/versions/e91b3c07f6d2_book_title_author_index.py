@@ -0,0 +1,24 @@
+"""book title/author index
+
+Revision ID: e91b3c07f6d2
+Revises: d5a0f7e39b24
+Create Date: 2026-10-18 12:02:14.086330
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91b3c07f6d2'
+down_revision = 'd5a0f7e39b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_book_title_author', 'book', ['title', 'author'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_book_title_author', table_name='book')
@@ -0,0 +1,32 @@
+"""loan overdue tracking
+
+Revision ID: f3c8a1d45e70
+Revises: e91b3c07f6d2
+Create Date: 2026-10-18 12:48:55.390241
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8a1d45e70'
+down_revision = 'e91b3c07f6d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('loan', sa.Column('is_overdue', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('loan', sa.Column('fine_cents', sa.Integer(), server_default='0', nullable=False))
+    op.create_index(
+        'ix_loan_active_due_date', 'loan', ['due_date'], unique=False,
+        sqlite_where=sa.text('returned_at IS NULL'),
+        postgresql_where=sa.text('returned_at IS NULL'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_loan_active_due_date', table_name='loan')
+    op.drop_column('loan', 'fine_cents')
+    op.drop_column('loan', 'is_overdue')
@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from hashing import hasher
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -15,10 +16,10 @@ class User(db.Model):
     reading_list = db.relationship('ReadingList', backref='user', cascade='all, delete-orphan')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.check(self.password_hash, password)
 
     def __repr__(self):
         return f"<User {self.username}>"
@@ -29,6 +30,18 @@ class Book(db.Model):
     title = db.Column(db.String, nullable=False)
     author = db.Column(db.String, nullable=False)
     genre = db.Column(db.String)
+    copies = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Kept in step with open loans by inventory.checkout/checkin
+    available_copies = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __table_args__ = (
+        db.CheckConstraint(
+            'available_copies >= 0 AND available_copies <= copies',
+            name='ck_book_available_copies'
+        ),
+        # Duplicate check for bulk imports
+        db.Index('ix_book_title_author', 'title', 'author'),
+    )
 
     loans = db.relationship('Loan', backref='book', cascade='all, delete-orphan')
     reading_list = db.relationship('ReadingList', backref='book', cascade='all, delete-orphan')
@@ -44,6 +57,26 @@ class Loan(db.Model):
     borrowed_at = db.Column(db.DateTime, default=datetime.utcnow)
     due_date = db.Column(db.DateTime, default=lambda: datetime.utcnow() + timedelta(days=14))
     returned_at = db.Column(db.DateTime)
+    # Maintained by overdue.sweep_overdue and finalised on return
+    is_overdue = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    fine_cents = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_loan_user_id', 'user_id'),
+        db.Index('ix_loan_book_id', 'book_id'),
+        # Open loans only: serves the "already borrowed?" check in create_loan
+        db.Index(
+            'ix_loan_active_user_book', 'user_id', 'book_id',
+            sqlite_where=db.text('returned_at IS NULL'),
+            postgresql_where=db.text('returned_at IS NULL'),
+        ),
+        # Open loans by due date: the overdue sweep and overdue listings
+        db.Index(
+            'ix_loan_active_due_date', 'due_date',
+            sqlite_where=db.text('returned_at IS NULL'),
+            postgresql_where=db.text('returned_at IS NULL'),
+        ),
+    )
 
     def __repr__(self):
         return f"<Loan Book={self.book_id} User={self.user_id}>"
@@ -55,5 +88,56 @@ class ReadingList(db.Model):
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     note = db.Column(db.String)
 
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'book_id', name='uq_reading_list_user_book'),
+        db.Index('ix_reading_list_book_id', 'book_id'),
+    )
+
     def __repr__(self):
         return f"<ReadingList User={self.user_id} Book={self.book_id}>"
+
+
+# Rollups for the admin dashboard, kept current by stats.py
+class StatCounter(db.Model):
+    name = db.Column(db.String, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class BookLoanStat(db.Model):
+    book_id = db.Column(db.Integer, primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+
+class GenreLoanStat(db.Model):
+    genre = db.Column(db.String, primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyLoanStat(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, default=0)
+    returns = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Change feed for clients syncing deltas, written by changes.record_changes
+class ChangeLog(db.Model):
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    entity = db.Column(db.String, nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String, nullable=False)
+    # Owner of a loan or reading-list entry; NULL for catalog changes
+    user_id = db.Column(db.Integer)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Compaction finds superseded entries per row
+        db.Index('ix_change_log_entity', 'entity', 'entity_id', 'version'),
+    )
+
+
+class ChangeLogHead(db.Model):
+    # Single row: the last version handed out, and the oldest `since` the
+    # log can still answer after compaction
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    horizon = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,121 @@
+import base64
+import json
+
+from flask import request, jsonify
+from models import db
+from export import export_format, stream_export
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(payload):
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+    if not isinstance(payload, dict):
+        raise PaginationError('Invalid cursor')
+    return payload
+
+
+def parse_limit(args=None):
+    args = request.args if args is None else args
+    raw = args.get('limit')
+    if raw is None or raw == '':
+        return DEFAULT_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, MAX_LIMIT)
+
+
+def parse_fields(allowed_fields, args=None):
+    # `fields=title,author` projects the response down to those columns;
+    # `id` is always returned because it is the keyset cursor.
+    args = request.args if args is None else args
+    raw = args.get('fields')
+    if not raw:
+        return list(allowed_fields)
+
+    fields = ['id']
+    for name in raw.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in allowed_fields:
+            raise PaginationError(f'Unknown field: {name}')
+        fields.append(name)
+    return fields
+
+
+def keyset_select(model, allowed_fields, filters=(), args=None):
+    """Build the query for one page of `model` rows ordered by id, selecting
+    only the requested columns. Returns (select, limit)."""
+    args = request.args if args is None else args
+    limit = parse_limit(args)
+    fields = parse_fields(allowed_fields, args)
+
+    query = db.select(*[getattr(model, name) for name in fields]).where(*filters)
+
+    cursor = args.get('cursor')
+    if cursor:
+        after_id = decode_cursor(cursor).get('id')
+        if not isinstance(after_id, int):
+            raise PaginationError('Invalid cursor')
+        query = query.where(model.id > after_id)
+
+    # Fetch one extra row to know whether another page exists without a COUNT
+    return query.order_by(model.id).limit(limit + 1), limit
+
+
+def keyset_items(rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({'id': rows[-1].id})
+    return [dict(zip(row._fields, row)) for row in rows], next_cursor
+
+
+def keyset_page(model, allowed_fields, filters=()):
+    """Load one page of `model` rows. Returns (items, next_cursor)."""
+    query, limit = keyset_select(model, allowed_fields, filters)
+    return keyset_items(db.session.execute(query).all(), limit)
+
+
+def paginated_response(items, next_cursor):
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+
+def keyset_response(model, allowed_fields, filters=(), exportable=False):
+    # Exportable listings stream everything as NDJSON/CSV when asked to
+    fmt = export_format() if exportable else None
+    if fmt:
+        try:
+            fields = parse_fields(allowed_fields)
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+        query = db.select(*[getattr(model, name) for name in fields]).where(*filters)
+        return stream_export(query.order_by(model.id), fmt, model.__tablename__)
+
+    try:
+        items, next_cursor = keyset_page(model, allowed_fields, filters)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated_response(items, next_cursor)
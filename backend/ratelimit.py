@@ -0,0 +1,331 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
+
+logger = logging.getLogger('booknest.ratelimit')
+
+KEY_PREFIX = 'booknest:ratelimit:'
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+READ_METHODS = ('GET', 'HEAD')
+# Latency samples lose half their weight every this many seconds, so the
+# average recovers once traffic has been shed even if nothing completes
+LATENCY_HALF_LIFE = 5.0
+LATENCY_WEIGHT = 0.2
+TOO_MANY_REQUESTS = 'Too many requests, please retry shortly'
+TOO_BUSY = 'Server is busy, please retry shortly'
+
+
+def parse_quotas(spec):
+    """'auth=30/minute,books=300/minute' -> {'auth': (0.5, 30), ...}, each
+    quota a (tokens per second, bucket size) pair."""
+    quotas = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        try:
+            name, quota = part.split('=')
+            count, period = quota.split('/')
+            quotas[name.strip()] = (int(count) / PERIODS[period.strip()], int(count))
+        except (KeyError, ValueError):
+            raise ValueError(f'Bad rate limit {part.strip()!r}; expected blueprint=N/second|minute|hour')
+    return quotas
+
+
+def refill(tokens, updated_at, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - updated_at) * rate)
+
+
+class MemoryBuckets:
+    """Per-process buckets; with several workers each grants its own quota."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = refill(tokens, updated_at, now, rate, burst)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > 100000:
+                # Idle buckets are full again; forgetting them changes nothing
+                horizon = now - 3600
+                self._buckets = {k: v for k, v in self._buckets.items() if v[1] > horizon}
+        return allowed, tokens
+
+
+# Refill and take in one round trip, so workers can't both spend the last token
+TAKE_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', ARGV[3])
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+'''
+
+
+class RedisBuckets:
+    """Buckets shared by every worker through a Redis-protocol server."""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATELIMIT_STORAGE_URL points at Redis but the 'redis' package is not installed")
+        self._take = redis.Redis.from_url(url).register_script(TAKE_SCRIPT)
+
+    def take(self, key, rate, burst):
+        allowed, tokens = self._take(keys=[key], args=[rate, burst, time.time()])
+        return bool(allowed), float(tokens)
+
+
+class SQLiteBuckets:
+    """Buckets in a SQLite file shared by the workers on one host, like the
+    catalog cache's SQLite backend."""
+
+    def __init__(self, path):
+        self._path = path
+        self._local = threading.local()
+        self._takes = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connect().execute('CREATE TABLE IF NOT EXISTS ratelimit '
+                                '(key TEXT PRIMARY KEY, tokens REAL, updated_at REAL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM ratelimit WHERE key = ?', (key,)).fetchone()
+            tokens = refill(*row, now, rate, burst) if row else burst
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO ratelimit (key, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            self._takes += 1
+            if self._takes % 10000 == 0:
+                conn.execute('DELETE FROM ratelimit WHERE updated_at < ?', (now - 3600,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, tokens
+
+
+def default_bucket_url(cache_url):
+    """Redis when the cache is on Redis, else per-process buckets. A
+    SQLite file would take its write lock on every request and serialize
+    the workers on the limiter itself, so it is only used when
+    RATELIMIT_STORAGE_URL asks for it."""
+    if urlparse(cache_url or '').scheme in ('redis', 'rediss', 'unix'):
+        return cache_url
+    return 'memory://'
+
+
+def make_bucket_store(url):
+    parsed = urlparse(url)
+    if parsed.scheme == 'memory':
+        return MemoryBuckets()
+    if parsed.scheme in ('redis', 'rediss', 'unix'):
+        return RedisBuckets(url)
+    if parsed.scheme == 'sqlite':
+        return SQLiteBuckets(parsed.path[1:])
+    raise ValueError(f'Unsupported RATELIMIT_STORAGE_URL: {url}')
+
+
+def client_ip(remote_addr, forwarded_for, proxy_hops):
+    """The client address, taken `proxy_hops` entries from the right of
+    X-Forwarded-For when the app runs behind that many trusted proxies."""
+    if proxy_hops and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',')]
+        if len(hops) >= proxy_hops:
+            return hops[-proxy_hops]
+    return remote_addr or 'unknown'
+
+
+class RateLimiter:
+    """Token-bucket quotas per blueprint, plus load shedding.
+
+    Each blueprint has a bucket per client, refilled at its RATELIMITS
+    quota; the client is the JWT identity, or the IP address for requests
+    without a valid token (login, register). A request that finds its
+    bucket empty gets 429 with Retry-After. Buckets live in
+    RATELIMIT_STORAGE_URL; by default that is CACHE_URL when it is Redis,
+    shared by every worker, and otherwise memory://, where each worker
+    grants its own quota (so a host allows quota x workers).
+
+    Shedding is per worker: while SHED_MAX_IN_FLIGHT requests are already
+    running, or the decaying average latency is above SHED_LATENCY_MS,
+    reads outside RATELIMIT_PRIORITY_BLUEPRINTS get an immediate 503, so
+    circulation and login keep the capacity that is left. The in-flight
+    limit needs a worker that runs requests concurrently: gunicorn with
+    --threads (gthread), or uvicorn asgi:app. A sync worker runs one
+    request at a time, so only the latency trigger applies there; the
+    first request logs a warning when that is the case.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.quotas = {}
+        self.priority = ()
+        self.proxy_hops = 0
+        self.store = MemoryBuckets()
+        self.max_in_flight = 0
+        self.max_latency = 0.0
+        self.in_flight = 0
+        self._latency = 0.0
+        self._observed_at = 0.0
+        self._server_checked = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        app.extensions['ratelimit'] = self
+        if not self.enabled:
+            return
+
+        self.quotas = parse_quotas(app.config.get('RATELIMITS', ''))
+        self.priority = tuple(app.config.get('RATELIMIT_PRIORITY_BLUEPRINTS', ('loans', 'auth')))
+        self.proxy_hops = app.config.get('RATELIMIT_PROXY_HOPS', 0)
+        self.store = make_bucket_store(app.config.get('RATELIMIT_STORAGE_URL')
+                                       or default_bucket_url(app.config.get('CACHE_URL')))
+        self.max_in_flight = app.config.get('SHED_MAX_IN_FLIGHT', 16)
+        self.max_latency = app.config.get('SHED_LATENCY_MS', 1000) / 1000
+        self._server_checked = False
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    # --- shedding ---
+
+    def latency(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self._latency * 0.5 ** ((now - self._observed_at) / LATENCY_HALF_LIFE)
+
+    def overloaded(self):
+        return ((self.max_in_flight and self.in_flight >= self.max_in_flight)
+                or (self.max_latency and self.latency() >= self.max_latency))
+
+    def should_shed(self, blueprint, method):
+        return method in READ_METHODS and blueprint not in self.priority and self.overloaded()
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+        return time.monotonic()
+
+    def finished(self, started):
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            current = self.latency(now)
+            self._latency = current + (now - started - current) * LATENCY_WEIGHT
+            self._observed_at = now
+
+    # --- quotas ---
+
+    def take(self, blueprint, client):
+        """None if the request may go ahead, else seconds until it may."""
+        quota = self.quotas.get(blueprint) or self.quotas.get('default')
+        if quota is None:
+            return None
+        rate, burst = quota
+        try:
+            allowed, tokens = self.store.take(f'{KEY_PREFIX}{blueprint}:{client}', rate, burst)
+        except Exception:
+            # Fail open: an unreachable store shouldn't take the API down
+            logger.warning('Rate limit store unavailable', exc_info=True)
+            return None
+        if allowed:
+            return None
+        return max(1, int((1 - tokens) / rate + 0.999))
+
+    def client(self):
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except (JWTExtendedException, PyJWTError):
+            # The view reports the bad token; count it against the address
+            identity = None
+        if identity is not None:
+            return f'user:{identity}'
+        return 'ip:' + client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'), self.proxy_hops)
+
+    # --- request hooks ---
+
+    def _check_server(self):
+        self._server_checked = True
+        if self.max_in_flight and not request.environ.get('wsgi.multithread'):
+            logger.warning('SHED_MAX_IN_FLIGHT=%s has no effect: this worker serves one request at '
+                           'a time. Use gunicorn --threads or uvicorn asgi:app for in-flight '
+                           'shedding; SHED_LATENCY_MS still applies.', self.max_in_flight)
+
+    def _before_request(self):
+        if request.method == 'OPTIONS':
+            return None
+        if not self._server_checked:
+            self._check_server()
+        blueprint = request.blueprint or 'default'
+        if self.should_shed(blueprint, request.method):
+            return too_busy(1)
+        retry_after = self.take(blueprint, self.client())
+        if retry_after is not None:
+            return too_many_requests(retry_after)
+        g._ratelimit_started = self.started()
+        return None
+
+    def _teardown_request(self, exc):
+        started = g.pop('_ratelimit_started', None)
+        if started is not None:
+            self.finished(started)
+
+
+limiter = RateLimiter()
+
+
+def too_many_requests(retry_after):
+    response = jsonify({'error': TOO_MANY_REQUESTS})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def too_busy(retry_after):
+    response = jsonify({'error': TOO_BUSY})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
@@ -0,0 +1,399 @@
+import fcntl
+import heapq
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Book, BookLoanStat, Loan, ReadingList
+
+logger = logging.getLogger('booknest.recommend')
+
+DEFAULT_RECOMMENDATIONS = 10
+MAX_RECOMMENDATIONS = 50
+DEFAULT_REFRESH_SECONDS = 300
+DEFAULT_MAX_BASKET = 100
+
+MAGIC = b'BNRECO01'
+# magic, build time, max basket, then the item counts of the eight arrays
+HEADER = struct.Struct('<8sdI8Q')
+# book ids, popularity, row offsets, neighbour ids, neighbour counts,
+# user ids, basket offsets, basket books
+TYPECODES = 'iiIiiiIi'
+
+_started_at = time.time()
+
+
+def build_snapshot(interactions, max_basket=DEFAULT_MAX_BASKET, built_at=None):
+    """Serialize the co-occurrence matrix of (user_id, book_id) pairs,
+    oldest first, into the snapshot file layout.
+
+    A user's basket is every book they have borrowed or put on their
+    reading list (the latest `max_basket` of them). Two books co-occur once
+    for each basket holding both. Rows are stored CSR-style: sorted book
+    ids, and for each an offset into parallel neighbour-id and count
+    arrays, so a lookup is a bisect and a slice.
+    """
+    baskets = {}
+    for user_id, book_id in interactions:
+        basket = baskets.setdefault(user_id, {})
+        basket.pop(book_id, None)
+        basket[book_id] = None
+
+    counts = {}
+    popularity = {}
+    for user_id, basket in baskets.items():
+        books = baskets[user_id] = list(basket)[-max_basket:]
+        for i, a in enumerate(books):
+            popularity[a] = popularity.get(a, 0) + 1
+            row_a = counts.setdefault(a, {})
+            for b in books[i + 1:]:
+                row_a[b] = row_a.get(b, 0) + 1
+                row_b = counts.setdefault(b, {})
+                row_b[a] = row_b.get(a, 0) + 1
+
+    book_ids = sorted(popularity)
+    row_offsets = array('I', [0])
+    neighbour_ids = array('i')
+    neighbour_counts = array('i')
+    for book_id in book_ids:
+        row = counts.get(book_id, {})
+        neighbour_ids.extend(row.keys())
+        neighbour_counts.extend(row.values())
+        row_offsets.append(len(neighbour_ids))
+
+    user_ids = sorted(baskets)
+    basket_offsets = array('I', [0])
+    basket_books = array('i')
+    for user_id in user_ids:
+        basket_books.extend(baskets[user_id])
+        basket_offsets.append(len(basket_books))
+
+    arrays = [array('i', book_ids), array('i', (popularity[b] for b in book_ids)), row_offsets,
+              neighbour_ids, neighbour_counts, array('i', user_ids), basket_offsets, basket_books]
+    built_at = time.time() if built_at is None else built_at
+    header = HEADER.pack(MAGIC, built_at, max_basket, *(len(a) for a in arrays))
+    return b''.join([header, *(a.tobytes() for a in arrays)])
+
+
+class MatrixSnapshot:
+    """A read-only, memory-mapped co-occurrence matrix, shared by every
+    worker on the host through the page cache, like the suggestion index."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.built_at, self.max_basket, *lengths = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a recommendation matrix')
+
+        view = memoryview(self._map)
+        start = HEADER.size
+        arrays = []
+        for typecode, length in zip(TYPECODES, lengths):
+            size = length * array(typecode).itemsize
+            arrays.append(view[start:start + size].cast(typecode))
+            start += size
+        (self.book_ids, self._popularity, self._row_offsets, self._neighbour_ids,
+         self._neighbour_counts, self.user_ids, self._basket_offsets, self._basket_books) = arrays
+
+    @staticmethod
+    def _find(ids, key):
+        i = bisect_left(ids, key)
+        return i if i < len(ids) and ids[i] == key else None
+
+    def popularity(self, book_id):
+        i = self._find(self.book_ids, book_id)
+        return 0 if i is None else self._popularity[i]
+
+    def neighbours(self, book_id):
+        i = self._find(self.book_ids, book_id)
+        if i is None:
+            return ()
+        start, end = self._row_offsets[i], self._row_offsets[i + 1]
+        return zip(self._neighbour_ids[start:end], self._neighbour_counts[start:end])
+
+    def basket(self, user_id):
+        i = self._find(self.user_ids, user_id)
+        if i is None:
+            return []
+        return self._basket_books[self._basket_offsets[i]:self._basket_offsets[i + 1]].tolist()
+
+
+class Deltas:
+    """Interactions recorded in this worker on top of a snapshot: the
+    co-occurrences, popularity and basket additions they add, kept as small
+    dicts until the next snapshot, which includes them, replaces them."""
+
+    def __init__(self, base, max_basket):
+        self.base = base
+        self.max_basket = max_basket
+        self.pairs = {}
+        self.popularity = {}
+        self.added = {}
+
+    def basket(self, user_id):
+        base = self.base.basket(user_id) if self.base is not None else []
+        return (base + self.added.get(user_id, []))[-self.max_basket:]
+
+    def add(self, user_id, book_id):
+        """Count a new interaction; repeats of a book already in the basket
+        change nothing."""
+        basket = self.basket(user_id)
+        if book_id in basket:
+            return
+        for other in basket:
+            self._bump(book_id, other)
+            self._bump(other, book_id)
+        self.popularity[book_id] = self.popularity.get(book_id, 0) + 1
+        self.added.setdefault(user_id, []).append(book_id)
+
+    def _bump(self, a, b):
+        row = self.pairs.setdefault(a, {})
+        row[b] = row.get(b, 0) + 1
+
+    def total_popularity(self, book_id):
+        base = self.base.popularity(book_id) if self.base is not None else 0
+        return base + self.popularity.get(book_id, 0)
+
+    def neighbours(self, book_id):
+        if self.base is not None:
+            yield from self.base.neighbours(book_id)
+        yield from self.pairs.get(book_id, {}).items()
+
+    def scores(self, books, exclude=()):
+        """Sum of cosine similarities between each candidate and `books`."""
+        scores = {}
+        for a in books:
+            norm_a = self.total_popularity(a)
+            if not norm_a:
+                continue
+            for b, n in self.neighbours(a):
+                scores[b] = scores.get(b, 0.0) + n / math.sqrt(norm_a * self.total_popularity(b))
+        for book_id in exclude:
+            scores.pop(book_id, None)
+        return scores
+
+
+class Recommender:
+    """Co-occurrence matrix behind /books/recommendations.
+
+    The matrix is built offline from the loan and reading-list tables into a
+    snapshot file (RECOMMEND_INDEX_PATH, by default in the instance folder)
+    that every worker memory-maps: by `flask recommend build`, in the
+    background at startup, and in the background once the file is older
+    than RECOMMEND_REFRESH_SECONDS. Builds take a file lock and skip when
+    another worker has just finished one. A request never builds; until the
+    first snapshot exists it gets the most-borrowed books.
+
+    Loans and reading-list additions made in this worker are counted in as
+    deltas as they commit, so a worker's own writes show up immediately and
+    other workers' with the next snapshot. Deltas recorded before a
+    snapshot's build began are dropped when it is swapped in.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._deltas = Deltas(None, DEFAULT_MAX_BASKET)
+        self._log = []
+        self._executor = None
+        self._pid = None
+        self._queued = False
+        self.path = None
+        self.refresh_seconds = DEFAULT_REFRESH_SECONDS
+        self.max_basket = DEFAULT_MAX_BASKET
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = app.config.get('RECOMMEND_INDEX_PATH') or os.path.join(app.instance_path, 'recommend.idx')
+        self.refresh_seconds = app.config.get('RECOMMEND_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)
+        self.max_basket = app.config.get('RECOMMEND_MAX_BASKET', DEFAULT_MAX_BASKET)
+        with self._lock:
+            self._snapshot = None
+            self._deltas = Deltas(None, self.max_basket)
+            self._log = []
+        app.extensions['recommender'] = self
+        if app.config.get('RECOMMEND_BUILD_ON_START', True):
+            self._schedule(app, unless_built_since=_started_at)
+
+    # --- building (never on a request) ---
+
+    def rebuild(self, unless_built_since=None):
+        """Build the snapshot from the database. Needs an app context.
+
+        With `unless_built_since`, skip the build if another process has
+        written the file since then.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if unless_built_since is not None and self._mtime() >= unless_built_since:
+                    return
+                built_at = time.time()
+                # Own connection, so the read never belongs to a request's
+                # transaction
+                with db.engine.connect() as conn:
+                    interactions = conn.execute(
+                        db.select(Loan.user_id, Loan.book_id).order_by(Loan.id)
+                    ).all() + conn.execute(
+                        db.select(ReadingList.user_id, ReadingList.book_id).order_by(ReadingList.id)
+                    ).all()
+                data = build_snapshot(interactions, self.max_basket, built_at)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.recommend-')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _schedule(self, app, unless_built_since=None):
+        with self._lock:
+            if self._queued:
+                return
+            self._queued = True
+            # A pool inherited from the parent of a forked worker has no thread
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recommend')
+                self._pid = os.getpid()
+        self._executor.submit(self._background_rebuild, app, unless_built_since)
+
+    def _background_rebuild(self, app, unless_built_since):
+        with app.app_context():
+            try:
+                self.rebuild(unless_built_since)
+            except SQLAlchemyError as e:
+                # e.g. a fresh database before `flask db upgrade`; the next
+                # lookup schedules another build
+                logger.info('Recommendation matrix not built: %s', e)
+            except Exception:
+                logger.exception('Recommendation matrix build failed')
+            finally:
+                with self._lock:
+                    self._queued = False
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    # --- lookups ---
+
+    def deltas(self):
+        """The current snapshot with this worker's deltas on top. Swaps in a
+        newer snapshot file, and schedules a background build when there is
+        none or it is out of date."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        stale_before = time.time() - self.refresh_seconds
+        if stat is None or stat.st_mtime < stale_before:
+            self._schedule(current_app._get_current_object(), unless_built_since=stale_before)
+
+        current = self._snapshot
+        if stat is not None and (current is None or current.identity != (stat.st_ino, stat.st_mtime_ns)):
+            with self._lock:
+                current = self._snapshot
+                if current is None or current.identity != (stat.st_ino, stat.st_mtime_ns):
+                    self._swap(MatrixSnapshot(self.path))
+        return self._deltas
+
+    def _swap(self, snapshot):
+        # Under self._lock. Deltas from before the build read the tables are
+        # in the snapshot already
+        self._snapshot = snapshot
+        self._log = [entry for entry in self._log if entry[0] >= snapshot.built_at]
+        self._deltas = Deltas(snapshot, self.max_basket)
+        for _, user_id, book_id in self._log:
+            self._deltas.add(user_id, book_id)
+
+    def record(self, user_id, book_ids):
+        """Count committed loans or reading-list additions."""
+        now = time.time()
+        with self._lock:
+            for book_id in book_ids:
+                self._log.append((now, user_id, int(book_id)))
+                self._deltas.add(user_id, int(book_id))
+
+    def basket(self, user_id):
+        return self.deltas().basket(user_id)
+
+    def recommend(self, user_id, limit):
+        """Up to `limit` (book_id, score) pairs, best first, excluding books
+        the user already has."""
+        deltas = self.deltas()
+        with self._lock:
+            basket = deltas.basket(user_id)
+            scores = deltas.scores(basket, exclude=basket)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+recommender = Recommender()
+
+
+def popular_books(limit, exclude=()):
+    """Most-borrowed books, for users with little history to go on."""
+    query = db.select(BookLoanStat.book_id).order_by(BookLoanStat.loans.desc(), BookLoanStat.book_id)
+    if exclude:
+        query = query.where(BookLoanStat.book_id.notin_(exclude))
+    return [(book_id, 0.0) for book_id in db.session.execute(query.limit(limit)).scalars()]
+
+
+def book_items(ranked, limit):
+    # Books deleted since the last build are still in the matrix; they
+    # drop out here
+    books = {row.id: row for row in db.session.execute(
+        db.select(Book.id, Book.title, Book.author, Book.genre)
+        .where(Book.id.in_([book_id for book_id, _ in ranked]))
+    )}
+    items = []
+    for book_id, score in ranked:
+        row = books.get(book_id)
+        if row is not None:
+            items.append({**row._asdict(), 'score': round(score, 4)})
+            if len(items) == limit:
+                break
+    return items
+
+
+def recommendations(user_id, limit):
+    """The user's top `limit` books by similarity to their own, topped up
+    with the most-borrowed books when there are too few."""
+    items = book_items(recommender.recommend(user_id, limit * 2), limit)
+    if len(items) < limit:
+        seen = {item['id'] for item in items}
+        seen.update(recommender.basket(user_id))
+        items += book_items(popular_books(limit, exclude=seen), limit - len(items))
+    return items
+
+
+recommend_cli = AppGroup('recommend', help='Recommendation matrix commands.')
+
+
+@recommend_cli.command('build')
+def build_command():
+    """Rebuild the co-occurrence matrix. Run from cron, or let the workers
+    rebuild it every RECOMMEND_REFRESH_SECONDS."""
+    started = time.perf_counter()
+    recommender.rebuild()
+    snapshot = MatrixSnapshot(recommender.path)
+    click.echo(f'Built {recommender.path}: {len(snapshot.book_ids)} books, '
+               f'{len(snapshot.user_ids)} users in {time.perf_counter() - started:.1f}s.')
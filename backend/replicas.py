@@ -0,0 +1,159 @@
+import logging
+import random
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql.dml import UpdateBase
+
+from catalog_cache import MemoryBackend, make_backend
+
+logger = logging.getLogger('booknest.replicas')
+
+STICKY_PREFIX = 'booknest:sticky:'
+READ_METHODS = ('GET', 'HEAD')
+
+
+class StickyWrites:
+    """Users who wrote within the last few seconds, whose reads must see
+    those writes. Kept in the CACHE_URL store so every worker agrees. The
+    memory:// store is process-local, so it is only used when there are no
+    replicas to route around."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = {}
+        self.backend = MemoryBackend()
+
+    def mark(self, user_id, seconds):
+        if isinstance(self.backend, MemoryBackend):
+            with self._lock:
+                self._local[user_id] = time.monotonic() + seconds
+        else:
+            self.backend.set(STICKY_PREFIX + str(user_id), b'1', seconds)
+
+    def active(self, user_id):
+        if isinstance(self.backend, MemoryBackend):
+            return self._local.get(user_id, 0.0) > time.monotonic()
+        return self.backend.get(STICKY_PREFIX + str(user_id)) is not None
+
+
+class ReplicaRouter:
+    """Sends reads to the replicas in SQLALCHEMY_BINDS, writes to the primary.
+
+    A GET or HEAD request reads from one healthy replica, picked at random,
+    unless its user wrote within REPLICA_STICKY_SECONDS (read-your-writes)
+    or the view asked for the primary. Other requests, and anything outside
+    a request (CLI, background rebuilds), use the primary. A replica that
+    raises OperationalError is skipped for REPLICA_RETRY_SECONDS and the
+    request is run again on the primary.
+
+    With no replicas configured every read goes to the primary as before.
+    Locally, a copy of the SQLite file works as a replica:
+
+        sqlite3 instance/booknest.db ".backup instance/replica.db"
+        DATABASE_REPLICA_URLS=sqlite:///$PWD/instance/replica.db flask run
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._down_until = {}
+        self.keys = ()
+        self.sticky = StickyWrites()
+        self.sticky_seconds = 10
+        self.retry_seconds = 30
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.keys = tuple(key for key in app.config.get('SQLALCHEMY_BINDS', {})
+                          if key.startswith('replica'))
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 10)
+        self.retry_seconds = app.config.get('REPLICA_RETRY_SECONDS', 30)
+        # Its own table, so catalog entries never evict a user's mark
+        self.sticky.backend = make_backend(app.config.get('CACHE_URL', 'memory://'), None, table='sticky')
+        if self.keys and isinstance(self.sticky.backend, MemoryBackend):
+            # A write's follow-up read can land on another worker, which
+            # would not know to avoid the replicas
+            raise RuntimeError('DATABASE_REPLICA_URLS needs a CACHE_URL shared by all workers '
+                               '(sqlite:///path or redis://...), not memory://')
+        self._down_until = {}
+        app.extensions['replica_router'] = self
+        if self.keys:
+            app.after_request(self._after_request)
+            app.register_error_handler(OperationalError, self._replica_failed)
+
+    def healthy(self):
+        now = time.monotonic()
+        return [key for key in self.keys if self._down_until.get(key, 0.0) <= now]
+
+    def mark_down(self, key):
+        with self._lock:
+            self._down_until[key] = time.monotonic() + self.retry_seconds
+
+    def pick(self, user_id=None):
+        """A replica bind key for a read by `user_id`, or None for the
+        primary."""
+        if user_id is not None and self.sticky.active(user_id):
+            return None
+        healthy = self.healthy()
+        return random.choice(healthy) if healthy else None
+
+    def mark_sticky(self, user_id):
+        self.sticky.mark(user_id, self.sticky_seconds)
+
+    def use_primary(self):
+        """Read from the primary for the rest of this request."""
+        if has_request_context():
+            g._db_replica = None
+
+    def read_bind(self):
+        if not self.keys or not has_request_context():
+            return None
+        if '_db_replica' not in g:
+            g._db_replica = self.pick(_identity()) if request.method in READ_METHODS else None
+        return g._db_replica
+
+    def _after_request(self, response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            user_id = _identity()
+            if user_id is not None:
+                self.mark_sticky(user_id)
+        return response
+
+    def _replica_failed(self, e):
+        key = g.get('_db_replica')
+        if key is None:
+            raise e
+        logger.warning('Replica %s failed, reading from the primary for %ss: %s', key, self.retry_seconds, e)
+        self.mark_down(key)
+        current_app.extensions['sqlalchemy'].session.rollback()
+        g._db_replica = None
+        # Reads are safe to repeat; run the view again on the primary
+        return current_app.view_functions[request.endpoint](**request.view_args)
+
+
+replica_router = ReplicaRouter()
+
+
+def _identity():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        # The view isn't behind @jwt_required
+        return None
+
+
+class RoutingSession(Session):
+    """db.session, with reads during GET requests sent to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # Flushes and DML statements always go to the primary
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase):
+            key = replica_router.read_bind()
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
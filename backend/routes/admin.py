@@ -1,36 +1,34 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import csv
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from models import db, User, Loan, Book
-from functools import wraps
-from flask_bcrypt import Bcrypt
+from authz import admin_cache, admin_required
+from hashing import hasher
+from catalog_cache import catalog_cache
+from suggest import suggest_index
+from inventory import (
+    InventoryError, begin_write, discard_book, discard_loan, lock_book, lock_loan, parse_copies,
+    release_open_loans, set_copies,
+)
+from pagination import keyset_response
+from export import export_format, stream_export
+from overdue import assess_fine, overdue_filter
+from stats import adjust_counter, dashboard_stats
+from changes import BOOK, record_change
+from catalog_import import DEFAULT_BATCH_SIZE, FORMATS, MAX_BATCH_SIZE, import_books, iter_records, text_lines
+from routes.books import BOOK_FIELDS
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
-bcrypt = Bcrypt()
-
-# Restrict to admin users only
-def admin_required(fn):
-    @wraps(fn)
-    @jwt_required()
-    def wrapper(*args, **kwargs):
-        current_user = User.query.get(get_jwt_identity())
-        if not current_user or not current_user.is_admin:
-            return jsonify({"error": "Admin access required"}), 403
-        return fn(*args, **kwargs)
-    return wrapper
+USER_FIELDS = ('id', 'username', 'email', 'is_admin')
+ADMIN_BOOK_FIELDS = BOOK_FIELDS + ('copies', 'available_copies')
 
 # View all users
 @admin_bp.route('/users', methods=['GET'])
 @admin_required
 def get_all_users():
-    users = User.query.all()
-    return jsonify([
-        {
-            "id": u.id,
-            "username": u.username,
-            "email": u.email,
-            "is_admin": u.is_admin
-        } for u in users
-    ]), 200
+    return keyset_response(User, USER_FIELDS, exportable=True)
 
 # Add a new user
 @admin_bp.route('/users', methods=['POST'])
@@ -45,13 +43,18 @@ def add_user():
     if not username or not email or not password:
         return jsonify({"error": "Username, email, and password are required"}), 400
 
+    # Hash before taking the write lock, as register does
+    hashed_pw = hasher.hash(password)
+
+    begin_write()
     if User.query.filter((User.username == username) | (User.email == email)).first():
         return jsonify({"error": "Username or email already exists"}), 409
 
-    hashed_pw = bcrypt.generate_password_hash(password).decode('utf-8')
     new_user = User(username=username, email=email, password_hash=hashed_pw, is_admin=is_admin)
     db.session.add(new_user)
+    adjust_counter('users', 1)
     db.session.commit()
+    admin_cache.invalidate()
 
     return jsonify({"message": "User added successfully"}), 201
 
@@ -63,36 +66,78 @@ def delete_user(id):
     if not user:
         return jsonify({"error": "User not found"}), 404
 
+    release_open_loans(user)
+    adjust_counter('users', -1)
     db.session.delete(user)
     db.session.commit()
+    admin_cache.invalidate()
     return jsonify({"message": "User deleted"}), 200
 
-# View all loans
+LOAN_EXPORT_COLUMNS = [
+    'id', 'user_email', 'book_title', 'borrowed_at', 'due_date', 'returned_at', 'fine_cents'
+]
+LOAN_STATUSES = ('active', 'overdue', 'returned')
+
+
+def loan_row(row, now=None):
+    # Open loans are fined as of now; returned ones keep their final fine
+    if row.returned_at is None:
+        fine_cents = assess_fine(row.due_date, now or datetime.utcnow())
+    else:
+        fine_cents = row.fine_cents
+    return {
+        "id": row.id,
+        "user_email": row.user_email or "Unknown",
+        "book_title": row.book_title or "Unknown",
+        "borrowed_at": row.borrowed_at.isoformat() if row.borrowed_at else None,
+        "due_date": row.due_date.isoformat() if row.due_date else None,
+        "returned_at": row.returned_at.isoformat() if row.returned_at else None,
+        "fine_cents": fine_cents
+    }
+
+# View all loans, optionally ?status=active|overdue|returned
+# (?format=ndjson|csv or Accept: application/x-ndjson streams)
 @admin_bp.route("/loans", methods=["GET"])
 @admin_required
 def get_all_loans():
-    loans = Loan.query.all()
-    return jsonify([
-        {
-            "id": loan.id,
-            "user_email": loan.user.email if loan.user else "Unknown",
-            "book_title": loan.book.title if loan.book else "Unknown",
-            "borrowed_at": loan.borrowed_at.isoformat() if loan.borrowed_at else None,
-            "due_date": loan.due_date.isoformat() if loan.due_date else None,
-            "returned_at": loan.returned_at.isoformat() if loan.returned_at else None
-        }
-        for loan in loans
-    ]), 200
+    status = request.args.get('status')
+    if status and status not in LOAN_STATUSES:
+        return jsonify({"error": f"status must be one of {', '.join(LOAN_STATUSES)}"}), 400
+
+    # Outer joins keep loans whose user or book row is missing
+    query = (
+        db.select(
+            Loan.id, Loan.borrowed_at, Loan.due_date, Loan.returned_at, Loan.fine_cents,
+            User.email.label('user_email'), Book.title.label('book_title')
+        )
+        .outerjoin(User, Loan.user_id == User.id)
+        .outerjoin(Book, Loan.book_id == Book.id)
+        .order_by(Loan.id)
+    )
+    if status == 'overdue':
+        query = query.where(*overdue_filter(datetime.utcnow()))
+    elif status == 'active':
+        query = query.where(Loan.returned_at.is_(None))
+    elif status == 'returned':
+        query = query.where(Loan.returned_at.is_not(None))
+
+    fmt = export_format()
+    if fmt:
+        return stream_export(query, fmt, 'loans', loan_row, LOAN_EXPORT_COLUMNS)
+
+    rows = db.session.execute(query).all()
+    return jsonify([loan_row(row) for row in rows]), 200
 
 # Delete a loan
 @admin_bp.route('/loans/<int:id>', methods=['DELETE'])
 @admin_required
 def delete_loan(id):
-    loan = Loan.query.get(id)
+    loan = lock_loan(id)
     if not loan:
+        db.session.rollback()
         return jsonify({"error": "Loan not found"}), 404
 
-    db.session.delete(loan)
+    discard_loan(loan)
     db.session.commit()
     return jsonify({"message": "Loan deleted"}), 200
 
@@ -108,12 +153,49 @@ def add_book():
     if not title or not author:
         return jsonify({"error": "Title and author are required"}), 400
 
-    new_book = Book(title=title, author=author, genre=genre)
+    try:
+        copies = parse_copies(data.get('copies'))
+    except InventoryError as e:
+        return jsonify({"error": e.message}), e.status
+
+    new_book = Book(title=title, author=author, genre=genre, copies=copies, available_copies=copies)
     db.session.add(new_book)
+    db.session.flush()
+    adjust_counter('books', 1)
+    record_change(BOOK, new_book.id)
     db.session.commit()
+    catalog_cache.bump_version()
+    suggest_index.refresh_soon()
 
     return jsonify({"message": "Book added successfully"}), 201
 
+# Bulk import books from a streamed CSV or JSONL upload
+@admin_bp.route('/books/import', methods=['POST'])
+@admin_required
+def import_books_upload():
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'jsonl' if request.mimetype in ('application/x-ndjson', 'application/jsonl') else 'csv'
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(FORMATS)}"}), 400
+
+    batch_size = request.args.get('batch_size', DEFAULT_BATCH_SIZE, type=int)
+    if not batch_size or not 1 <= batch_size <= MAX_BATCH_SIZE:
+        return jsonify({"error": f"batch_size must be between 1 and {MAX_BATCH_SIZE}"}), 400
+
+    # The body is read incrementally while progress lines are streamed back
+    @stream_with_context
+    def progress():
+        records = iter_records(text_lines(request.stream), fmt)
+        try:
+            for stats in import_books(records, batch_size):
+                yield json.dumps(stats.as_dict()) + "\n"
+        except (UnicodeDecodeError, csv.Error) as e:
+            db.session.rollback()
+            yield json.dumps({"error": f"Could not parse upload: {e}"}) + "\n"
+
+    return Response(progress(), status=200, mimetype='application/x-ndjson')
+
 # Update a user
 @admin_bp.route('/users/<int:id>', methods=['PATCH'])
 @admin_required
@@ -128,14 +210,16 @@ def update_user(id):
     user.is_admin = data.get("is_admin", user.is_admin)
 
     db.session.commit()
+    admin_cache.invalidate()
     return jsonify({"message": "User updated successfully"}), 200
 
 # Update a book
 @admin_bp.route('/books/<int:id>', methods=['PATCH'])
 @admin_required
 def update_book(id):
-    book = Book.query.get(id)
+    book = lock_book(id)
     if not book:
+        db.session.rollback()
         return jsonify({"error": "Book not found"}), 404
 
     data = request.get_json()
@@ -143,28 +227,45 @@ def update_book(id):
     book.author = data.get("author", book.author)
     book.genre = data.get("genre", book.genre)
 
+    if "copies" in data:
+        try:
+            set_copies(book, parse_copies(data["copies"]))
+        except InventoryError as e:
+            db.session.rollback()
+            return jsonify({"error": e.message}), e.status
+
+    record_change(BOOK, book.id)
     db.session.commit()
+    catalog_cache.bump_version()
+    suggest_index.refresh_soon()
     return jsonify({"message": "Book updated successfully"}), 200
 
 #  Delete a book
 @admin_bp.route('/books/<int:id>', methods=['DELETE'])
 @admin_required
 def delete_book(id):
-    book = Book.query.get(id)
+    book = lock_book(id)
     if not book:
+        db.session.rollback()
         return jsonify({"error": "Book not found"}), 404
 
-    db.session.delete(book)
+    discard_book(book)
     db.session.commit()
+    catalog_cache.bump_version()
+    suggest_index.refresh_soon()
     return jsonify({"message": "Book deleted successfully"}), 200
 
 @admin_bp.route('/books', methods=['GET'])
 @admin_required
 def get_all_books():
-    books = Book.query.all()
-    return jsonify([{
-        "id": b.id,
-        "title": b.title,
-        "author": b.author,
-        "genre": b.genre
-    } for b in books]), 200
+    return keyset_response(Book, ADMIN_BOOK_FIELDS, exportable=True)
+
+# Dashboard totals and charts, served from the rollup tables
+@admin_bp.route('/stats', methods=['GET'])
+@admin_required
+def get_stats():
+    top = request.args.get('top', 10, type=int)
+    days = request.args.get('days', 30, type=int)
+    if not top or not days or top < 1 or days < 1 or top > 100 or days > 366:
+        return jsonify({"error": "top must be 1-100 and days 1-366"}), 400
+    return jsonify(dashboard_stats(top, days)), 200
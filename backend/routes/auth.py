@@ -1,9 +1,10 @@
 from flask import Blueprint, request, jsonify
 from models import db, User
-from flask_bcrypt import Bcrypt
 from flask_jwt_extended import create_access_token
+from hashing import HashingBusy, hasher
+from inventory import begin_write
+from stats import adjust_counter
 
-bcrypt = Bcrypt()
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 
@@ -26,12 +27,17 @@ def register():
     if not username or not email or not password:
         return jsonify({"error": "All fields (username, email, password) are required"}), 400
 
+    # Hash before taking the write lock, so a signup burst doesn't queue
+    # every other writer behind bcrypt
+    hashed_pw = hasher.hash(password)
+
+    begin_write()
     if User.query.filter((User.username == username) | (User.email == email)).first():
         return jsonify({"error": "Username or email already exists"}), 409
 
-    hashed_pw = bcrypt.generate_password_hash(password).decode('utf-8')
     new_user = User(username=username, email=email, password_hash=hashed_pw)
     db.session.add(new_user)
+    adjust_counter('users', 1)
     db.session.commit()
 
     return jsonify({"message": "User registered successfully"}), 201
@@ -51,8 +57,29 @@ def login():
 
     user = User.query.filter_by(email=email).first()
 
-    if user and bcrypt.check_password_hash(user.password_hash, password):
-        token = create_access_token(identity=user.id)
+    if user and hasher.check(user.password_hash, password):
+        # Upgrade hashes made with an outdated cost factor; best effort only
+        if hasher.needs_rehash(user.password_hash):
+            try:
+                new_hash = hasher.hash(password)
+            except HashingBusy:
+                new_hash = None
+            if new_hash:
+                # Hashed outside the write lock, as register does; end the
+                # read so the update starts a locked transaction, and skip it
+                # if the password changed in between
+                old_hash, user_id = user.password_hash, user.id
+                db.session.rollback()
+                begin_write()
+                user = db.session.get(User, user_id)
+                if user.password_hash == old_hash:
+                    user.password_hash = new_hash
+                db.session.commit()
+
+        token = create_access_token(
+            identity=user.id,
+            additional_claims={"is_admin": bool(user.is_admin)}
+        )
         return jsonify({
             "token": token,
             "username": user.username,
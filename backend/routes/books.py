@@ -1,56 +1,69 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Book
+from authz import has_admin_access
+from catalog_cache import cached_catalog, catalog_cache
+from inventory import InventoryError, begin_write, discard_book, lock_book, parse_copies
+from stats import adjust_counter
+from changes import BOOK, record_change
+from pagination import PaginationError, keyset_response, paginated_response, parse_limit
+from recommend import DEFAULT_RECOMMENDATIONS, MAX_RECOMMENDATIONS, recommendations
+from search import parse_terms, search_page
+from suggest import parse_suggest_limit, suggest_index
 
 books_bp = Blueprint('books', __name__, url_prefix='/books')
 
-# GET all books (any logged-in user)
+BOOK_FIELDS = ('id', 'title', 'author', 'genre')
+
+# GET books one page at a time (any logged-in user)
 @books_bp.route('/', methods=['GET'])
 @jwt_required()
+@cached_catalog
 def get_books():
-    books = Book.query.all()
-    return jsonify([
-        {
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'genre': book.genre
-        } for book in books
-    ]), 200
-
-# GET books with optional search filters
+    return keyset_response(Book, BOOK_FIELDS)
+
+# GET ranked book search; q matches any field, title/author/genre match one
 @books_bp.route('/search', methods=['GET'])
 @jwt_required()
+@cached_catalog
 def search_books():
-    title = request.args.get('title', '').lower()
-    author = request.args.get('author', '').lower()
-    genre = request.args.get('genre', '').lower()
-
-    query = Book.query
-    if title:
-        query = query.filter(Book.title.ilike(f'%{title}%'))
-    if author:
-        query = query.filter(Book.author.ilike(f'%{author}%'))
-    if genre:
-        query = query.filter(Book.genre.ilike(f'%{genre}%'))
-
-    books = query.all()
-
-    return jsonify([
-        {
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'genre': book.genre
-        } for book in books
-    ]), 200
+    terms = parse_terms()
+    if not terms:
+        return keyset_response(Book, BOOK_FIELDS)
+
+    try:
+        items, next_cursor = search_page(terms)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated_response(items, next_cursor)
+
+# GET typeahead matches for a title or author prefix, e.g. ?q=harry%20po
+@books_bp.route('/suggest', methods=['GET'])
+@jwt_required()
+def suggest_books():
+    try:
+        limit = parse_suggest_limit()
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(suggest_index.suggest(request.args.get('q', ''), limit)), 200
+
+# GET books the current user may like, from what readers of their books also read
+@books_bp.route('/recommendations', methods=['GET'])
+@jwt_required()
+def get_recommendations():
+    limit = DEFAULT_RECOMMENDATIONS
+    try:
+        if request.args.get('limit'):
+            limit = min(parse_limit(), MAX_RECOMMENDATIONS)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(recommendations(get_jwt_identity(), limit)), 200
 
 # POST new book (admin only)
 @books_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_book():
-    claims = get_jwt()
-    if not claims.get("is_admin"):
+    if not has_admin_access():
         return jsonify({'error': 'Admin access required'}), 403
 
     data = request.get_json()
@@ -64,23 +77,36 @@ def create_book():
     if not title or not author or not genre:
         return jsonify({'error': 'All fields (title, author, genre) are required'}), 400
 
-    new_book = Book(title=title, author=author, genre=genre)
+    try:
+        copies = parse_copies(data.get('copies'))
+    except InventoryError as e:
+        return jsonify({'error': e.message}), e.status
+
+    begin_write()
+    new_book = Book(title=title, author=author, genre=genre, copies=copies, available_copies=copies)
     db.session.add(new_book)
+    db.session.flush()
+    adjust_counter('books', 1)
+    record_change(BOOK, new_book.id)
     db.session.commit()
+    catalog_cache.bump_version()
+    suggest_index.refresh_soon()
     return jsonify({'message': 'Book added successfully'}), 201
 
 # DELETE a book (admin only)
 @books_bp.route('/<int:id>', methods=['DELETE'])
 @jwt_required()
 def delete_book(id):
-    claims = get_jwt()
-    if not claims.get("is_admin"):
+    if not has_admin_access():
         return jsonify({'error': 'Admin access required'}), 403
 
-    book = Book.query.get(id)
+    book = lock_book(id)
     if not book:
+        db.session.rollback()
         return jsonify({'error': 'Book not found'}), 404
 
-    db.session.delete(book)
+    discard_book(book)
     db.session.commit()
+    catalog_cache.bump_version()
+    suggest_index.refresh_soon()
     return jsonify({'message': 'Book deleted successfully'}), 200
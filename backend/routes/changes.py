@@ -0,0 +1,40 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from authz import has_admin_access
+from changes import ChangesGone, changes_since, head
+from pagination import PaginationError, parse_limit
+from replicas import replica_router
+
+changes_bp = Blueprint('changes', __name__, url_prefix='/changes')
+
+
+# GET what changed since a version, e.g. /changes?since=120
+# Without `since`, just the current version to start syncing from (read it
+# before fetching the full lists)
+@changes_bp.route('', methods=['GET'])
+@jwt_required()
+def get_changes():
+    # A lagging replica would be behind a client that is up to date, and
+    # its head would turn that into a 410 and a full refetch
+    replica_router.use_primary()
+    since = request.args.get('since')
+    if since is None or since == '':
+        version, _ = head()
+        return jsonify({'version': version, 'changes': [], 'has_more': False}), 200
+
+    try:
+        since = int(since)
+    except ValueError:
+        return jsonify({'error': 'since must be an integer'}), 400
+    try:
+        limit = parse_limit()
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        changes, version, has_more = changes_since(
+            since, get_jwt_identity(), has_admin_access(), limit
+        )
+    except ChangesGone as e:
+        return jsonify({'error': str(e), 'version': e.version}), 410
+    return jsonify({'version': version, 'changes': changes, 'has_more': has_more}), 200
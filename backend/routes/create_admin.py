@@ -1,26 +1,32 @@
 import os
 import sys
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app, db
-from models import User
-from flask_bcrypt import Bcrypt
+from app import create_app
+from hashing import hasher
+from inventory import release_open_loans
+from models import db, User
+from stats import adjust_counter
 
-bcrypt = Bcrypt(app)
+app = create_app()
 
 with app.app_context():
     existing = User.query.filter_by(email="admin@booknest.com").first()
     if existing:
+        # As admin.delete_user does, so the dashboard rollups stay right
+        release_open_loans(existing)
+        adjust_counter('users', -1)
         db.session.delete(existing)
         db.session.commit()
 
-    
+
     admin = User(
         username="admin",
         email="admin@booknest.com",
-        password_hash=bcrypt.generate_password_hash("admin123").decode('utf-8'),
+        password_hash=hasher.hash("admin123"),
         is_admin=True
     )
     db.session.add(admin)
+    adjust_counter('users', 1)
     db.session.commit()
     print("Admin created with bcrypt hash")
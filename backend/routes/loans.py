@@ -1,57 +1,94 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from models import db, Loan, User, Book
-from datetime import datetime, timedelta
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, Loan, Book
+from authz import has_admin_access
+from inventory import (
+    MAX_BATCH_SIZE, InventoryError, checkin, checkin_many, checkout, checkout_many,
+    discard_loan, lock_loan
+)
+from overdue import assess_fine, overdue_filter
+from recommend import recommender
+from serialization import RowSerializer
+from datetime import datetime
 
 loans_bp = Blueprint('loans', __name__, url_prefix='/loans')
 
 
 @loans_bp.route('/', methods=['OPTIONS'])
 @loans_bp.route('/my', methods=['OPTIONS'])
+@loans_bp.route('/overdue', methods=['OPTIONS'])
+@loans_bp.route('/batch', methods=['OPTIONS'])
 @loans_bp.route('/<int:id>', methods=['OPTIONS'])
 def loans_options(id=None):
     return '', 200
 
 
+loan_item = RowSerializer('id', 'user_id', 'book_id', 'borrowed_at', 'returned_at', 'due_date')
+
+
 @loans_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_loans():
-    claims = get_jwt()
-    if not claims.get("is_admin"):
+    if not has_admin_access():
         return jsonify({'error': 'Admin access required'}), 403
 
-    loans = Loan.query.all()
-    return jsonify([
-        {
-            'id': loan.id,
-            'user_id': loan.user_id,
-            'book_id': loan.book_id,
-            'borrowed_at': loan.borrowed_at,
-            'returned_at': loan.returned_at,
-            'due_date': loan.due_date
-        } for loan in loans
-    ]), 200
+    rows = db.session.execute(
+        db.select(
+            Loan.id, Loan.user_id, Loan.book_id, Loan.borrowed_at, Loan.returned_at, Loan.due_date
+        ).order_by(Loan.id)
+    ).all()
+    return jsonify(loan_item.many(rows)), 200
+
+
+def my_loans_select(user_id):
+    # One joined query instead of a lazy loan.book load per row
+    return (
+        db.select(
+            Loan.id, Loan.book_id, Loan.borrowed_at, Loan.returned_at,
+            Book.title, Book.author, Book.genre
+        )
+        .join(Book, Loan.book_id == Book.id)
+        .where(Loan.user_id == user_id)
+        .order_by(Loan.id)
+    )
+
+
+my_loan_item = RowSerializer(
+    'id', 'book_id', 'borrowed_at', 'returned_at', book=('title', 'author', 'genre')
+)
 
 
 @loans_bp.route('/my', methods=['GET'])
 @jwt_required()
 def get_my_loans():
+    rows = db.session.execute(my_loans_select(get_jwt_identity())).all()
+    return jsonify(my_loan_item.many(rows)), 200
+
+overdue_item = RowSerializer(
+    'id', 'book_id', 'borrowed_at', 'due_date', book=('title', 'author', 'genre')
+)
+
+
+# GET the current user's overdue loans with their fines so far
+@loans_bp.route('/overdue', methods=['GET'])
+@jwt_required()
+def get_my_overdue_loans():
     user_id = get_jwt_identity()
-    my_loans = Loan.query.filter_by(user_id=user_id).all()
-
-    return jsonify([
-        {
-            'id': loan.id,
-            'book_id': loan.book_id,
-            'borrowed_at': loan.borrowed_at,
-            'returned_at': loan.returned_at,
-            'book': {
-                'title': loan.book.title,
-                'author': loan.book.author,
-                'genre': loan.book.genre
-            }
-        } for loan in my_loans
-    ]), 200
+    now = datetime.utcnow()
+    rows = db.session.execute(
+        db.select(
+            Loan.id, Loan.book_id, Loan.borrowed_at, Loan.due_date,
+            Book.title, Book.author, Book.genre
+        )
+        .join(Book, Loan.book_id == Book.id)
+        .where(Loan.user_id == user_id, *overdue_filter(now))
+        .order_by(Loan.due_date)
+    ).all()
+
+    items = overdue_item.many(rows)
+    for item in items:
+        item['fine_cents'] = assess_fine(item['due_date'], now)
+    return jsonify(items), 200
 
 @loans_bp.route('/', methods=['POST'])
 @jwt_required()
@@ -66,41 +103,86 @@ def create_loan():
 
     current_user_id = get_jwt_identity()
 
-    book = Book.query.get(book_id)
-    if not book:
-        return jsonify({'error': 'Book not found'}), 404
-
-    existing_loan = Loan.query.filter_by(user_id=current_user_id, book_id=book_id, returned_at=None).first()
-    if existing_loan:
-        return jsonify({'error': 'You already borrowed this book'}), 400
+    try:
+        checkout(current_user_id, book_id)
+    except InventoryError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status
 
-    new_loan = Loan(
-        user_id=current_user_id,
-        book_id=book_id,
-        borrowed_at=datetime.utcnow(),
-        due_date=datetime.utcnow() + timedelta(days=14),
-        returned_at=None
-    )
-    db.session.add(new_loan)
     db.session.commit()
+    recommender.record(current_user_id, [book_id])
     return jsonify({'message': 'Book borrowed successfully'}), 201
 
 
+def parse_batch_ids(data, key):
+    ids = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids:
+        raise InventoryError(f'{key} must be a non-empty list', 400)
+    if len(ids) > MAX_BATCH_SIZE:
+        raise InventoryError(f'At most {MAX_BATCH_SIZE} items per batch', 400)
+    if any(isinstance(i, bool) or not isinstance(i, int) for i in ids):
+        raise InventoryError(f'{key} must contain integer ids', 400)
+    return ids
+
+
+def batch_response(results):
+    succeeded = sum(1 for result in results if 'error' not in result)
+    return jsonify({
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    }), 200
+
+
+# POST borrow several books in one transaction, e.g. {"book_ids": [1, 2, 3]}
+@loans_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def create_loans_batch():
+    try:
+        book_ids = parse_batch_ids(request.get_json(silent=True), 'book_ids')
+    except InventoryError as e:
+        return jsonify({'error': e.message}), e.status
+
+    user_id = get_jwt_identity()
+    results = checkout_many(user_id, book_ids)
+    db.session.commit()
+    recommender.record(user_id, [result['book_id'] for result in results if result['status'] == 201])
+    return batch_response(results)
+
+
+# PATCH return several loans in one transaction, e.g. {"loan_ids": [4, 5]}
+@loans_bp.route('/batch', methods=['PATCH'])
+@jwt_required()
+def return_books_batch():
+    try:
+        loan_ids = parse_batch_ids(request.get_json(silent=True), 'loan_ids')
+    except InventoryError as e:
+        return jsonify({'error': e.message}), e.status
+
+    results = checkin_many(get_jwt_identity(), loan_ids)
+    db.session.commit()
+    return batch_response(results)
+
+
 @loans_bp.route('/<int:id>', methods=['PATCH'])
 @jwt_required()
 def return_book(id):
-    loan = Loan.query.get(id)
+    loan = lock_loan(id)
     if not loan:
+        db.session.rollback()
         return jsonify({'error': 'Loan not found'}), 404
 
     current_user_id = get_jwt_identity()
     if loan.user_id != current_user_id:
+        db.session.rollback()
         return jsonify({'error': 'Not authorized to return this book'}), 403
 
-    if loan.returned_at:
-        return jsonify({'error': 'Book already returned'}), 400
+    try:
+        checkin(loan)
+    except InventoryError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status
 
-    loan.returned_at = datetime.utcnow()
     db.session.commit()
     return jsonify({'message': 'Book returned successfully'}), 200
 
@@ -108,16 +190,17 @@ def return_book(id):
 @loans_bp.route('/<int:id>', methods=['DELETE'])
 @jwt_required()
 def delete_loan(id):
-    loan = Loan.query.get(id)
+    loan = lock_loan(id)
     if not loan:
+        db.session.rollback()
         return jsonify({'error': 'Loan not found'}), 404
 
     current_user_id = get_jwt_identity()
-    claims = get_jwt()
 
-    if loan.user_id != current_user_id and not claims.get("is_admin"):
+    if loan.user_id != current_user_id and not has_admin_access():
+        db.session.rollback()
         return jsonify({'error': 'Not authorized to delete this loan'}), 403
 
-    db.session.delete(loan)
+    discard_loan(loan)
     db.session.commit()
     return jsonify({'message': 'Loan deleted successfully'}), 200
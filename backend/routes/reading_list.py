@@ -1,6 +1,11 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
 from models import db, ReadingList, Book
+from inventory import begin_write
+from recommend import recommender
+from changes import DELETE, READING_LIST, record_change
+from serialization import RowSerializer
 
 reading_list_bp = Blueprint('reading_list', __name__, url_prefix='/reading-list')
 
@@ -27,6 +32,7 @@ def add_to_reading_list():
     if not book_id:
         return jsonify({'error': 'book_id is required'}), 400
 
+    begin_write()
     book = Book.query.get(book_id)
     if not book:
         return jsonify({'error': 'Book not found'}), 404
@@ -37,32 +43,43 @@ def add_to_reading_list():
 
     reading = ReadingList(user_id=user_id, book_id=book_id, note=note)
     db.session.add(reading)
-    db.session.commit()
+    try:
+        db.session.flush()
+        record_change(READING_LIST, reading.id, user_id=user_id)
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request added the same book first
+        db.session.rollback()
+        return jsonify({'error': 'Book already in your reading list'}), 409
 
+    recommender.record(user_id, [book_id])
     return jsonify({'message': 'Book added to reading list'}), 201
 
 
+def reading_list_select(user_id):
+    # One joined query instead of a lazy item.book load per row
+    return (
+        db.select(
+            ReadingList.id, ReadingList.book_id, ReadingList.note,
+            Book.title, Book.author, Book.genre
+        )
+        .join(Book, ReadingList.book_id == Book.id)
+        .where(ReadingList.user_id == user_id)
+        .order_by(ReadingList.id)
+    )
+
+
+reading_list_item = RowSerializer('id', 'book_id', 'note', book=('title', 'author', 'genre'))
+
+
 @reading_list_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_reading_list():
     if request.method == 'OPTIONS':
         return '', 200
 
-    user_id = get_jwt_identity()
-    items = ReadingList.query.filter_by(user_id=user_id).all()
-
-    return jsonify([
-        {
-            'id': item.id,
-            'book_id': item.book_id,
-            'note': item.note,
-            'book': {
-                'title': item.book.title,
-                'author': item.book.author,
-                'genre': item.book.genre
-            }
-        } for item in items
-    ]), 200
+    rows = db.session.execute(reading_list_select(get_jwt_identity())).all()
+    return jsonify(reading_list_item.many(rows)), 200
 
 
 @reading_list_bp.route('/<int:id>', methods=['PATCH', 'OPTIONS'])
@@ -71,6 +88,7 @@ def update_reading_note(id):
     if request.method == 'OPTIONS':
         return '', 200
 
+    begin_write()
     entry = ReadingList.query.get(id)
     if not entry:
         return jsonify({'error': 'Reading list entry not found'}), 404
@@ -84,6 +102,7 @@ def update_reading_note(id):
         return jsonify({'error': 'Invalid JSON payload'}), 400
 
     entry.note = data.get('note', entry.note)
+    record_change(READING_LIST, entry.id, user_id=user_id)
     db.session.commit()
 
     return jsonify({'message': 'Reading list note updated'}), 200
@@ -95,6 +114,7 @@ def remove_from_reading_list(id):
     if request.method == 'OPTIONS':
         return '', 200
 
+    begin_write()
     entry = ReadingList.query.get(id)
     if not entry:
         return jsonify({'error': 'Reading list entry not found'}), 404
@@ -103,6 +123,7 @@ def remove_from_reading_list(id):
     if entry.user_id != user_id:
         return jsonify({'error': 'Not authorized to delete this entry'}), 403
 
+    record_change(READING_LIST, entry.id, DELETE, user_id)
     db.session.delete(entry)
     db.session.commit()
 
@@ -0,0 +1,212 @@
+import re
+
+from flask import request
+from sqlalchemy import DDL, event
+from sqlalchemy.exc import OperationalError
+from models import db, Book
+from pagination import PaginationError, decode_cursor, encode_cursor, parse_limit
+
+SEARCH_COLUMNS = ('title', 'author', 'genre')
+
+# Relative column weights used for ranking: a title hit beats an author hit,
+# which beats a genre hit.
+FTS5_WEIGHTS = (10.0, 5.0, 1.0)
+TSVECTOR_WEIGHTS = {'title': 'A', 'author': 'B', 'genre': 'C'}
+
+# SQLite: an external-content FTS5 table over `book`, kept in sync by
+# triggers. Changing them needs a new migration; the existing ones keep
+# their own copies of the statements as of their revision.
+FTS_TABLE = """CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(
+        title, author, genre, content='book', content_rowid='id'
+    )"""
+FTS_INSERT_TRIGGER = """CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN
+        INSERT INTO book_fts(rowid, title, author, genre)
+        VALUES (new.id, new.title, new.author, new.genre);
+    END"""
+FTS_DELETE_TRIGGER = """CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.genre);
+    END"""
+# `columns` is ' OF title, author, genre' once book has inventory counters,
+# which change on every loan
+FTS_UPDATE_TRIGGER = """CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE{columns} ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.genre);
+        INSERT INTO book_fts(rowid, title, author, genre)
+        VALUES (new.id, new.title, new.author, new.genre);
+    END"""
+FTS_INDEXED_COLUMNS = ' OF title, author, genre'
+
+SQLITE_DDL = [
+    FTS_TABLE,
+    FTS_INSERT_TRIGGER,
+    FTS_DELETE_TRIGGER,
+    FTS_UPDATE_TRIGGER.format(columns=FTS_INDEXED_COLUMNS),
+    "INSERT INTO book_fts(book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS book_fts_au",
+    "DROP TRIGGER IF EXISTS book_fts_ad",
+    "DROP TRIGGER IF EXISTS book_fts_ai",
+    "DROP TABLE IF EXISTS book_fts",
+]
+
+# PostgreSQL: a generated, weighted tsvector column with a GIN index
+POSTGRES_DDL = [
+    """ALTER TABLE book ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(author, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(genre, '')), 'C')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_book_search_vector ON book USING GIN (search_vector)",
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS ix_book_search_vector",
+    "ALTER TABLE book DROP COLUMN IF EXISTS search_vector",
+]
+
+for statement in SQLITE_DDL:
+    event.listen(Book.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRES_DDL:
+    event.listen(Book.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+event.listen(Book.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS book_fts').execute_if(dialect='sqlite'))
+
+_fts5_available = {}
+
+
+def search_backend():
+    engine = db.engine
+    dialect = engine.dialect.name
+    if dialect == 'postgresql':
+        return 'postgresql'
+    if dialect == 'sqlite':
+        key = str(engine.url)
+        if key not in _fts5_available:
+            found = db.session.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'book_fts'"
+            )).first()
+            _fts5_available[key] = found is not None
+        if _fts5_available[key]:
+            return 'fts5'
+    return 'ilike'
+
+
+def fts_table_missing(error):
+    """Whether `error` is book_fts having gone away since search_backend()
+    looked, e.g. after a downgrade; if so the next search checks again."""
+    if 'no such table: book_fts' not in str(getattr(error, 'orig', error)):
+        return False
+    _fts5_available.clear()
+    return True
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def parse_terms(args=None):
+    # `q` matches any column; title/author/genre restrict terms to one column
+    args = request.args if args is None else args
+    terms = [(None, token) for token in tokenize(args.get('q', ''))]
+    for column in SEARCH_COLUMNS:
+        terms += [(column, token) for token in tokenize(args.get(column, ''))]
+    return terms
+
+
+def fts5_query(terms):
+    parts = []
+    for column, token in terms:
+        phrase = f'"{token}"*'
+        parts.append(f'{column}:{phrase}' if column else phrase)
+    return ' '.join(parts)
+
+
+def tsquery(terms):
+    parts = []
+    for column, token in terms:
+        weight = TSVECTOR_WEIGHTS[column] if column else ''
+        parts.append(f"'{token}':*{weight}")
+    return ' & '.join(parts)
+
+
+def book_columns():
+    return [getattr(Book, name) for name in ('id',) + SEARCH_COLUMNS]
+
+
+def fts5_select(terms):
+    fts = db.literal_column('book_fts')
+    rank = db.func.bm25(fts, *FTS5_WEIGHTS)
+    return (
+        db.select(*book_columns())
+        .select_from(Book)
+        .join(db.table('book_fts', db.column('rowid')), db.literal_column('book_fts.rowid') == Book.id)
+        .where(fts.op('MATCH')(fts5_query(terms)))
+        .order_by(rank, Book.id)
+    )
+
+
+def postgres_select(terms):
+    vector = db.literal_column('book.search_vector')
+    query = db.func.to_tsquery('simple', tsquery(terms))
+    return (
+        db.select(*book_columns())
+        .where(vector.op('@@')(query))
+        .order_by(db.func.ts_rank(vector, query).desc(), Book.id)
+    )
+
+
+def ilike_select(terms):
+    query = db.select(*book_columns())
+    for column, token in terms:
+        columns = [getattr(Book, column)] if column else [getattr(Book, c) for c in SEARCH_COLUMNS]
+        query = query.where(db.or_(*[c.ilike(f'%{token}%') for c in columns]))
+    return query.order_by(Book.id)
+
+
+SELECTS = {
+    'fts5': fts5_select,
+    'postgresql': postgres_select,
+    'ilike': ilike_select,
+}
+
+
+def parse_offset(args=None):
+    # Ranked results have no stable keyset, so the cursor carries an offset
+    args = request.args if args is None else args
+    cursor = args.get('cursor')
+    if not cursor:
+        return 0
+    offset = decode_cursor(cursor).get('offset')
+    if not isinstance(offset, int) or offset < 0:
+        raise PaginationError('Invalid cursor')
+    return offset
+
+
+def search_items(rows, limit, offset):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({'offset': offset + limit})
+    return [dict(zip(row._fields, row)) for row in rows], next_cursor
+
+
+def search_page(terms, backend=None):
+    """Run a ranked search and return one page as (items, next_cursor)."""
+    limit = parse_limit()
+    offset = parse_offset()
+
+    select = SELECTS[backend or search_backend()](terms)
+    try:
+        rows = db.session.execute(select.limit(limit + 1).offset(offset)).all()
+    except OperationalError as e:
+        # Terms are quoted, so only a missing index lands here; anything
+        # else is a real error
+        if not fts_table_missing(e):
+            raise
+        db.session.rollback()
+        rows = db.session.execute(ilike_select(terms).limit(limit + 1).offset(offset)).all()
+    return search_items(rows, limit, offset)
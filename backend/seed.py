@@ -1,12 +1,21 @@
-from app import app, db, User, Book  
-from flask_bcrypt import Bcrypt
+from flask_migrate import Migrate, stamp
 
-bcrypt = Bcrypt(app)
+from app import create_app
+from hashing import hasher
+from catalog_cache import catalog_cache
+from models import db, User, Book
+from stats import rebuild_rollups
+
+app = create_app()
+Migrate(app, db)
 
 with app.app_context():
     print("Dropping and recreating tables...")
     db.drop_all()
     db.create_all()
+    # create_all() builds the current schema, so later `flask db upgrade`
+    # runs only what comes after it
+    stamp()
 
     books = [
         Book(title="1984", author="George Orwell", genre="Dystopian"),
@@ -17,9 +26,12 @@ with app.app_context():
     user = User(
         username="admin",
         email="admin@booknest.com",
-        password_hash=bcrypt.generate_password_hash("adminpass").decode('utf-8')
+        password_hash=hasher.hash("adminpass")
     )
 
     db.session.add_all(books + [user])
     db.session.commit()
+    rebuild_rollups()
+    # The shared catalog cache outlives the dropped tables
+    catalog_cache.bump_version()
     print("Database seeded successfully.")
@@ -0,0 +1,135 @@
+import json
+from datetime import date, datetime, timezone
+from operator import itemgetter
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RowSerializer:
+    """Turns Core result rows into JSON-ready dicts.
+
+    Declare the output once, in order, by column label; keyword arguments
+    nest a group of columns under one key:
+
+        loan_item = RowSerializer('id', 'borrowed_at', book=('title', 'author'))
+        items = loan_item.many(db.session.execute(select).all())
+
+    Column positions are resolved on the first row and cached, so each row
+    costs one itemgetter call and a zip per object instead of attribute
+    lookups on a hydrated model.
+    """
+
+    def __init__(self, *fields, **nested):
+        self.fields = fields
+        self.nested = nested
+        self._plans = {}
+
+    def _plan(self, columns):
+        plan = self._plans.get(columns)
+        if plan is None:
+            position = {name: i for i, name in enumerate(columns)}
+
+            def getter(names):
+                indexes = [position[name] for name in names]
+                if len(indexes) == 1:
+                    index = indexes[0]
+                    return lambda row: (row[index],)
+                return itemgetter(*indexes)
+
+            plan = self._plans[columns] = (
+                self.fields, getter(self.fields),
+                [(key, names, getter(names)) for key, names in self.nested.items()],
+            )
+        return plan
+
+    def many(self, rows):
+        if not rows:
+            return []
+        keys, values, nested = self._plan(tuple(rows[0]._fields))
+        items = []
+        for row in rows:
+            item = dict(zip(keys, values(row)))
+            for key, names, group in nested:
+                item[key] = dict(zip(names, group(row)))
+            items.append(item)
+        return items
+
+    def __call__(self, row):
+        return self.many([row])[0]
+
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(value):
+    """werkzeug.http.http_date without the email.utils round trip."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+    else:
+        value = datetime(value.year, value.month, value.day)
+    return '%s, %02d %s %04d %02d:%02d:%02d GMT' % (
+        WEEKDAYS[value.weekday()], value.day, MONTHS[value.month - 1], value.year,
+        value.hour, value.minute, value.second,
+    )
+
+
+def json_default(o):
+    """Dates as HTTP dates, as the JSON endpoints send them, and Flask's
+    handling for everything else JSON has no type for."""
+    if isinstance(o, date):
+        return http_date(o)
+    return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    Output matches the default provider's: sorted keys, compact separators,
+    and dates formatted as HTTP dates (orjson's native ISO datetimes are
+    passed through to Flask's default handler).
+    """
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps(obj, kwargs.get('indent')).decode('utf-8')
+
+    def _dumps(self, obj, indent=None):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self._default, option=option)
+
+    def _default(self, o):
+        if isinstance(o, date):
+            return http_date(o)
+        return self.default(o)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self._dumps(obj, indent) + b'\n', mimetype=self.mimetype)
+
+
+def init_json(app):
+    # orjson is optional; without it the stdlib provider stays in place
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+
+
+def dumps_line(obj):
+    """One compact NDJSON line, formatting values the way the JSON
+    endpoints do, so an export and a page of the same rows agree."""
+    if orjson is None:
+        return json.dumps(obj, default=json_default, separators=(',', ':'))
+    return orjson.dumps(obj, default=json_default, option=orjson.OPT_PASSTHROUGH_DATETIME).decode('utf-8')
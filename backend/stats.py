@@ -0,0 +1,230 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.dialects import postgresql, sqlite
+from models import (
+    db, User, Book, Loan, StatCounter, BookLoanStat, GenreLoanStat, DailyLoanStat
+)
+from overdue import overdue_filter
+
+UNKNOWN_GENRE = 'Unknown'
+DIALECT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def _increment_many(model, keys, rows):
+    """Atomically add each row's deltas to the row identified by its `keys`
+    columns, creating it if needed (INSERT ... ON CONFLICT DO UPDATE), in a
+    single executemany."""
+    if not rows:
+        return
+    dialect_insert = DIALECT_INSERTS.get(db.engine.dialect.name)
+    table = model.__table__
+    if dialect_insert is None:
+        _update_or_insert(table, keys, rows)
+        return
+    insert = dialect_insert(model)
+    stmt = insert.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: table.c[name] + insert.excluded[name]
+              for name in rows[0] if name not in keys},
+    )
+    db.session.execute(stmt, rows)
+
+
+def _update_or_insert(table, keys, rows):
+    # No upsert on this dialect: a plain UPDATE, inserting the rows it
+    # didn't find
+    for row in rows:
+        match = [table.c[name] == row[name] for name in keys]
+        result = db.session.execute(
+            table.update().where(*match)
+            .values({name: table.c[name] + delta for name, delta in row.items() if name not in keys})
+        )
+        if not result.rowcount:
+            db.session.execute(table.insert().values(row))
+
+
+def _increment(model, key, **deltas):
+    _increment_many(model, list(key), [{**key, **deltas}])
+
+
+def adjust_counter(name, delta):
+    if delta:
+        _increment(StatCounter, {'name': name}, value=delta)
+
+
+def record_checkouts(books, when):
+    """Count one new loan of each book in `books`, all made at `when`."""
+    if not books:
+        return
+    per_book = Counter(book.id for book in books)
+    per_genre = Counter(book.genre or UNKNOWN_GENRE for book in books)
+    _increment_many(BookLoanStat, ['book_id'],
+                    [{'book_id': book_id, 'loans': n} for book_id, n in per_book.items()])
+    _increment_many(GenreLoanStat, ['genre'],
+                    [{'genre': genre, 'loans': n} for genre, n in per_genre.items()])
+    _increment(DailyLoanStat, {'day': when.date()}, loans=len(books), returns=0)
+    adjust_counter('loans', len(books))
+    adjust_counter('active_loans', len(books))
+
+
+def record_checkout(book, when):
+    record_checkouts([book], when)
+
+
+def record_returns(count, when):
+    if count:
+        _increment(DailyLoanStat, {'day': when.date()}, loans=0, returns=count)
+        adjust_counter('active_loans', -count)
+
+
+def record_return(when):
+    record_returns(1, when)
+
+
+def _as_day(column, dialect):
+    if dialect == 'sqlite':
+        return db.func.date(column)
+    return db.cast(column, db.Date)
+
+
+def loan_aggregates(dialect, *where):
+    """The rollups' GROUP BY queries over the loans matching `where` (all
+    loans by default): loans per book, per genre, per day borrowed and per
+    day returned, each as (key, count) rows."""
+    genre = db.func.coalesce(Book.genre, UNKNOWN_GENRE)
+    borrowed_day = _as_day(Loan.borrowed_at, dialect)
+    returned_day = _as_day(Loan.returned_at, dialect)
+    return (
+        db.select(Loan.book_id, db.func.count()).where(*where).group_by(Loan.book_id),
+        db.select(genre, db.func.count()).select_from(Loan)
+        .join(Book, Loan.book_id == Book.id).where(*where).group_by(genre),
+        db.select(borrowed_day, db.func.count())
+        .where(Loan.borrowed_at.is_not(None), *where).group_by(borrowed_day),
+        db.select(returned_day, db.func.count())
+        .where(Loan.returned_at.is_not(None), *where).group_by(returned_day),
+    )
+
+
+def _daily_counts(conn, borrowed, returned):
+    """{day: [loans, returns]} from the per-day queries."""
+    days = {}
+    for day, count in conn.execute(borrowed):
+        days.setdefault(str(day), [0, 0])[0] = count
+    for day, count in conn.execute(returned):
+        days.setdefault(str(day), [0, 0])[1] = count
+    return {datetime.strptime(day, '%Y-%m-%d').date(): counts for day, counts in days.items()}
+
+
+def write_rollups(conn):
+    """Fill the empty rollup tables from the base tables over the
+    connection `conn`."""
+    counters = {
+        'users': db.select(db.func.count()).select_from(User),
+        'books': db.select(db.func.count()).select_from(Book),
+        'loans': db.select(db.func.count()).select_from(Loan),
+        'active_loans': db.select(db.func.count()).select_from(Loan).where(Loan.returned_at.is_(None)),
+    }
+    conn.execute(db.insert(StatCounter), [
+        {'name': name, 'value': conn.execute(query).scalar()} for name, query in counters.items()
+    ])
+
+    per_book, per_genre, borrowed, returned = loan_aggregates(conn.dialect.name)
+    conn.execute(db.insert(BookLoanStat).from_select(['book_id', 'loans'], per_book))
+    conn.execute(db.insert(GenreLoanStat).from_select(['genre', 'loans'], per_genre))
+    days = _daily_counts(conn, borrowed, returned)
+    if days:
+        conn.execute(db.insert(DailyLoanStat), [
+            {'day': day, 'loans': loans, 'returns': returns} for day, (loans, returns) in days.items()
+        ])
+
+
+def rebuild_rollups():
+    """Recompute every rollup from the base tables, e.g. after a restore."""
+    for model in (StatCounter, BookLoanStat, GenreLoanStat, DailyLoanStat):
+        db.session.execute(db.delete(model))
+    write_rollups(db.session.connection())
+    db.session.commit()
+
+
+def forget_loans(*where):
+    """Take the loans matching `where` out of every rollup; call it before
+    deleting them. Like rebuild_rollups(), the rollups count the loans
+    stored, so a deleted loan no longer counts towards any total."""
+    per_book, per_genre, borrowed, returned = loan_aggregates(db.engine.dialect.name, *where)
+    books = db.session.execute(per_book).all()
+    if not books:
+        return
+    active = db.session.execute(
+        db.select(db.func.count()).select_from(Loan).where(Loan.returned_at.is_(None), *where)
+    ).scalar()
+
+    _increment_many(BookLoanStat, ['book_id'],
+                    [{'book_id': book_id, 'loans': -n} for book_id, n in books])
+    _increment_many(GenreLoanStat, ['genre'],
+                    [{'genre': genre, 'loans': -n} for genre, n in db.session.execute(per_genre)])
+    _increment_many(DailyLoanStat, ['day'], [
+        {'day': day, 'loans': -loans, 'returns': -returns}
+        for day, (loans, returns) in _daily_counts(db.session, borrowed, returned).items()
+    ])
+    adjust_counter('loans', -sum(n for _, n in books))
+    adjust_counter('active_loans', -active)
+
+    # Rows rebuild_rollups() wouldn't have
+    db.session.execute(db.delete(BookLoanStat).where(BookLoanStat.loans <= 0))
+    db.session.execute(db.delete(GenreLoanStat).where(GenreLoanStat.loans <= 0))
+    db.session.execute(db.delete(DailyLoanStat).where(DailyLoanStat.loans <= 0, DailyLoanStat.returns <= 0))
+
+
+def dashboard_stats(top=10, days=30):
+    counters = dict(db.session.execute(db.select(StatCounter.name, StatCounter.value)).all())
+    overdue = db.session.execute(
+        db.select(db.func.count()).select_from(Loan).where(*overdue_filter(datetime.utcnow()))
+    ).scalar()
+
+    top_books = db.session.execute(
+        db.select(BookLoanStat.book_id, BookLoanStat.loans, Book.title, Book.author)
+        .join(Book, Book.id == BookLoanStat.book_id)
+        .order_by(BookLoanStat.loans.desc(), BookLoanStat.book_id)
+        .limit(top)
+    ).all()
+    genres = db.session.execute(
+        db.select(GenreLoanStat.genre, GenreLoanStat.loans).order_by(GenreLoanStat.loans.desc())
+    ).all()
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    daily = db.session.execute(
+        db.select(DailyLoanStat.day, DailyLoanStat.loans, DailyLoanStat.returns)
+        .where(DailyLoanStat.day >= since)
+        .order_by(DailyLoanStat.day)
+    ).all()
+
+    return {
+        'totals': {
+            'users': counters.get('users', 0),
+            'books': counters.get('books', 0),
+            'loans': counters.get('loans', 0),
+            'active_loans': counters.get('active_loans', 0),
+            'overdue_loans': overdue,
+        },
+        'top_books': [
+            {'book_id': row.book_id, 'title': row.title, 'author': row.author, 'loans': row.loans}
+            for row in top_books
+        ],
+        'loans_by_genre': [{'genre': row.genre, 'loans': row.loans} for row in genres],
+        'loans_by_day': [
+            {'day': row.day.isoformat(), 'loans': row.loans, 'returns': row.returns}
+            for row in daily
+        ],
+    }
+
+
+stats_cli = AppGroup('stats', help='Dashboard rollup commands.')
+
+
+@stats_cli.command('rebuild')
+def rebuild_command():
+    """Recompute the dashboard rollup tables from scratch."""
+    rebuild_rollups()
+    click.echo('Dashboard rollups rebuilt.')
@@ -0,0 +1,274 @@
+import fcntl
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+
+from flask import current_app, request
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Book
+from pagination import parse_limit
+
+logger = logging.getLogger('booknest.suggest')
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 25
+# Keys start at each of the first few words of a title or author, so
+# "potter" finds "Harry Potter", and are cut to a fixed length; both keep
+# the index a small multiple of the catalog's text
+MAX_WORDS = 6
+MAX_KEY_LENGTH = 48
+
+MAGIC = b'BNSUGG01'
+# magic, key count, book count, then byte lengths of the four arrays and two blobs
+HEADER = struct.Struct('<8s2I6Q')
+WORD = re.compile(r'\w+')
+
+_started_at = time.time()
+
+
+def words(text):
+    if text.isascii():
+        return WORD.findall(text.lower())
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return WORD.findall(''.join(c for c in text if not unicodedata.combining(c)))
+
+
+def normalize(text):
+    """Casefolded words without accents, single-spaced: 'Brontë, Emily'
+    -> 'bronte emily'."""
+    return ' '.join(words(text))
+
+
+def index_keys(text):
+    text = words(text)
+    return {' '.join(text[start:])[:MAX_KEY_LENGTH].encode('utf-8')
+            for start in range(min(len(text), MAX_WORDS))}
+
+
+def build_snapshot(books):
+    """Serialize (id, title, author) rows into the snapshot file layout.
+
+    Keys are UTF-8, whose byte order is code point order, sorted so a
+    prefix's matches are one contiguous run found with bisect. Each key
+    points at a book record holding the id and display text.
+    """
+    entries = []
+    book_ids = array('I')
+    book_offsets = array('I', [0])
+    book_blob = bytearray()
+    for index, (book_id, title, author) in enumerate(books):
+        for key in index_keys(title) | index_keys(author):
+            entries.append((key, index))
+        book_ids.append(book_id)
+        book_blob += f'{title}\x1f{author}'.encode('utf-8')
+        book_offsets.append(len(book_blob))
+    entries.sort()
+
+    keys = [key for key, _ in entries]
+    key_offsets = array('I', accumulate(map(len, keys), initial=0))
+    key_books = array('I', [index for _, index in entries])
+    parts = [key_offsets.tobytes(), key_books.tobytes(), book_ids.tobytes(),
+             book_offsets.tobytes(), b''.join(keys), bytes(book_blob)]
+    header = HEADER.pack(MAGIC, len(key_books), len(book_ids), *(len(part) for part in parts))
+    return b''.join([header, *parts])
+
+
+class Snapshot:
+    """A read-only, memory-mapped snapshot file.
+
+    The arrays are views straight onto the mapping, so every worker on the
+    host shares one copy through the page cache; a worker's own memory is
+    only what its lookups touch.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.key_count, self.book_count, *lengths = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a suggestion index')
+
+        view = memoryview(self._map)
+        start = HEADER.size
+        arrays = []
+        for length in lengths[:4]:
+            arrays.append(view[start:start + length].cast('I'))
+            start += length
+        self.key_offsets, self.key_books, self.book_ids, self.book_offsets = arrays
+        self._key_base = start
+        self._book_base = start + lengths[4]
+
+    def __len__(self):
+        return self.key_count
+
+    def __getitem__(self, i):
+        # bytes, not a memoryview, so bisect can compare keys
+        base = self._key_base
+        return self._map[base + self.key_offsets[i]:base + self.key_offsets[i + 1]]
+
+    def book(self, index):
+        base = self._book_base
+        raw = self._map[base + self.book_offsets[index]:base + self.book_offsets[index + 1]]
+        title, author = raw.decode('utf-8').split('\x1f', 1)
+        return {'id': self.book_ids[index], 'title': title, 'author': author}
+
+    def search(self, prefix, limit):
+        seen = set()
+        items = []
+        i = bisect_left(self, prefix)
+        while i < self.key_count and len(items) < limit and self[i].startswith(prefix):
+            index = self.key_books[i]
+            if index not in seen:
+                seen.add(index)
+                items.append(self.book(index))
+            i += 1
+        return items
+
+
+class SuggestIndex:
+    """Prefix index over normalized titles and authors for /books/suggest.
+
+    The index lives in a snapshot file (SUGGEST_INDEX_PATH, by default in
+    the instance folder) that every worker memory-maps. It is rebuilt from
+    the book table in the background at startup and after each catalog
+    write, under a file lock so concurrent rebuilds cannot finish out of
+    order, and swapped in with an atomic rename. Each lookup stats the file and remaps it when
+    another worker has replaced it, so writes show up in every worker once
+    their rebuild finishes (about a second per 50k books).
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._executor = None
+        self._pid = None
+        self._queued = False
+        self.path = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = app.config.get('SUGGEST_INDEX_PATH') or os.path.join(app.instance_path, 'suggest.idx')
+        self._snapshot = None
+        app.extensions['suggest_index'] = self
+        if app.config.get('SUGGEST_BUILD_ON_START', True):
+            # In the background, so startup doesn't wait on a catalog scan;
+            # a lookup that comes first builds it itself
+            self._schedule(app, unless_built_since=_started_at)
+
+    def refresh(self, unless_built_since=None):
+        """Rebuild the snapshot from the book table.
+
+        With `unless_built_since`, skip the rebuild if another process has
+        written the file since then, as sibling workers do at startup.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if unless_built_since is not None and self._mtime() >= unless_built_since:
+                    return
+                # Own connection, like the admin cache, so the read never
+                # belongs to the request's transaction
+                with db.engine.connect() as conn:
+                    books = conn.execute(
+                        db.select(Book.id, Book.title, Book.author).order_by(Book.id)
+                    ).all()
+                data = build_snapshot(books)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.suggest-')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def refresh_soon(self):
+        """Rebuild in the background after a catalog write, so the write's
+        request doesn't wait on it. Writes that land while a rebuild is
+        still queued share that rebuild."""
+        self._schedule(current_app._get_current_object())
+
+    def _schedule(self, app, unless_built_since=None):
+        with self._lock:
+            if self._queued:
+                return
+            self._queued = True
+            # A pool inherited from the parent of a forked worker has no thread
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='suggest')
+                self._pid = os.getpid()
+        self._executor.submit(self._background_refresh, app, unless_built_since)
+
+    def _background_refresh(self, app, unless_built_since):
+        with self._lock:
+            self._queued = False
+        with app.app_context():
+            try:
+                self.refresh(unless_built_since)
+            except SQLAlchemyError as e:
+                if unless_built_since is None:
+                    logger.exception('Suggestion index rebuild failed')
+                else:
+                    # e.g. `flask db upgrade` on a fresh database; the first
+                    # lookup builds it instead
+                    logger.info('Suggestion index not built at startup: %s', e)
+            except Exception:
+                logger.exception('Suggestion index rebuild failed')
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def ensure_built(self):
+        """Build the snapshot if no worker has yet, e.g. with
+        SUGGEST_BUILD_ON_START off or before the startup build finishes.
+        Needs an app context."""
+        checked = time.time()
+        if not os.path.exists(self.path):
+            # Lookups that race here wait on the first build, not redo it
+            self.refresh(unless_built_since=checked)
+
+    def snapshot(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.ensure_built()
+            stat = os.stat(self.path)
+        current = self._snapshot
+        if current is None or current.identity != (stat.st_ino, stat.st_mtime_ns):
+            with self._lock:
+                current = self._snapshot
+                if current is None or current.identity != (stat.st_ino, stat.st_mtime_ns):
+                    current = self._snapshot = Snapshot(self.path)
+        return current
+
+    def suggest(self, query, limit=DEFAULT_SUGGESTIONS):
+        prefix = normalize(query)[:MAX_KEY_LENGTH].encode('utf-8')
+        if not prefix:
+            return []
+        return self.snapshot().search(prefix, limit)
+
+
+suggest_index = SuggestIndex()
+
+
+def parse_suggest_limit(args=None):
+    args = request.args if args is None else args
+    if not args.get('limit'):
+        return DEFAULT_SUGGESTIONS
+    return min(parse_limit(args), MAX_SUGGESTIONS)
@@ -0,0 +1,65 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from authz import admin_cache
+from models import db, User
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build a test app; keyword arguments override its config."""
+    apps = []
+
+    def make_app(**config):
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+            'CACHE_URL': 'memory://',
+            'RATELIMIT_ENABLED': False,
+            'SUGGEST_BUILD_ON_START': False,
+            'SUGGEST_INDEX_PATH': str(tmp_path / 'suggest.idx'),
+            'RECOMMEND_BUILD_ON_START': False,
+            'RECOMMEND_INDEX_PATH': str(tmp_path / 'recommend.idx'),
+            'HASH_WORKERS': 0,
+            'BCRYPT_LOG_ROUNDS': 4,
+            'ADMIN_CACHE_TTL': 3600,
+            **config,
+        })
+        with app.app_context():
+            # Only the primary; a replica bind from an earlier app stays
+            # registered on db
+            db.create_all(bind_key=None)
+        admin_cache.invalidate()
+        apps.append(app)
+        return app
+
+    yield make_app
+    for app in apps:
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(username, is_admin=False):
+        """Create a user and return (id, Authorization headers)."""
+        with app.app_context():
+            user = User(username=username, email=f'{username}@example.com',
+                        password_hash='x', is_admin=is_admin)
+            db.session.add(user)
+            db.session.commit()
+            token = create_access_token(identity=user.id, additional_claims={'is_admin': is_admin})
+            return user.id, {'Authorization': f'Bearer {token}'}
+    return make_user
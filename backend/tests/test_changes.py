@@ -0,0 +1,23 @@
+"""GET /changes reads the primary, so a lagging replica never sends an
+up-to-date client back to a full refetch."""
+from models import db, Book
+from changes import BOOK, head, record_change
+
+
+def test_up_to_date_client_is_not_sent_to_refetch_by_lagging_replica(make_app, make_user, tmp_path):
+    app = make_app(DATABASE_REPLICA_URLS=[f"sqlite:///{tmp_path / 'replica.db'}"],
+                   CACHE_URL=f"sqlite:///{tmp_path / 'cache.db'}")
+    with app.app_context():
+        # The replica has the schema but none of the writes below yet
+        db.metadata.create_all(db.engines['replica1'])
+        book = Book(title='Dune', author='Frank Herbert', genre='Science Fiction')
+        db.session.add(book)
+        db.session.flush()
+        record_change(BOOK, book.id)
+        db.session.commit()
+        version, _ = head()
+    _, headers = make_user('alice')
+
+    response = app.test_client().get(f'/changes?since={version}', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json() == {'version': version, 'changes': [], 'has_more': False}
@@ -0,0 +1,28 @@
+"""Cold start, from a fresh interpreter to the first response, stays within
+budget. Same measurement as bench/bench_coldstart.py, which breaks the time
+down by phase and import."""
+import os
+
+from bench.bench_coldstart import cold_start
+
+# The bench's default gate; override on slower CI machines
+BUDGET_MS = float(os.getenv('COLDSTART_BUDGET_MS', 1500))
+RUNS = 3
+# Only needed by `flask db`, so never loaded when serving
+DEFERRED_IMPORTS = ('alembic', 'flask_migrate')
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_cold_start_to_first_response_within_budget(tmp_path):
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{tmp_path / 'coldstart.db'}",
+               CACHE_URL='memory://',
+               SUGGEST_BUILD_ON_START='0',
+               PYTHONPATH=BACKEND)
+    # The fastest of a few runs, so one slow process start doesn't fail it
+    runs = [cold_start(env) for _ in range(RUNS)]
+    total, _, imports = min(runs, key=lambda run: run[0])
+
+    assert total * 1000 <= BUDGET_MS, f'cold start took {total * 1000:.0f} ms'
+    loaded = [name for name in DEFERRED_IMPORTS if name in imports]
+    assert not loaded, f'imported at startup: {loaded}'
@@ -0,0 +1,43 @@
+"""The hashing pool's queue slots and per-worker sizing."""
+import time
+
+import pytest
+from flask import Flask
+
+from hashing import HashingBusy, PasswordHasher, pool_share
+
+
+@pytest.fixture
+def slow_hasher():
+    app = Flask(__name__)
+    app.config.update(HASH_WORKERS=1, HASH_QUEUE_SIZE=1, HASH_TIMEOUT=0.05)
+    hasher = PasswordHasher(app)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes(slow_hasher):
+    slow_hasher._run(time.sleep, 0)  # start the pool process
+
+    with pytest.raises(HashingBusy):
+        slow_hasher._run(time.sleep, 0.5)
+    # The sleep is still running in the pool, so the only slot is taken
+    with pytest.raises(HashingBusy):
+        slow_hasher._run(time.sleep, 0)
+
+    time.sleep(0.6)
+    assert slow_hasher._run(time.sleep, 0) is None
+
+
+@pytest.mark.parametrize('pool_size, web_workers, share', [
+    (8, 1, 8), (8, 4, 2), (8, 3, 2), (2, 4, 1), (0, 4, 0),
+])
+def test_pool_is_split_between_server_workers(pool_size, web_workers, share):
+    assert pool_share(pool_size, web_workers) == share
+
+
+def test_share_comes_from_pool_size_and_web_concurrency():
+    app = Flask(__name__)
+    app.config.update(HASH_POOL_SIZE=8, WEB_CONCURRENCY=4)
+    hasher = PasswordHasher(app)
+    assert hasher.workers == 2
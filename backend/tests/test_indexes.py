@@ -0,0 +1,55 @@
+"""The hot loan and reading-list lookups are served by their indexes, not
+by scanning the table (SQLite's EXPLAIN QUERY PLAN)."""
+from datetime import datetime
+
+import pytest
+
+from inventory import open_loan_select
+from models import db, ReadingList
+from overdue import overdue_batch_select
+
+
+def query_plan(statement):
+    sql = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    return ' | '.join(row[-1] for row in rows)
+
+
+def unique_index(table, columns):
+    """The index SQLite built for a UNIQUE constraint on `columns`; it is
+    named sqlite_autoindex_*, not after the constraint."""
+    for row in db.session.execute(db.text(f'PRAGMA index_list({table})')).mappings():
+        indexed = [info['name'] for info in
+                   db.session.execute(db.text(f"PRAGMA index_info('{row['name']}')")).mappings()]
+        if row['unique'] and indexed == list(columns):
+            return row['name']
+    raise LookupError(f'no unique index on {table}{tuple(columns)}')
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+
+
+def test_open_loan_lookup_uses_active_user_book_index(ctx):
+    plan = query_plan(open_loan_select(1, 2))
+    assert 'USING COVERING INDEX ix_loan_active_user_book' in plan or \
+        'USING INDEX ix_loan_active_user_book' in plan, plan
+    assert 'SCAN loan' not in plan, plan
+
+
+@pytest.mark.parametrize('after', [None, (datetime(2024, 1, 1), 5)])
+def test_due_date_scan_uses_active_due_date_index(ctx, after):
+    # The overdue sweep's first and following batches
+    plan = query_plan(overdue_batch_select(datetime.utcnow(), after, 500))
+    assert 'ix_loan_active_due_date' in plan, plan
+    assert 'SCAN loan' not in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_reading_list_lookup_uses_user_book_constraint(ctx):
+    plan = query_plan(db.select(ReadingList).filter_by(user_id=1, book_id=2))
+    # uq_reading_list_user_book
+    assert unique_index('reading_list', ['user_id', 'book_id']) in plan, plan
+    assert 'SCAN reading_list' not in plan, plan
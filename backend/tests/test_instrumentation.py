@@ -0,0 +1,15 @@
+"""Query timing keeps no state behind for statements that raise."""
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+
+def test_failed_statements_leave_nothing_on_the_connection(make_app):
+    app = make_app(INSTRUMENTATION=True)
+    with app.app_context(), db.engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql('SELECT * FROM no_such_table')
+        conn.exec_driver_sql('SELECT 1')
+        assert not conn.info.get('query_started')
@@ -0,0 +1,59 @@
+"""The loan and reading-list listings load in a fixed number of statements,
+however many rows they return (no per-row lazy loads)."""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from models import db, Book, Loan, ReadingList
+
+LISTINGS = ['/loans/my', '/reading-list/', '/admin/loans']
+
+
+@contextmanager
+def count_statements(app):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def add_rows(app, user_id, n):
+    """Give `user_id` n more loans and reading-list entries, each on a book
+    of its own."""
+    with app.app_context():
+        books = [Book(title=f'Book {i}', author=f'Author {i}', genre='Fiction') for i in range(n)]
+        db.session.add_all(books)
+        db.session.flush()
+        db.session.add_all([Loan(user_id=user_id, book_id=book.id) for book in books])
+        db.session.add_all([ReadingList(user_id=user_id, book_id=book.id, note='n') for book in books])
+        db.session.commit()
+
+
+@pytest.mark.parametrize('path', LISTINGS)
+def test_listing_query_count_does_not_grow_with_rows(app, client, make_user, path):
+    user_id, headers = make_user('reader', is_admin=True)
+    add_rows(app, user_id, 3)
+    # Warm per-process caches (admin ids) so both counts see the same work
+    assert client.get(path, headers=headers).status_code == 200
+
+    with count_statements(app) as few:
+        response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    assert len(response.get_json()) == 3
+
+    add_rows(app, user_id, 30)
+    with count_statements(app) as many:
+        response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    assert len(response.get_json()) == 33
+
+    assert len(many) == len(few), many
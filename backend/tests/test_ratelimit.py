@@ -0,0 +1,36 @@
+"""Rate-limit store defaults and the in-flight shedding warning."""
+import logging
+
+import pytest
+
+from ratelimit import MemoryBuckets, SQLiteBuckets, default_bucket_url, limiter
+
+
+@pytest.mark.parametrize('cache_url, expected', [
+    ('sqlite:///instance/cache.db', 'memory://'),
+    ('memory://', 'memory://'),
+    (None, 'memory://'),
+    ('redis://cache:6379/0', 'redis://cache:6379/0'),
+])
+def test_buckets_default_to_redis_or_memory(cache_url, expected):
+    assert default_bucket_url(cache_url) == expected
+
+
+def test_sqlite_cache_does_not_put_buckets_in_sqlite(make_app, tmp_path):
+    make_app(RATELIMIT_ENABLED=True, CACHE_URL=f"sqlite:///{tmp_path / 'cache.db'}")
+    assert isinstance(limiter.store, MemoryBuckets)
+
+
+def test_sqlite_buckets_when_asked_for(make_app, tmp_path):
+    make_app(RATELIMIT_ENABLED=True, RATELIMIT_STORAGE_URL=f"sqlite:///{tmp_path / 'buckets.db'}")
+    assert isinstance(limiter.store, SQLiteBuckets)
+
+
+def test_single_threaded_worker_warns_that_in_flight_shedding_is_off(make_app, caplog):
+    app = make_app(RATELIMIT_ENABLED=True, SHED_MAX_IN_FLIGHT=16)
+    client = app.test_client()
+    with caplog.at_level(logging.WARNING, logger='booknest.ratelimit'):
+        client.get('/')
+        client.get('/')
+    warnings = [r for r in caplog.records if 'SHED_MAX_IN_FLIGHT' in r.getMessage()]
+    assert len(warnings) == 1
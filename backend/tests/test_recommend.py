@@ -0,0 +1,73 @@
+"""The recommendation matrix is built off the request path, and a worker's
+own writes are counted in as deltas until the next snapshot."""
+import threading
+import time
+
+from models import db, Book, Loan
+from recommend import MatrixSnapshot, Recommender, build_snapshot, recommender
+
+
+def add_books(app, n):
+    with app.app_context():
+        books = [Book(title=f'Book {i}', author='Author', genre='Fiction') for i in range(n)]
+        db.session.add_all(books)
+        db.session.commit()
+        return [book.id for book in books]
+
+
+def add_loans(app, pairs):
+    with app.app_context():
+        db.session.add_all([Loan(user_id=user_id, book_id=book_id) for user_id, book_id in pairs])
+        db.session.commit()
+
+
+def test_request_never_builds_the_matrix(app, client, make_user, monkeypatch):
+    _, headers = make_user('alice')
+    calls = []
+
+    def slow_rebuild(self, unless_built_since=None):
+        calls.append(threading.current_thread())
+        time.sleep(0.2)
+
+    monkeypatch.setattr(Recommender, 'rebuild', slow_rebuild)
+    response = client.get('/books/recommendations', headers=headers)
+    assert response.status_code == 200
+    deadline = time.monotonic() + 5
+    while not calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert calls and calls[0] is not threading.current_thread()
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / 'matrix.idx'
+    path.write_bytes(build_snapshot([(1, 10), (1, 11), (2, 10), (2, 12), (2, 11), (3, 13)]))
+    snapshot = MatrixSnapshot(str(path))
+    assert snapshot.basket(2) == [10, 12, 11]
+    assert snapshot.basket(9) == []
+    assert snapshot.popularity(10) == 2 and snapshot.popularity(13) == 1
+    assert dict(snapshot.neighbours(10)) == {11: 2, 12: 1}
+    assert dict(snapshot.neighbours(13)) == {}
+
+
+def test_deltas_apply_until_the_next_snapshot_includes_them(app, make_user):
+    alice, _ = make_user('alice')
+    bob, _ = make_user('bob')
+    first, second, third = add_books(app, 3)
+    add_loans(app, [(alice, first), (alice, second), (bob, first)])
+
+    with app.app_context():
+        recommender.rebuild()
+        assert recommender.recommend(bob, 5) == [(second, 1 / 2 ** 0.5)]
+
+        # Bob borrows the second book in this worker
+        add_loans(app, [(bob, second)])
+        recommender.record(bob, [second])
+        assert recommender.basket(bob) == [first, second]
+        with_deltas = recommender.deltas().scores([first])
+
+        time.sleep(0.01)
+        recommender.rebuild()
+        # The new snapshot counts the loan itself; the delta is dropped, not
+        # counted twice
+        assert recommender.deltas().pairs == {}
+        assert recommender.deltas().scores([first]) == with_deltas
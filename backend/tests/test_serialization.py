@@ -0,0 +1,25 @@
+"""NDJSON export lines format values the same way as the JSON endpoints."""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+import serialization
+from serialization import dumps_line
+
+ROW = {'id': 1, 'borrowed_at': datetime(2024, 3, 5, 14, 7, 9, 123456),
+       'due_date': date(2024, 3, 19), 'fine': Decimal('1.25')}
+
+
+@pytest.mark.parametrize('with_orjson', [True, False])
+def test_export_line_matches_json_response(app, monkeypatch, with_orjson):
+    with app.app_context():
+        expected = json.loads(app.json.dumps(ROW))
+    if not with_orjson:
+        monkeypatch.setattr(serialization, 'orjson', None)
+    line = dumps_line(ROW)
+
+    assert '\n' not in line
+    assert json.loads(line) == expected
+    assert expected['borrowed_at'] == 'Tue, 05 Mar 2024 14:07:09 GMT'
@@ -0,0 +1,86 @@
+"""PATCH /users/me validates like signup, checks for a taken username or
+email under the write lock, and changes the password only given the
+current one."""
+import pytest
+from sqlalchemy import event
+
+from hashing import hasher
+from models import db, User
+
+
+@pytest.mark.parametrize('payload', [
+    {'username': ''}, {'username': None}, {'email': ''}, {'email': None},
+])
+def test_rejects_empty_username_or_email(client, make_user, payload):
+    _, headers = make_user('alice')
+    response = client.patch('/users/me', json=payload, headers=headers)
+    assert response.status_code == 400
+
+
+def test_rejects_taken_username(client, make_user):
+    make_user('bob')
+    _, headers = make_user('alice')
+    response = client.patch('/users/me', json={'username': 'bob'}, headers=headers)
+    assert response.status_code == 409
+
+
+def test_updates_profile(app, client, make_user):
+    user_id, headers = make_user('alice')
+    response = client.patch('/users/me', json={'username': 'alicia', 'email': 'alicia@example.com'},
+                            headers=headers)
+    assert response.status_code == 200
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        assert (user.username, user.email) == ('alicia', 'alicia@example.com')
+
+
+def test_takes_write_lock_before_checking(app, client, make_user):
+    _, headers = make_user('alice')
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.patch('/users/me', json={'username': 'alicia'}, headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    assert response.status_code == 200
+    # The transaction that reads the user row began with the write lock
+    begins = [i for i, sql in enumerate(statements) if sql.startswith('BEGIN')]
+    first_user_read = next(i for i, sql in enumerate(statements)
+                           if sql.startswith('SELECT') and 'FROM user' in sql)
+    assert statements[max(i for i in begins if i < first_user_read)] == 'BEGIN IMMEDIATE'
+
+
+def set_password(app, user_id, password):
+    with app.app_context():
+        db.session.get(User, user_id).password_hash = hasher.hash(password)
+        db.session.commit()
+
+
+@pytest.mark.parametrize('payload, status', [
+    ({'password': 'new-secret'}, 400),
+    ({'password': 'new-secret', 'current_password': 'wrong'}, 403),
+])
+def test_password_change_needs_current_password(app, client, make_user, payload, status):
+    user_id, headers = make_user('alice')
+    set_password(app, user_id, 'old-secret')
+    response = client.patch('/users/me', json=payload, headers=headers)
+    assert response.status_code == status
+    with app.app_context():
+        assert hasher.check(db.session.get(User, user_id).password_hash, 'old-secret')
+
+
+def test_changes_password(app, client, make_user):
+    user_id, headers = make_user('alice')
+    set_password(app, user_id, 'old-secret')
+    response = client.patch('/users/me', json={'password': 'new-secret', 'current_password': 'old-secret'},
+                            headers=headers)
+    assert response.status_code == 200
+    response = client.post('/auth/login', json={'email': 'alice@example.com', 'password': 'new-secret'})
+    assert response.status_code == 200
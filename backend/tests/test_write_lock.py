@@ -0,0 +1,89 @@
+"""Write paths take the SQLite write lock before their first read, so two
+of them never both hold a read lock that neither can upgrade."""
+from contextlib import contextmanager
+
+from flask_bcrypt import Bcrypt
+from sqlalchemy import event
+
+from models import db, Book, ReadingList, User
+
+
+@contextmanager
+def recorded_statements(app):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def assert_locked_before_read(statements, table):
+    # The transaction that first reads `table` began with the write lock
+    first_read = next(i for i, sql in enumerate(statements)
+                      if sql.startswith('SELECT') and f'FROM {table}' in sql)
+    begins = [i for i, sql in enumerate(statements) if sql.startswith('BEGIN') and i < first_read]
+    assert begins and statements[begins[-1]] == 'BEGIN IMMEDIATE'
+
+
+def add_entry(app, user_id):
+    with app.app_context():
+        book = Book(title='Dune', author='Herbert', genre='Fiction')
+        db.session.add(book)
+        db.session.flush()
+        entry = ReadingList(user_id=user_id, book_id=book.id, note='')
+        db.session.add(entry)
+        db.session.commit()
+        return entry.id
+
+
+def test_reading_note_update_locks_first(app, client, make_user):
+    user_id, headers = make_user('alice')
+    entry_id = add_entry(app, user_id)
+    with recorded_statements(app) as statements:
+        response = client.patch(f'/reading-list/{entry_id}', json={'note': 'next'}, headers=headers)
+    assert response.status_code == 200
+    assert_locked_before_read(statements, 'reading_list')
+
+
+def test_reading_list_delete_locks_first(app, client, make_user):
+    user_id, headers = make_user('alice')
+    entry_id = add_entry(app, user_id)
+    with recorded_statements(app) as statements:
+        response = client.delete(f'/reading-list/{entry_id}', headers=headers)
+    assert response.status_code == 200
+    assert_locked_before_read(statements, 'reading_list')
+
+
+def test_admin_add_user_locks_first(app, client, make_user):
+    _, headers = make_user('root', is_admin=True)
+    # Load the admin cache first; it reads users on its own connection
+    client.get('/admin/users', headers=headers)
+    with recorded_statements(app) as statements:
+        response = client.post('/admin/users', json={
+            'username': 'bob', 'email': 'bob@example.com', 'password': 'secret'
+        }, headers=headers)
+    assert response.status_code == 201
+    assert_locked_before_read(statements, 'user')
+
+
+def test_login_rehash_locks_before_rereading(make_app):
+    app = make_app(BCRYPT_LOG_ROUNDS=5)
+    with app.app_context():
+        db.session.add(User(username='alice', email='alice@example.com', is_admin=False,
+                            password_hash=Bcrypt().generate_password_hash('secret', 4).decode()))
+        db.session.commit()
+    client = app.test_client()
+    with recorded_statements(app) as statements:
+        response = client.post('/auth/login', json={'email': 'alice@example.com', 'password': 'secret'})
+    assert response.status_code == 200
+    update = next(i for i, sql in enumerate(statements) if sql.startswith('UPDATE user'))
+    assert_locked_before_read(statements[statements.index('BEGIN IMMEDIATE'):update], 'user')
+    with app.app_context():
+        assert User.query.one().password_hash.startswith('$2b$05$')
@@ -0,0 +1,66 @@
+import { useCallback, useEffect, useRef, useState } from "react";
+
+// Rows per page in the UI; the backend allows up to 1000 (MAX_LIMIT in
+// backend/pagination.py)
+export const PAGE_SIZE = 50;
+
+// One page of a listing like /books/. The backend returns up to `limit`
+// items and puts the cursor for the next page in the X-Next-Cursor header.
+// Resolves to { res, items, nextCursor }; items is empty when res.ok is false.
+export async function fetchPage(url, { cursor = null, limit = PAGE_SIZE, ...options } = {}) {
+  const pageUrl = new URL(url, window.location.origin);
+  pageUrl.searchParams.set("limit", limit);
+  if (cursor) pageUrl.searchParams.set("cursor", cursor);
+  const res = await fetch(pageUrl, options);
+  if (!res.ok) return { res, items: [], nextCursor: null };
+  return { res, items: await res.json(), nextCursor: res.headers.get("X-Next-Cursor") };
+}
+
+// A cursor-paginated listing shown one page at a time: loads the first page
+// of `url`, and the next one on loadMore(). Starts over when `url` or
+// `token` changes; a page that arrives after that is dropped. `status` is
+// the last response's HTTP status (0 on a network error).
+export function usePagedList(url, token) {
+  const [items, setItems] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loading, setLoading] = useState(false);
+  const [status, setStatus] = useState(null);
+  const generation = useRef(0);
+
+  const load = useCallback(
+    async (cursor, current) => {
+      setLoading(true);
+      try {
+        const page = await fetchPage(url, {
+          cursor,
+          headers: { Authorization: `Bearer ${token}` },
+        });
+        if (current !== generation.current) return;
+        setStatus(page.res.status);
+        if (page.res.ok) {
+          setItems((prev) => (cursor ? [...prev, ...page.items] : page.items));
+          setNextCursor(page.nextCursor);
+        }
+      } catch (err) {
+        if (current === generation.current) setStatus(0);
+      } finally {
+        if (current === generation.current) setLoading(false);
+      }
+    },
+    [url, token]
+  );
+
+  useEffect(() => {
+    if (!token || !url) return;
+    const current = ++generation.current;
+    setItems([]);
+    setNextCursor(null);
+    load(null, current);
+  }, [url, token, load]);
+
+  const loadMore = useCallback(() => {
+    if (nextCursor && !loading) load(nextCursor, generation.current);
+  }, [nextCursor, loading, load]);
+
+  return { items, setItems, hasMore: Boolean(nextCursor), loading, status, loadMore };
+}
@@ -2,13 +2,17 @@ import { useEffect, useState } from "react";
 import { useAuth } from "../context/AuthContext";
 import { toast, ToastContainer } from "react-toastify";
 import "react-toastify/dist/ReactToastify.css";
+import { usePagedList } from "../api";
 
 const BASE_URL = import.meta.env.VITE_BACKEND_URL;
 
 function AdminDashboard() {
   const { token } = useAuth();
-  const [users, setUsers] = useState([]);
-  const [books, setBooks] = useState([]);
+  // Users and books one page at a time, with "Load more" for the next
+  const userList = usePagedList(`${BASE_URL}/admin/users`, token);
+  const bookList = usePagedList(`${BASE_URL}/admin/books`, token);
+  const { items: users, setItems: setUsers } = userList;
+  const { items: books, setItems: setBooks } = bookList;
   const [loans, setLoans] = useState([]);
   const [newUser, setNewUser] = useState({ username: "", email: "", password: "", is_admin: false });
   const [newBook, setNewBook] = useState({ title: "", author: "", genre: "" });
@@ -20,25 +24,22 @@ function AdminDashboard() {
     "Content-Type": "application/json",
   };
 
+  const listFailed = [userList.status, bookList.status].some(
+    (status) => status !== null && (status === 0 || status >= 400)
+  );
+  useEffect(() => {
+    if (listFailed) toast.error("Failed to load admin data.");
+  }, [listFailed]);
+
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const [userRes, bookRes, loanRes] = await Promise.all([
-          fetch(`${BASE_URL}/admin/users`, { headers }),
-          fetch(`${BASE_URL}/admin/books`, { headers }),
-          fetch(`${BASE_URL}/admin/loans`, { headers }),
-        ]);
-
-        if (!userRes.ok || !bookRes.ok || !loanRes.ok) {
+        const loanRes = await fetch(`${BASE_URL}/admin/loans`, { headers });
+        if (!loanRes.ok) {
           throw new Error("Failed to fetch admin data");
         }
 
-        const usersData = await userRes.json();
-        const booksData = await bookRes.json();
         const loansData = await loanRes.json();
-
-        setUsers(usersData.filter(Boolean));
-        setBooks(booksData.filter(Boolean));
         setLoans(loansData.filter(Boolean));
 
         toast.success("Admin data loaded.");
@@ -202,6 +203,11 @@ function AdminDashboard() {
             </li>
           ))}
         </ul>
+        {userList.hasMore && (
+          <button onClick={userList.loadMore} disabled={userList.loading} className="mt-2 text-indigo-600 hover:underline">
+            {userList.loading ? "Loading..." : "Load more users"}
+          </button>
+        )}
       </section>
 
       {/* BOOKS SECTION */}
@@ -238,6 +244,11 @@ function AdminDashboard() {
             </li>
           ))}
         </ul>
+        {bookList.hasMore && (
+          <button onClick={bookList.loadMore} disabled={bookList.loading} className="mt-2 text-indigo-600 hover:underline">
+            {bookList.loading ? "Loading..." : "Load more books"}
+          </button>
+        )}
       </section>
 
       {/* LOANS SECTION */}
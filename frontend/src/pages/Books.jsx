@@ -2,35 +2,40 @@ import { useEffect, useState } from "react";
 import { useAuth } from "../context/AuthContext";
 import { useNavigate } from "react-router-dom";
 import { toast } from "react-toastify";
+import { usePagedList } from "../api";
 
 const BASE_URL = import.meta.env.VITE_BACKEND_URL;
 
 function Books() {
-  const [books, setBooks] = useState([]);
   const [readingListIds, setReadingListIds] = useState([]);
   const [searchQuery, setSearchQuery] = useState("");
+  const [query, setQuery] = useState("");
   const { token, logout } = useAuth();
   const navigate = useNavigate();
 
-  // Fetch all books
+  // Search on the server once typing pauses, so every page is searched,
+  // not just the ones loaded so far
   useEffect(() => {
-    const fetchBooks = async () => {
-      try {
-        const res = await fetch(`${BASE_URL}/books/`, {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-        if (res.status === 401 || res.status === 403) {
-          logout();
-          navigate("/login");
-          return;
-        }
-        const data = await res.json();
-        if (res.ok) setBooks(data);
-      } catch (err) {
-        toast.error("Failed to fetch books.");
-      }
-    };
+    const timer = setTimeout(() => setQuery(searchQuery.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchQuery]);
+
+  const listUrl = query
+    ? `${BASE_URL}/books/search?q=${encodeURIComponent(query)}`
+    : `${BASE_URL}/books/`;
+  const { items: books, hasMore, loading, status, loadMore } = usePagedList(listUrl, token);
+
+  useEffect(() => {
+    if (status === 401 || status === 403) {
+      logout();
+      navigate("/login");
+    } else if (status === 0) {
+      toast.error("Failed to fetch books.");
+    }
+  }, [status, logout, navigate]);
 
+  // Fetch the reading list, to mark books already on it
+  useEffect(() => {
     const fetchReadingList = async () => {
       try {
         const res = await fetch(`${BASE_URL}/reading-list/`, {
@@ -51,10 +56,7 @@ function Books() {
       }
     };
 
-    if (token) {
-      fetchBooks();
-      fetchReadingList();
-    }
+    if (token) fetchReadingList();
   }, [token, logout, navigate]);
 
   const borrowBook = async (bookId) => {
@@ -98,15 +100,6 @@ function Books() {
     }
   };
 
-  const filteredBooks = books.filter((b) => {
-    const q = searchQuery.toLowerCase();
-    return (
-      b.title.toLowerCase().includes(q) ||
-      b.author.toLowerCase().includes(q) ||
-      b.genre.toLowerCase().includes(q)
-    );
-  });
-
   return (
     <div className="min-h-screen bg-gray-100 pt-6 pb-12">
       <div className="max-w-4xl mx-auto px-4">
@@ -120,11 +113,13 @@ function Books() {
           className="w-full p-3 mb-8 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-indigo-500"
         />
 
-        {filteredBooks.length === 0 ? (
-          <p className="text-center text-gray-600">No books match your search.</p>
+        {books.length === 0 ? (
+          <p className="text-center text-gray-600">
+            {loading ? "Loading books..." : "No books match your search."}
+          </p>
         ) : (
           <ul className="grid grid-cols-1 md:grid-cols-2 gap-6">
-            {filteredBooks.map((book) => {
+            {books.map((book) => {
               const alreadyAdded = readingListIds.includes(book.id);
               return (
                 <li
@@ -162,6 +157,18 @@ function Books() {
             })}
           </ul>
         )}
+
+        {hasMore && (
+          <div className="mt-8 text-center">
+            <button
+              onClick={loadMore}
+              disabled={loading}
+              className="bg-indigo-600 hover:bg-indigo-700 disabled:bg-gray-400 text-white px-6 py-2 rounded transition"
+            >
+              {loading ? "Loading..." : "Load more"}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -8,6 +8,7 @@ export default function UserProfile() {
 
   const [email, setEmail] = useState("");
   const [password, setPassword] = useState("");
+  const [currentPassword, setCurrentPassword] = useState("");
   const [success, setSuccess] = useState(null);
   const [error, setError] = useState(null);
 
@@ -18,7 +19,10 @@ export default function UserProfile() {
 
     const updates = {};
     if (email) updates.email = email;
-    if (password) updates.password = password;
+    if (password) {
+      updates.password = password;
+      updates.current_password = currentPassword;
+    }
 
     try {
       const res = await fetch(`${BASE_URL}/users/me`, {
@@ -39,6 +43,7 @@ export default function UserProfile() {
       setSuccess("Profile updated successfully!");
       setEmail("");
       setPassword("");
+      setCurrentPassword("");
     } catch (err) {
       setError(err.message);
     }
@@ -70,6 +75,16 @@ export default function UserProfile() {
           onChange={(e) => setPassword(e.target.value)}
           className="w-full px-4 py-2 border border-gray-300 rounded"
         />
+        {password && (
+          <input
+            type="password"
+            placeholder="Current password"
+            value={currentPassword}
+            onChange={(e) => setCurrentPassword(e.target.value)}
+            className="w-full px-4 py-2 border border-gray-300 rounded"
+            required
+          />
+        )}
 
         <button
           type="submit"